@@ -0,0 +1,28 @@
+"""
+Tests of the compact panel layout
+10-18-2026
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Wrappers'))
+
+from createXDataframeWrapper import createXDataFrame
+from compactPanelWrapper import expandPanel
+from syntheticWrdsWrapper import generateSyntheticWrdsData
+
+
+def test_expandedCompactBuildMatchesDefaultBuild():
+  rawDataframes = generateSyntheticWrdsData(nFirms=40, nYears=4)
+  xDataFrameArgs = {'identifyingColumns': ['PERMNO', 'GVKEY', 'conm', 'dlrsn', 'dldte'],
+                    'CRSP_COMPUSTAT_Identifying_features': ['GVKEY', 'conm', 'dlrsn', 'dldte']
+                    }
+
+  defaultXDataFrame = createXDataFrame(rawDataframes, **xDataFrameArgs)
+  expandedXDataFrame = expandPanel(createXDataFrame(rawDataframes, compactLayout=True, **xDataFrameArgs))
+
+  assert defaultXDataFrame['dldte'].notna().any()
+  pd.testing.assert_frame_equal(defaultXDataFrame.reset_index(drop=True), expandedXDataFrame.reset_index(drop=True))
@@ -0,0 +1,26 @@
+"""
+Tests of the X-Dataframe build
+10-18-2026
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Wrappers'))
+
+from createXDataframeWrapper import prepareCrspCompustatMergedData, prepareCrspMonthlyData, mergeCrspCompustatMergedWithCrspMonthly
+from syntheticWrdsWrapper import generateSyntheticWrdsData
+
+
+def test_asofMergeMatchesChainedMergeAtDefaultWindow():
+  rawDataframes = generateSyntheticWrdsData(nFirms=40, nYears=3)
+  CRSP_COMPUSTAT_MERGED = prepareCrspCompustatMergedData(rawDataframes[0])
+  CRSP_MONTHLY = prepareCrspMonthlyData(rawDataframes[1])
+
+  asofMerged = mergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, mergeMethod='asof')
+  chainedMerged = mergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, mergeMethod='chained')
+
+  assert asofMerged['atq'].notna().any()
+  pd.testing.assert_frame_equal(asofMerged.reset_index(drop=True), chainedMerged.reset_index(drop=True))
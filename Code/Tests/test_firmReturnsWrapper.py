@@ -0,0 +1,26 @@
+"""
+Tests of the per-firm adjusted prices and returns
+10-18-2026
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Wrappers'))
+
+from firmReturnsWrapper import calculateFirmReturns
+
+
+def test_negativePriceIsBidAskAverage():
+  firmReturns = calculateFirmReturns(pd.Series([1, 1, 1, 1]),
+                                     pd.Series(pd.period_range('2000-01', periods=4, freq='M')),
+                                     pd.Series([10., -11., 0., 12.]),
+                                     pd.Series([1., 1., 1., 1.])
+                                     )
+
+  # The Bid/Ask Average counts as a Price; only the Zero Price is filled
+  np.testing.assert_allclose(firmReturns['ADJPRC'], [10., 11., 11., 12.])
+  np.testing.assert_allclose(firmReturns['ADJRET'], [np.nan, 0.1, 0., 12/11 - 1])
@@ -0,0 +1,47 @@
+"""
+Tests of the partitioned X-Dataframe build
+10-18-2026
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Wrappers'))
+
+from createXDataframeWrapper import createXDataFrame
+from partitionedXDataframeWrapper import arrowCompatibleFrame
+from syntheticWrdsWrapper import generateSyntheticWrdsData
+
+
+def mixedSiccdRawDataframes():
+  """
+  Synthetic raw data whose CRSP Monthly SICCD mixes ints and strings, as
+  pd.read_csv reads it from the real extract
+  """
+  rawDataframes = generateSyntheticWrdsData(nFirms=60, nYears=3)
+  SICCD = rawDataframes[1]['SICCD'].astype(object)
+  numericSICCD = pd.to_numeric(SICCD, errors='coerce')
+  isInteger = numericSICCD.notna().to_numpy() & (pd.RangeIndex(len(SICCD)) % 2 == 0)
+  SICCD[isInteger] = numericSICCD[isInteger].astype(int)
+  rawDataframes[1]['SICCD'] = SICCD
+
+  return rawDataframes
+
+def test_arrowCompatibleFrameKeepsMissingValues():
+  frame = pd.DataFrame({'mixed': [1, '2', None], 'strings': ['A', None, 'B']})
+  compatibleFrame = arrowCompatibleFrame(frame)
+
+  assert compatibleFrame['mixed'].tolist()[:2] == ['1', '2']
+  assert compatibleFrame['mixed'].isna().tolist() == [False, False, True]
+  assert compatibleFrame['strings'].equals(frame['strings'])
+
+def test_processPoolBuildWithMixedTypeColumn():
+  rawDataframes = mixedSiccdRawDataframes()
+  assert pd.api.types.infer_dtype(rawDataframes[1]['SICCD'], skipna=True) in ['mixed', 'mixed-integer']
+
+  sequential = createXDataFrame(rawDataframes)
+  parallel = createXDataFrame(rawDataframes, nWorkers=2)
+
+  pd.testing.assert_frame_equal(sequential.reset_index(drop=True), parallel.reset_index(drop=True), check_dtype=False)
@@ -0,0 +1,49 @@
+"""
+Tests of the createXDataFrame stage cache
+10-18-2026
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Wrappers'))
+
+from createXDataframeWrapper import createXDataFrame, EXPLANATORY_VARIABLE_EXPRESSIONS
+from syntheticWrdsWrapper import generateSyntheticWrdsData
+
+
+# Identifying Columns available in the synthetic data
+X_DATAFRAME_ARGS = {'identifyingColumns': ['PERMNO', 'GVKEY', 'conm', 'dlrsn', 'dldte'],
+                    'CRSP_COMPUSTAT_Identifying_features': ['GVKEY', 'conm', 'dlrsn', 'dldte']
+                    }
+
+
+def cachedStageFiles(cacheDirectory, stageName):
+  """
+  Cache files of a stage
+  """
+  return sorted(name for name in os.listdir(cacheDirectory) if name.startswith(f'{stageName}-'))
+
+def test_expressionEditKeepsMergedStage(tmp_path, monkeypatch):
+  rawDataframes = generateSyntheticWrdsData(nFirms=30, nYears=3)
+  original = createXDataFrame(rawDataframes, cacheDirectory=str(tmp_path), **X_DATAFRAME_ARGS)
+  mergedFiles = cachedStageFiles(tmp_path, 'merged')
+
+  monkeypatch.setitem(EXPLANATORY_VARIABLE_EXPRESSIONS, 'NITA', 'niq / atq')
+  edited = createXDataFrame(rawDataframes, cacheDirectory=str(tmp_path), **X_DATAFRAME_ARGS)
+
+  assert cachedStageFiles(tmp_path, 'merged') == mergedFiles
+  assert len(cachedStageFiles(tmp_path, 'explanatoryVariables')) == 2
+  assert not original['NITA'].equals(edited['NITA'])
+
+def test_revisedRawDataframeMissesCache(tmp_path):
+  rawDataframes = generateSyntheticWrdsData(nFirms=30, nYears=3)
+  createXDataFrame(rawDataframes, cacheDirectory=str(tmp_path), **X_DATAFRAME_ARGS)
+
+  # A Restated Price deep inside the Extract, at the same Row Count
+  CRSP_MONTHLY = rawDataframes[1].copy()
+  CRSP_MONTHLY.loc[CRSP_MONTHLY.index[len(CRSP_MONTHLY)//2 + 1], 'PRC'] += 1
+  createXDataFrame([rawDataframes[0], CRSP_MONTHLY] + rawDataframes[2:], cacheDirectory=str(tmp_path), **X_DATAFRAME_ARGS)
+
+  assert len(cachedStageFiles(tmp_path, 'CRSP_MONTHLY')) == 2
+  assert len(cachedStageFiles(tmp_path, 'merged')) == 2
@@ -0,0 +1,214 @@
+"""
+Wrapper that joins Audit Analytics filing events onto the PERMNO/date_month
+panel as of each month: per filing type, the count of the firm's filings
+within trailing windows and the months since its latest filing
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import monthPeriodToOrdinal, firmMonthKey, FIRM_MONTH_KEY_STRIDE
+from stageInstrumentationWrapper import activateInstrumentation, instrumentStage, recordOutputRows, recordFilter
+
+
+# Trailing Windows (in months, including the panel month) over which
+# filings are counted
+AUDIT_EVENT_WINDOWS_MONTHS = [3, 12, 36]
+
+# Audit Analytics Columns: the filer's CIK, the filing date (a YYYYMMDD
+# number) and the filing type (e.g. the Chapter 7 or 11 of a bankruptcy)
+AUDIT_CIK_COLUMN = 'COMPANY_FKEY'
+AUDIT_FILE_DATE_COLUMN = 'FILE_DATE'
+AUDIT_EVENT_TYPE_COLUMN = 'BANKRUPTCY_TYPE'
+
+
+def auditFilingCountColumn(eventType, windowMonths):
+  """
+  Name of the column counting filings of a type within a trailing window
+  """
+  return f'auditFilings{eventType}Within{windowMonths}Months'
+
+def auditFilingRecencyColumn(eventType):
+  """
+  Name of the column of months since the latest filing of a type
+  """
+  return f'monthsSinceAuditFiling{eventType}'
+
+def parseFileDates(FILE_DATE):
+  """
+  Parse filing dates given as YYYYMMDD numbers (e.g. 20190919.0, as Audit
+  Analytics exports them) or strings, vectorially; dates already parsed are
+  kept and unreadable ones are missing
+  """
+  if pd.api.types.is_datetime64_any_dtype(FILE_DATE.dtype):
+    return FILE_DATE
+
+  dateNumber = pd.to_numeric(FILE_DATE, errors='coerce')
+
+  # Day Offsets from the Month Starts (Invalid Months or Days are missing)
+  number = np.nan_to_num(dateNumber.to_numpy(dtype=np.float64)).astype(np.int64)
+  year, month, day = number // 10000, number // 100 % 100, number % 100
+  monthStart = ((year - 1970)*12 + month - 1).astype('datetime64[M]')
+  dates = monthStart.astype('datetime64[ns]') + (day - 1).astype('timedelta64[D]')
+  isValid = dateNumber.notna().to_numpy() & (month >= 1) & (month <= 12) & (day >= 1) & (dates < (monthStart + 1).astype('datetime64[ns]'))
+  fileDates = pd.Series(np.where(isValid, dates, np.datetime64('NaT')), index=FILE_DATE.index)
+
+  # Other Formats (e.g. 'YYYY-MM-DD')
+  isOtherFormat = (dateNumber.isna() & FILE_DATE.notna()).to_numpy()
+  if isOtherFormat.any():
+    fileDates[isOtherFormat] = pd.to_datetime(FILE_DATE[isOtherFormat], errors='coerce')
+
+  return fileDates
+
+def cikToInteger(cik):
+  """
+  Integer CIKs (float64, missing NaN) of CIKs given as numbers, zero-padded
+  strings or categoricals of either (converting only the categories)
+  """
+  if isinstance(cik.dtype, pd.CategoricalDtype):
+    categories = pd.to_numeric(pd.Series(cik.cat.categories), errors='coerce').to_numpy(dtype=np.float64)
+    codes = cik.cat.codes.to_numpy()
+    return np.where(codes >= 0, categories[codes], np.nan)
+  return pd.to_numeric(cik, errors='coerce').to_numpy(dtype=np.float64)
+
+def prepareAuditAnalyticsData(AUDIT_ANALYTICS, eventTypeColumn=AUDIT_EVENT_TYPE_COLUMN, eventTypes=None):
+  """
+  Prepare Audit Analytics filings for joining onto the panel: parse the
+  filing dates, key the filings by integer CIK and month, keep the filings
+  of eventTypes (all types by default) and drop filings repeated on the same
+  day.
+
+  Returns a Dataframe of CIK, fileMonth (month ordinals), FILE_DATE and
+  eventType (a single type 'Any' without an eventTypeColumn).
+  """
+  events = pd.DataFrame({'CIK': cikToInteger(AUDIT_ANALYTICS[AUDIT_CIK_COLUMN]),
+                         'FILE_DATE': parseFileDates(AUDIT_ANALYTICS[AUDIT_FILE_DATE_COLUMN]).to_numpy(),
+                         'eventType': 'Any' if eventTypeColumn is None else AUDIT_ANALYTICS[eventTypeColumn].to_numpy()
+                         })
+
+  # Drop Filings without a CIK or a (readable) Filing Date
+  rowsBefore = len(events)
+  events = events.dropna(subset=['CIK', 'FILE_DATE'])
+  recordFilter('missing CIK or FILE_DATE', rowsBefore, len(events))
+
+  # Keep only desired Filing Types
+  if eventTypes is not None:
+    rowsBefore = len(events)
+    events = events[events['eventType'].isin(eventTypes)]
+    recordFilter('eventType', rowsBefore, len(events))
+
+  rowsBefore = len(events)
+  events = events.drop_duplicates(subset=['CIK', 'FILE_DATE', 'eventType'])
+  recordFilter('duplicate filings', rowsBefore, len(events))
+
+  events['CIK'] = events['CIK'].astype(np.int64)
+  events['fileMonth'] = monthPeriodToOrdinal(events['FILE_DATE'].dt.to_period('m'))
+
+  return events[['CIK', 'fileMonth', 'FILE_DATE', 'eventType']].reset_index(drop=True)
+
+def auditEventFeatures(CIK, DATE_MONTH, eventCik, eventMonth, windowsMonths=AUDIT_EVENT_WINDOWS_MONTHS):
+  """
+  As-of features of one filing type for every panel row: the count of the
+  row's firm's filings within each trailing window of windowsMonths months
+  (the panel month and the windowMonths - 1 months before it) and the
+  months since its latest filing up to the panel month.
+
+  Filings are sorted once by (CIK, month) and every panel row finds its
+  window bounds by binary search, so memory grows with the rows and filings
+  rather than their product. Counts are 0 and recencies missing for firms
+  without filings; both are missing for rows without a CIK or month.
+
+  Returns a list of count arrays (one per window) and the recency array.
+  """
+  cik = np.asarray(CIK, dtype=np.float64)
+  month = monthPeriodToOrdinal(DATE_MONTH)
+  isKnown = ~np.isnan(cik) & (month != np.iinfo(np.int64).min)
+
+  # Sorted (CIK, Month) Keys of the Filings
+  # (CIKs take the place of PERMNOs in the key; 10-digit CIKs still fit)
+  eventKey = np.sort(firmMonthKey(np.asarray(eventCik, dtype=np.int64), np.asarray(eventMonth, dtype=np.int64)))
+
+  rowCik = np.where(isKnown, cik, 0).astype(np.int64)
+  rowMonth = np.where(isKnown, month, 0)
+  rowKey = firmMonthKey(rowCik, rowMonth)
+
+  # Filings up to the Panel Month
+  upToMonth = np.searchsorted(eventKey, rowKey, side='right')
+
+  counts = []
+  for windowMonths in windowsMonths:
+    windowCount = (upToMonth - np.searchsorted(eventKey, firmMonthKey(rowCik, rowMonth - windowMonths), side='right')).astype(np.float64)
+    windowCount[~isKnown] = np.nan
+    counts.append(windowCount)
+
+  # Latest Filing up to the Panel Month (if of the Row's Firm)
+  latestKey = eventKey[np.maximum(upToMonth - 1, 0)] if len(eventKey) else np.zeros(len(rowKey), dtype=np.int64)
+  hasFiling = isKnown & (upToMonth > 0) & (latestKey // FIRM_MONTH_KEY_STRIDE == rowCik)
+  recency = np.full(len(rowKey), np.nan)
+  recency[hasFiling] = (rowKey - latestKey)[hasFiling]
+
+  return counts, recency
+
+def mergeExplanatoryDataframeWithAuditAnalytics(explanatoryDataFrame,
+                                                AUDIT_ANALYTICS_EVENTS,
+                                                windowsMonths=AUDIT_EVENT_WINDOWS_MONTHS,
+                                                cikColumn='cik',
+                                                compactLayout=None
+                                                ):
+  """
+  Add the as-of features of prepared Audit Analytics filings (see
+  prepareAuditAnalyticsData) to a PERMNO/date_month panel keyed by its
+  cikColumn: per filing type, the counts of filings within the trailing
+  windowsMonths (see auditFilingCountColumn) and the months since the
+  latest filing (see auditFilingRecencyColumn). Firms sharing a CIK share
+  its filings.
+
+  compactLayout (by default, whether the panel's date_month is in the
+  compact layout, see compactPanelWrapper) stores the features as float32.
+  """
+  explanatoryDataFrame = explanatoryDataFrame.copy()
+  if compactLayout is None:
+    compactLayout = pd.api.types.is_integer_dtype(explanatoryDataFrame['date_month'].dtype)
+  floatDtype = np.float32 if compactLayout else np.float64
+
+  cik = cikToInteger(explanatoryDataFrame[cikColumn])
+  for eventType, typeEvents in AUDIT_ANALYTICS_EVENTS.groupby('eventType', sort=True):
+    counts, recency = auditEventFeatures(cik,
+                                         explanatoryDataFrame['date_month'],
+                                         typeEvents['CIK'].to_numpy(),
+                                         typeEvents['fileMonth'].to_numpy(),
+                                         windowsMonths
+                                         )
+    for windowMonths, windowCount in zip(windowsMonths, counts):
+      explanatoryDataFrame[auditFilingCountColumn(eventType, windowMonths)] = windowCount.astype(floatDtype)
+    explanatoryDataFrame[auditFilingRecencyColumn(eventType)] = recency.astype(floatDtype)
+
+  return explanatoryDataFrame
+
+def addAuditAnalyticsFeatures(explanatoryDataFrame,
+                              AUDIT_ANALYTICS,
+                              eventTypeColumn=AUDIT_EVENT_TYPE_COLUMN,
+                              eventTypes=None,
+                              windowsMonths=AUDIT_EVENT_WINDOWS_MONTHS,
+                              cikColumn='cik',
+                              compactLayout=None,
+                              instrumentation=None
+                              ):
+  """
+  Join a raw Audit Analytics extract (e.g. AUDIT_ANALYTICS.csv) onto an
+  X-Dataframe (which carries 'cik' in its default identifyingColumns): see
+  prepareAuditAnalyticsData and mergeExplanatoryDataframeWithAuditAnalytics.
+  Both are recorded as stages of an instrumentation (see
+  stageInstrumentationWrapper).
+  """
+  with activateInstrumentation(instrumentation):
+    with instrumentStage('prepareAuditAnalyticsData', len(AUDIT_ANALYTICS)) as stage:
+      AUDIT_ANALYTICS_EVENTS = prepareAuditAnalyticsData(AUDIT_ANALYTICS, eventTypeColumn, eventTypes)
+      recordOutputRows(stage, AUDIT_ANALYTICS_EVENTS)
+
+    with instrumentStage('mergeExplanatoryDataframeWithAuditAnalytics', len(explanatoryDataFrame)) as stage:
+      explanatoryDataFrame = mergeExplanatoryDataframeWithAuditAnalytics(explanatoryDataFrame, AUDIT_ANALYTICS_EVENTS, windowsMonths, cikColumn, compactLayout)
+      recordOutputRows(stage, explanatoryDataFrame)
+
+  return explanatoryDataFrame
@@ -4,9 +4,26 @@ Wrapper that Formats Bloomberg Bankruptcy Data
 """
 
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import re
 
 
+# Markers splitting each raw Bloomberg field, and the piece holding the
+# value: the text before the first ' US Equity', and the text between the
+# first 'Filing Type: ' / 'Name: ' marker and the next one (as re.split in
+# the row-wise extract functions below). A field without its marker has no
+# value.
+BLOOMBERG_FIELD_MARKERS = {'companyID': (' US Equity', 0),
+                           'filingType': ('Filing Type: ', 1),
+                           'companyName': ('Name: ', 1)
+                           }
+
+# Bloomberg export column names and the names formatBloombergBankruptcyData expects
+BLOOMBERG_COLUMN_NAMES = {'Summary1': 'companyName', 'Summary': 'filingType'}
+
+
 def companyIDExtract(securityID):
   """
   Extract Company ID from Security ID Field
@@ -40,32 +57,73 @@ def companyNameExtract(companyName):
   companyName = re.split("Name: ", companyName)[1]
   return companyName
 
-def formatBloombergBankruptcyData(bloombergBankruptcyData, filterPublicCompanies=False):
+def bloombergStringArray(field):
+  """
+  Convert a pandas Series to an Arrow string array (missing values as nulls)
+  """
+  try:
+    return pa.array(field.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+  except (pa.ArrowInvalid, pa.ArrowTypeError):
+    return pa.array(field.where(field.isna(), field.astype(str)).to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+
+def extractBloombergField(field, fieldName):
+  """
+  Extract a field from a raw Bloomberg column by splitting the whole column
+  on its marker (see BLOOMBERG_FIELD_MARKERS) with Arrow string kernels.
+  Rows without the marker are null.
+  """
+  marker, piece = BLOOMBERG_FIELD_MARKERS[fieldName]
+  pieces = pc.split_pattern(bloombergStringArray(field), marker, max_splits=piece + 1)
+
+  # Pad Rows with too few Pieces so every Row has the Piece
+  hasPiece = pc.greater(pc.list_value_length(pieces), piece)
+  pieces = pc.if_else(hasPiece, pieces, pa.scalar([None]*(piece + 1), type=pieces.type))
+
+  return pc.list_element(pieces, piece)
+
+def formatBloombergBankruptcyData(bloombergBankruptcyData, filterPublicCompanies=False, upperCaseCompanyName=False):
   """
   Format Bloomberg Bankruptcy Data.
 
+  Fields are parsed over whole columns with Arrow string kernels. Rows that
+  cannot be parsed (missing Security ID, no 'Filing Type: ' or 'Name: '
+  marker, empty Company ID or unreadable dates) get nulls in those fields,
+  are not public (isPublic 0) and are flagged by isMalformed, instead of
+  raising. upperCaseCompanyName upper-cases companyName.
+
   Returns formatted Bloomberg Bankruptcy Data Pandas Dataframe
   """
   # Copy Dataframe so as not to alter original
   bloombergBankruptcyDataCopy = bloombergBankruptcyData.copy()
 
   # Extract Company ID
-  bloombergBankruptcyDataCopy['companyID'] = bloombergBankruptcyDataCopy['Security ID'].map(companyIDExtract)
+  companyID = extractBloombergField(bloombergBankruptcyDataCopy['Security ID'], 'companyID')
+  companyID = pc.if_else(pc.equal(pc.utf8_length(companyID), 0), pa.scalar(None, pa.string()), companyID)
 
-  # Determine Whether Company is Public or Private
-  bloombergBankruptcyDataCopy['isPublic'] = bloombergBankruptcyDataCopy['companyID'].map(publicCompanyIdentify)
+  # Determine Whether Company is Public or Private (Company ID begins with a letter)
+  isPublic = pc.fill_null(pc.match_substring_regex(companyID, '^[a-zA-Z]'), False)
 
   # Extract Filing Type
-  bloombergBankruptcyDataCopy['filingType'] = bloombergBankruptcyDataCopy['filingType'].map(filingTypeExtract)
+  filingType = extractBloombergField(bloombergBankruptcyDataCopy['filingType'], 'filingType')
 
   # Extract Company Name
-  bloombergBankruptcyDataCopy['companyName'] = bloombergBankruptcyDataCopy['companyName'].map(companyNameExtract)
+  companyName = extractBloombergField(bloombergBankruptcyDataCopy['companyName'], 'companyName')
+  if upperCaseCompanyName:
+    companyName = pc.utf8_upper(companyName)
+
+  for fieldName, field in [('companyID', companyID), ('filingType', filingType), ('companyName', companyName)]:
+    bloombergBankruptcyDataCopy[fieldName] = field.to_numpy(zero_copy_only=False)
+  bloombergBankruptcyDataCopy['isPublic'] = isPublic.to_numpy(zero_copy_only=False).astype(np.int64)
 
-  # Convert Announce/Declared Date to a pandas datetime object
-  bloombergBankruptcyDataCopy['Announce/Declared Date'] = pd.to_datetime(bloombergBankruptcyDataCopy['Announce/Declared Date'])
+  # Flag Rows that could not be Parsed
+  isMalformed = pc.or_(pc.or_(pc.is_null(companyID), pc.is_null(filingType)), pc.is_null(companyName)).to_numpy(zero_copy_only=False)
 
-  # Convert Effective Date to a pandas datetime object
-  bloombergBankruptcyDataCopy['Effective Date'] = pd.to_datetime(bloombergBankruptcyDataCopy['Effective Date'])
+  # Convert Announce/Declared Date and Effective Date to pandas datetime objects
+  for dateColumn in ['Announce/Declared Date', 'Effective Date']:
+    dates = bloombergBankruptcyDataCopy[dateColumn]
+    bloombergBankruptcyDataCopy[dateColumn] = pd.to_datetime(dates, errors='coerce')
+    isMalformed |= (bloombergBankruptcyDataCopy[dateColumn].isna() & dates.notna()).to_numpy()
+  bloombergBankruptcyDataCopy['isMalformed'] = isMalformed
 
   # Filter only Public Companies
   if filterPublicCompanies:
@@ -77,9 +135,23 @@ def formatBloombergBankruptcyData(bloombergBankruptcyData, filterPublicCompanies
                                       'Announce/Declared Date',
                                       'Effective Date',
                                       'filingType',
-                                      'isPublic'
+                                      'isPublic',
+                                      'isMalformed'
                                       ]]
 
+def iterateBloombergBankruptcyFile(csvPath, chunksize=1000000, filterPublicCompanies=False, upperCaseCompanyName=False, columnNames=BLOOMBERG_COLUMN_NAMES):
+  """
+  Stream a Bloomberg export (CSV) in chunks of chunksize rows, renaming
+  columns by columnNames and yielding each chunk formatted by
+  formatBloombergBankruptcyData
+  """
+  for chunk in pd.read_csv(csvPath, dtype=str, chunksize=chunksize):
+    yield formatBloombergBankruptcyData(chunk.rename(columns=columnNames), filterPublicCompanies, upperCaseCompanyName)
 
-
-
+def readBloombergBankruptcyFile(csvPath, chunksize=1000000, filterPublicCompanies=False, upperCaseCompanyName=False, columnNames=BLOOMBERG_COLUMN_NAMES):
+  """
+  Read and format a Bloomberg export (CSV) chunk by chunk (see
+  iterateBloombergBankruptcyFile), so the raw text of only one chunk is held
+  at a time
+  """
+  return pd.concat(iterateBloombergBankruptcyFile(csvPath, chunksize, filterPublicCompanies, upperCaseCompanyName, columnNames), ignore_index=True)
@@ -0,0 +1,119 @@
+"""
+Wrapper that converts PERMNO/month panels to and from a compact memory
+layout: int32 month ordinals, categorical identifiers and downcast floats
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import monthPeriodToOrdinal, monthOrdinalToPeriod, MISSING_MONTH_ORDINAL
+
+
+# Month Columns (Periods in the default layout, int32 month ordinals in the
+# compact one), besides every 'Date_Lag<N>' column
+MONTH_COLUMNS = ['date_month', 'dldte_month', 'QuarterStart_Month', 'QuarterEnd_Month', 'eventMonth']
+MONTH_COLUMN_PREFIXES = ['Date_Lag']
+
+# Identifier Columns stored as Categoricals in the compact layout
+CATEGORICAL_COLUMNS = ['GVKEY', 'conm', 'cik', 'COMNAM', 'TICKER']
+
+# Date Columns stored as datetime64 (instead of strings) in the compact layout,
+# and their string format in the default layout (as WRDS exports them)
+DATE_COLUMNS = ['dldte']
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def isMonthColumn(column):
+  """
+  Whether a column name holds months (see MONTH_COLUMNS)
+  """
+  return column in MONTH_COLUMNS or any(str(column).startswith(prefix) for prefix in MONTH_COLUMN_PREFIXES)
+
+def toCompactMonths(months):
+  """
+  Convert Month Periods, datetimes or month ordinals to int32 month ordinals
+  (months since 1970-01), missing months as MISSING_MONTH_ORDINAL
+  """
+  if pd.api.types.is_datetime64_any_dtype(getattr(months, 'dtype', None)):
+    months = pd.Series(months).dt.to_period('m')
+  monthOrdinals = monthPeriodToOrdinal(months)
+  return np.where(monthOrdinals == np.iinfo(np.int64).min, MISSING_MONTH_ORDINAL, monthOrdinals).astype(np.int32)
+
+def fromCompactMonths(monthOrdinals):
+  """
+  Convert int32 month ordinals back to Month Periods (missing as NaT)
+  """
+  return monthOrdinalToPeriod(monthPeriodToOrdinal(np.asarray(monthOrdinals)))
+
+def compactPanel(panel, floatColumns=[], floatDtype=np.float32, categoricalColumns=CATEGORICAL_COLUMNS):
+  """
+  Convert a panel to the compact layout, column by column in place:
+
+    - monthly Period columns become int32 month ordinals
+    - categoricalColumns become categoricals
+    - DATE_COLUMNS held as strings become datetime64
+    - int64 columns whose values fit (e.g. PERMNO) become int32
+    - floatColumns become floatDtype
+
+  Every month-keyed function (monthPeriodToOrdinal and what is built on it:
+  the as-of merge, firm returns, decayed averages, labels) accepts the
+  compact columns as they are. Returns the panel.
+  """
+  for column in panel.columns:
+    values = panel[column]
+    if values.dtype == pd.PeriodDtype('M'):
+      panel[column] = toCompactMonths(values)
+    elif column in categoricalColumns:
+      if not isinstance(values.dtype, pd.CategoricalDtype):
+        panel[column] = values.astype('category')
+    elif column in DATE_COLUMNS and values.dtype == object:
+      panel[column] = pd.to_datetime(values)
+    elif column in floatColumns:
+      panel[column] = values.astype(floatDtype)
+    elif values.dtype == np.int64 and len(values) and np.iinfo(np.int32).min < values.min() and values.max() <= np.iinfo(np.int32).max:
+      panel[column] = values.astype(np.int32)
+
+  return panel
+
+def concatPanels(panels):
+  """
+  Concatenate panels (as pd.concat with ignore_index), keeping columns that
+  are categorical in every panel categorical over the union of their
+  categories, where pd.concat would fall back to objects
+  """
+  panels = list(panels)
+  if not panels:
+    return pd.DataFrame()
+
+  categoricalColumns = [column for column in panels[0].columns
+                        if all(column in panel.columns and isinstance(panel[column].dtype, pd.CategoricalDtype) for panel in panels)
+                        ]
+  for column in categoricalColumns:
+    categories = pd.api.types.union_categoricals([panel[column] for panel in panels], sort_categories=True).categories
+    panels = [panel.assign(**{column: panel[column].cat.set_categories(categories)}) for panel in panels]
+
+  return pd.concat(panels, ignore_index=True)
+
+def expandPanel(panel):
+  """
+  Convert a compact panel back to the default layout: month columns (see
+  isMonthColumn) to Month Periods, categoricals to arrays of their values
+  (objects for strings), DATE_COLUMNS to DATE_FORMAT strings (missing dates
+  NaN), int32 columns to int64 and float32 columns to float64. Returns the
+  panel, converted in place.
+  """
+  for column in panel.columns:
+    values = panel[column]
+    if isMonthColumn(column) and pd.api.types.is_integer_dtype(values.dtype):
+      panel[column] = fromCompactMonths(values)
+    elif isinstance(values.dtype, pd.CategoricalDtype):
+      panel[column] = values.to_numpy()
+    elif column in DATE_COLUMNS and pd.api.types.is_datetime64_any_dtype(values.dtype):
+      panel[column] = values.dt.strftime(DATE_FORMAT).where(values.notna(), np.nan)
+    elif values.dtype == np.int32:
+      panel[column] = values.astype(np.int64)
+    elif values.dtype == np.float32:
+      panel[column] = values.astype(np.float64)
+
+  return panel
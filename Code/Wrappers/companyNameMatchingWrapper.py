@@ -0,0 +1,225 @@
+"""
+Wrapper that matches Bloomberg Bankruptcy records to firms of the X panel by
+company name, through a character n-gram index over the panel's names
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import monthPeriodToOrdinal
+
+
+# Words dropped from company names before matching (corporate suffixes and
+# the Compustat/CRSP state and vintage tags, e.g. 'ACME CORP/DE', '-OLD')
+COMPANY_NAME_STOP_WORDS = ['THE', 'INC', 'INCORPORATED', 'CORP', 'CORPORATION', 'CO', 'COS', 'COMPANY', 'COMPANIES',
+                           'LTD', 'LIMITED', 'LLC', 'LP', 'PLC', 'HOLDING', 'HOLDINGS', 'HLDGS', 'HLDG',
+                           'GROUP', 'GRP', 'DE', 'DEL', 'NEW', 'OLD'
+                           ]
+COMPANY_NAME_STOP_WORD_PATTERN = r'\b(?:' + '|'.join(COMPANY_NAME_STOP_WORDS) + r')\b'
+
+# Normalized names are truncated to this many characters before indexing
+COMPANY_NAME_MAX_LENGTH = 64
+
+
+def normalizeCompanyNames(companyNames):
+  """
+  Normalize company names for matching: upper-case, '&' as 'AND', only
+  letters, digits and single spaces, and no corporate suffixes (see
+  COMPANY_NAME_STOP_WORDS). Each distinct name is normalized once.
+  """
+  names = pd.Series(pd.unique(companyNames.dropna().astype(str)), dtype=object)
+  normalizedNames = (names.str.upper()
+                          .str.replace('&', ' AND ', regex=False)
+                          .str.replace(r'[^A-Z0-9]+', ' ', regex=True)
+                          .str.replace(COMPANY_NAME_STOP_WORD_PATTERN, ' ', regex=True)
+                          .str.replace(r'\s+', ' ', regex=True)
+                          .str.strip()
+                          )
+
+  return companyNames.map(pd.Series(normalizedNames.to_numpy(), index=names.to_numpy()))
+
+def companyNameTrigrams(normalizedNames):
+  """
+  Set of character trigrams of each name (padded with one space on either
+  side so word starts and ends count), as sorted (name index, trigram)
+  pairs. Trigrams are coded as 3-byte integers.
+  """
+  paddedNames = (' ' + pd.Series(normalizedNames, dtype=object).str.slice(0, COMPANY_NAME_MAX_LENGTH) + ' ').to_numpy(dtype='S')
+  width = max(paddedNames.dtype.itemsize, 3)
+  characters = paddedNames.astype(f'S{width}').view(np.uint8).reshape(len(paddedNames), width).astype(np.int64)
+  lengths = np.char.str_len(paddedNames)
+
+  # Every Trigram of every Name
+  trigrams = (characters[:, :-2] << 16) | (characters[:, 1:-1] << 8) | characters[:, 2:]
+  isTrigram = np.arange(width - 2)[None, :] <= (lengths - 3)[:, None]
+  nameIndex = np.broadcast_to(np.arange(len(paddedNames))[:, None], trigrams.shape)[isTrigram]
+
+  # Unique per Name
+  nameTrigramKey = np.unique((nameIndex.astype(np.int64) << 24) | trigrams[isTrigram])
+
+  return nameTrigramKey >> 24, nameTrigramKey & (2**24 - 1)
+
+def rarestTrigramPrefix(name, trigram, nameSize, trigramRarity, minScore):
+  """
+  Mask of the trigrams in each name's prefix: its |A| - o + 1 rarest
+  trigrams (by trigramRarity), where o = minScore*|A| / (2 - minScore) is
+  the fewest trigrams a name of size |A| shares with any name it reaches a
+  Dice similarity of minScore with
+  """
+  minOverlap = np.maximum(np.ceil(minScore*nameSize/(2 - minScore) - 1e-9).astype(np.int64), 1)
+  rarityOrder = np.lexsort((trigramRarity, name))
+  positionInName = np.arange(len(name)) - np.repeat(np.cumsum(nameSize) - nameSize, nameSize)
+  isPrefix = np.empty(len(name), dtype=bool)
+  isPrefix[rarityOrder] = positionInName < (nameSize - minOverlap + 1)[name[rarityOrder]]
+
+  return isPrefix
+
+def matchCompanyNames(queryNames, indexNames, minScore=0.8, maxProbes=2**22):
+  """
+  All (query, index) pairs of normalized names whose trigram sets have a
+  Dice similarity 2|A&B| / (|A| + |B|) of at least minScore, with the score.
+
+  Trigrams are ordered from rarest to most common among the index names. A
+  pair reaching minScore shares a trigram within both names' prefixes of
+  rarest trigrams (see rarestTrigramPrefix), and |B| lies within
+  minScore/(2 - minScore) and (2 - minScore)/minScore of |A|, so only the
+  index names' prefixes are inverted into posting lists (by trigram, then
+  size), each query probes them with its own prefix within the size bounds,
+  and only those candidates are scored (prefix filtering). No pair reaching
+  minScore is missed and the all-pairs comparison is never made. Queries are
+  probed in batches of about maxProbes postings to bound memory.
+
+  Returns (query index, index name index, score) arrays.
+  """
+  queryName, queryTrigram = companyNameTrigrams(queryNames)
+  indexName, indexTrigram = companyNameTrigrams(indexNames)
+  querySize = np.bincount(queryName, minlength=len(queryNames))
+  indexSize = np.bincount(indexName, minlength=len(indexNames))
+  if len(indexTrigram) == 0 or len(queryTrigram) == 0:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+  # Global Trigram Order (Rarest among Index Names first, ties by Trigram)
+  trigrams, trigramFrequency = np.unique(indexTrigram, return_counts=True)
+  position = np.minimum(np.searchsorted(trigrams, queryTrigram), len(trigrams) - 1)
+  queryRarity = (np.where(trigrams[position] == queryTrigram, trigramFrequency[position], 0) << 24) | queryTrigram
+  indexRarity = (trigramFrequency[np.searchsorted(trigrams, indexTrigram)] << 24) | indexTrigram
+
+  # Inverted Index of Index Name Prefixes (by Trigram, then Size)
+  isIndexPrefix = rarestTrigramPrefix(indexName, indexTrigram, indexSize, indexRarity, minScore)
+  postingOrder = np.lexsort((indexName[isIndexPrefix], indexSize[indexName[isIndexPrefix]], indexTrigram[isIndexPrefix]))
+  postingName = indexName[isIndexPrefix][postingOrder]
+  postingKey = (indexTrigram[isIndexPrefix][postingOrder] << 8) | indexSize[postingName]
+
+  # Probe with Query Prefixes, only Index Names of a Size that can reach minScore
+  isPrefix = rarestTrigramPrefix(queryName, queryTrigram, querySize, queryRarity, minScore)
+  minIndexSize = np.ceil(minScore*querySize/(2 - minScore) - 1e-9).astype(np.int64)
+  maxIndexSize = np.floor((2 - minScore)*querySize/max(minScore, 1e-9) + 1e-9).astype(np.int64)
+  postingStart = np.searchsorted(postingKey, (queryTrigram << 8) | np.clip(minIndexSize[queryName], 0, 255), side='left')
+  postingCount = np.searchsorted(postingKey, (queryTrigram << 8) | np.clip(maxIndexSize[queryName], 0, 255), side='right') - postingStart
+
+  # Probe Queries in Batches of about maxProbes Postings
+  probeCount = np.where(isPrefix, postingCount, 0)
+  queryProbes = np.bincount(queryName, weights=probeCount, minlength=len(queryNames))
+  queryBatch = (np.cumsum(queryProbes) - queryProbes) // maxProbes
+  queryStart = np.cumsum(querySize) - querySize
+  indexKey = (indexName << 24) | indexTrigram
+
+  matches = []
+  for batch in np.unique(queryBatch):
+    isBatch = (queryBatch == batch)[queryName] & isPrefix
+
+    # Candidate Pairs from the Prefix Postings
+    probeStart = postingStart[isBatch]
+    batchProbeCount = postingCount[isBatch]
+    probeQuery = np.repeat(queryName[isBatch], batchProbeCount)
+    probePosting = np.repeat(probeStart - (np.cumsum(batchProbeCount) - batchProbeCount), batchProbeCount) + np.arange(batchProbeCount.sum())
+    candidateKey = np.unique(probeQuery*len(indexNames) + postingName[probePosting])
+    candidateQuery = candidateKey // len(indexNames)
+    candidateIndex = candidateKey % len(indexNames)
+
+    # Score Candidates (Shared Trigrams by Lookup of every Query Trigram)
+    pairRepeat = querySize[candidateQuery]
+    pairIndex = np.repeat(np.arange(len(candidateKey)), pairRepeat)
+    pairTrigram = queryTrigram[np.repeat(queryStart[candidateQuery] - (np.cumsum(pairRepeat) - pairRepeat), pairRepeat) + np.arange(pairRepeat.sum())]
+    lookupKey = (candidateIndex[pairIndex] << 24) | pairTrigram
+    lookupPosition = np.minimum(np.searchsorted(indexKey, lookupKey), len(indexKey) - 1)
+    shared = np.bincount(pairIndex, weights=indexKey[lookupPosition] == lookupKey, minlength=len(candidateKey))
+    score = 2*shared/(querySize[candidateQuery] + indexSize[candidateIndex])
+
+    isMatch = score >= minScore
+    matches.append((candidateQuery[isMatch], candidateIndex[isMatch], score[isMatch]))
+
+  if not matches:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+
+  return tuple(np.concatenate(values) for values in zip(*matches))
+
+def matchBloombergBankruptciesToPanel(bloombergBankruptcyData,
+                                      panelDataFrame,
+                                      panelNameColumn='conm',
+                                      bloombergNameColumn='companyName',
+                                      bloombergDateColumn='Effective Date',
+                                      minScore=0.8,
+                                      monthsBeforeFirstDate=0,
+                                      monthsAfterLastDate=24,
+                                      keepAllCandidates=False
+                                      ):
+  """
+  Join Bloomberg Bankruptcy records (as formatted by
+  formatBloombergBankruptcyData) to the firms (PERMNO) of a panel with
+  PERMNO, date_month and a company name column, by company name.
+
+  Names on both sides are normalized (see normalizeCompanyNames) and matched
+  through a trigram index over the panel's names (see matchCompanyNames).
+  A firm is only a candidate for a record if the record's date falls
+  between monthsBeforeFirstDate months before the firm's first month under
+  that name and monthsAfterLastDate months after its last.
+
+  Returns one row per record and matched firm with PERMNO, the panel name
+  and matchScore (1 for equal normalized names); by default only each
+  record's best scoring firms, with keepAllCandidates every candidate
+  scoring at least minScore, for review. Records without a match are
+  dropped.
+  """
+  bloombergBankruptcyDataCopy = bloombergBankruptcyData.reset_index(drop=True)
+
+  # Firms under each Panel Name and their Active Months
+  panelFirms = pd.DataFrame({'PERMNO': panelDataFrame['PERMNO'].to_numpy(),
+                             panelNameColumn: panelDataFrame[panelNameColumn].to_numpy(),
+                             'month': monthPeriodToOrdinal(panelDataFrame['date_month'])
+                             }).dropna(subset=[panelNameColumn])
+  panelFirms = panelFirms.groupby(['PERMNO', panelNameColumn], sort=False, observed=True)['month'].agg(['min', 'max']).reset_index()
+
+  # Normalize and Match Distinct Names
+  panelNormalizedNames = normalizeCompanyNames(panelFirms[panelNameColumn].astype(object))
+  bloombergNormalizedNames = normalizeCompanyNames(bloombergBankruptcyDataCopy[bloombergNameColumn].astype(object))
+  indexNames, panelFirms['nameIndex'] = np.unique(panelNormalizedNames.fillna('').to_numpy(dtype=str), return_inverse=True)
+  queryNames, queryIndex = np.unique(bloombergNormalizedNames.fillna('').to_numpy(dtype=str), return_inverse=True)
+  matchedQuery, matchedIndex, matchScore = matchCompanyNames(queryNames, indexNames, minScore)
+  nameMatches = pd.DataFrame({'queryIndex': matchedQuery, 'nameIndex': matchedIndex, 'matchScore': matchScore})
+
+  # Expand Name Matches to Records and Firms
+  records = pd.DataFrame({'recordIndex': np.arange(len(bloombergBankruptcyDataCopy)),
+                          'queryIndex': queryIndex,
+                          'recordMonth': monthPeriodToOrdinal(pd.to_datetime(bloombergBankruptcyDataCopy[bloombergDateColumn]).dt.to_period('m'))
+                          })
+  records = records[bloombergNormalizedNames.fillna('').str.len().to_numpy() > 0]
+  matches = records.merge(nameMatches, on='queryIndex').merge(panelFirms, on='nameIndex')
+
+  # Block by the Firm's Active Window
+  matches = matches[(matches['recordMonth'] >= matches['min'] - monthsBeforeFirstDate) &
+                    (matches['recordMonth'] <= matches['max'] + monthsAfterLastDate)
+                    ]
+
+  # Best Scoring Firms per Record
+  if not keepAllCandidates:
+    matches = matches[matches['matchScore'] == matches.groupby('recordIndex')['matchScore'].transform('max')]
+  matches = matches.sort_values(['recordIndex', 'matchScore', 'PERMNO'], ascending=[True, False, True], kind='mergesort')
+
+  matchedBankruptcies = bloombergBankruptcyDataCopy.take(matches['recordIndex'].to_numpy()).reset_index(drop=True)
+  matchedBankruptcies['PERMNO'] = matches['PERMNO'].to_numpy()
+  matchedBankruptcies[panelNameColumn] = matches[panelNameColumn].to_numpy()
+  matchedBankruptcies['matchScore'] = matches['matchScore'].to_numpy()
+
+  return matchedBankruptcies
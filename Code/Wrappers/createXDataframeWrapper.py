@@ -6,16 +6,29 @@ Wrapper that creates the X-Dataframe from raw data
 import pandas as pd
 import numpy as np
 
-
-def prepareCrspCompustatMergedData(CRSP_COMPUSTAT_MERGED, monthsToLagAccountingVariables=2):
+from panelKeysWrapper import FIRM_MONTH_KEY_STRIDE, FIRM_MONTH_KEY_OFFSET, monthPeriodToOrdinal, monthOrdinalToPeriod, firmMonthKey
+from firmReturnsWrapper import addFirmReturns, calculateFirmReturns
+from crossSectionalCleaningWrapper import cleanExplanatoryVariables
+from compactPanelWrapper import compactPanel
+from stageCacheWrapper import createXDataFrameStageKeys, runCachedStage
+from stageInstrumentationWrapper import activateInstrumentation, instrumentStage, recordOutputRows, recordFilter
+
+# Decayed Averages (Campbell, Hilscher and Szilagyi): weights halve every
+# quarter over the last 12 months
+DECAYED_AVERAGE_PHI = 2**(-1/3)
+DECAYED_AVERAGE_WINDOW_MONTHS = 12
+
+def prepareCrspCompustatMergedData(CRSP_COMPUSTAT_MERGED, monthsToLagAccountingVariables=2, monthsAccountingVariablesValid=3):
   """
   Format and manipulate CRSP/COMPUSTAT Merged Data
   """
   CRSP_COMPUSTAT_MERGED_COPY = CRSP_COMPUSTAT_MERGED.copy()
   # Filter out 6000-6999 Range Companies and make sure traded on American Exchange
-  CRSP_COMPUSTAT_MERGED_COPY = CRSP_COMPUSTAT_MERGED_COPY[((CRSP_COMPUSTAT_MERGED_COPY['sic']<6000) |  (CRSP_COMPUSTAT_MERGED_COPY['sic']>=7000)) &
-                                                          (CRSP_COMPUSTAT_MERGED_COPY['exchg'].isin([11, 12, 13, 14, 15, 16, 17, 18, 19, 20]))                  
-                                                          ]
+  isNotFinancial = (CRSP_COMPUSTAT_MERGED_COPY['sic']<6000) |  (CRSP_COMPUSTAT_MERGED_COPY['sic']>=7000)
+  isAmericanExchange = CRSP_COMPUSTAT_MERGED_COPY['exchg'].isin([11, 12, 13, 14, 15, 16, 17, 18, 19, 20])
+  recordFilter('sic', len(CRSP_COMPUSTAT_MERGED_COPY), isNotFinancial.sum())
+  recordFilter('exchg', isNotFinancial.sum(), (isNotFinancial & isAmericanExchange).sum())
+  CRSP_COMPUSTAT_MERGED_COPY = CRSP_COMPUSTAT_MERGED_COPY[isNotFinancial & isAmericanExchange]
 
   # Split Up 'datacqtr' into calendar year and quarter
   CRSP_COMPUSTAT_MERGED_COPY['CalendarYear'] = CRSP_COMPUSTAT_MERGED_COPY['datacqtr'].str.slice(0,4)
@@ -31,7 +44,7 @@ def prepareCrspCompustatMergedData(CRSP_COMPUSTAT_MERGED, monthsToLagAccountingV
   CRSP_COMPUSTAT_MERGED_COPY['QuarterEnd_Month'] = CRSP_COMPUSTAT_MERGED_COPY['QuarterEnd'].dt.to_period('m')
 
   # Calculate Lagged Dates (Year-Month)
-  for i in range(3):
+  for i in range(monthsAccountingVariablesValid):
     lag = monthsToLagAccountingVariables
     CRSP_COMPUSTAT_MERGED_COPY[f'Date_Lag{i+lag}'] = CRSP_COMPUSTAT_MERGED_COPY['QuarterEnd_Month'] + (lag+i)
 
@@ -53,25 +66,45 @@ def prepareCrspMonthlyData(CRSP_MONTHLY):
 
   # Filter Out 6000 Range SIC Companies (Financial and ETFs)
   CRSP_MONTHLY_COPY['SICCD'] = pd.to_numeric(CRSP_MONTHLY_COPY['SICCD'], errors='coerce')
+  rowsBefore = len(CRSP_MONTHLY_COPY)
   CRSP_MONTHLY_COPY = CRSP_MONTHLY_COPY[(CRSP_MONTHLY_COPY['SICCD']<6000) |  (CRSP_MONTHLY_COPY['SICCD']>=7000)]
+  recordFilter('SICCD', rowsBefore, len(CRSP_MONTHLY_COPY))
 
   # Filter Share Code to be 10 or 11
   CRSP_MONTHLY_COPY['SHRCD'] = pd.to_numeric(CRSP_MONTHLY_COPY['SHRCD'], errors='coerce')
+  rowsBefore = len(CRSP_MONTHLY_COPY)
   CRSP_MONTHLY_COPY = CRSP_MONTHLY_COPY[(CRSP_MONTHLY_COPY['SHRCD'].isin([10,11]))]
+  recordFilter('SHRCD', rowsBefore, len(CRSP_MONTHLY_COPY))
 
   # Filter Share Class to be 'A' or NaN
+  rowsBefore = len(CRSP_MONTHLY_COPY)
   CRSP_MONTHLY_COPY = CRSP_MONTHLY_COPY[((CRSP_MONTHLY_COPY['SHRCLS'].isna()) | (CRSP_MONTHLY_COPY['SHRCLS'] == 'A'))]
+  recordFilter('SHRCLS', rowsBefore, len(CRSP_MONTHLY_COPY))
 
   # Filter Out Returns less than -50
   CRSP_MONTHLY_COPY['RET'] = pd.to_numeric(CRSP_MONTHLY_COPY['RET'], errors='coerce')
+  rowsBefore = len(CRSP_MONTHLY_COPY)
   CRSP_MONTHLY_COPY = CRSP_MONTHLY_COPY[(CRSP_MONTHLY_COPY['RET']>-50)]
+  recordFilter('RET', rowsBefore, len(CRSP_MONTHLY_COPY))
 
   return CRSP_MONTHLY_COPY
 
-def prepareCrspDailyData(CRSP_DAILY):
+def prepareCrspDailyData(CRSP_DAILY, calculateSigma=False, sigmaWindowMonths=3, sigmaMinimumObservations=5):
   """
   Format and manipulate CRSP (Daily) Data
+
+  With calculateSigma, SIGMA is calculated from the daily returns (RET) and
+  one row per firm-month is returned (see calculateSIGMA); otherwise the
+  data is expected to carry a precomputed SIGMA column.
   """
+  if calculateSigma:
+    return calculateSIGMA(CRSP_DAILY['PERMNO'],
+                          pd.to_datetime(CRSP_DAILY['date']),
+                          pd.to_numeric(CRSP_DAILY['RET'], errors='coerce'),
+                          sigmaWindowMonths,
+                          sigmaMinimumObservations
+                          )
+
   # Create Copy of Dataframe
   CRSP_DAILY_COPY = CRSP_DAILY.copy()
 
@@ -81,6 +114,58 @@ def prepareCrspDailyData(CRSP_DAILY):
 
   return CRSP_DAILY_COPY
 
+def calculateSIGMA(PERMNO, DATE, RET, windowMonths=3, minimumObservations=5):
+  """
+  Calculate SIGMA, the annualized volatility of daily returns over the
+  windowMonths calendar months ending with each month, per firm:
+
+    SIGMA = sqrt(252 / (N - 1) * sum(RET^2))
+
+  where N is the number of daily returns in the window. SIGMA is missing
+  when N < minimumObservations.
+
+  Daily returns are sorted once by (PERMNO, month), squared returns are
+  summed per firm-month, and the windows are differences of a cumulative
+  sum, so windows never span two firms and cost does not depend on
+  windowMonths. Returns one row (the month-end value) per firm-month with
+  columns PERMNO, date_month and SIGMA.
+  """
+  isValid = (PERMNO.notna() & DATE.notna() & RET.notna()).to_numpy()
+  recordFilter('missing PERMNO, date or RET', len(isValid), isValid.sum())
+  permno = PERMNO.to_numpy()[isValid].astype(np.int64)
+  month = monthPeriodToOrdinal(DATE.dt.to_period('m'))[isValid]
+  squaredReturns = RET.to_numpy(dtype=np.float64)[isValid]**2
+  key = firmMonthKey(permno, month)
+
+  # Sort by Firm-Month (stable, a no-op for CRSP's PERMNO/date order)
+  order = np.argsort(key, kind='mergesort')
+  key = key[order]
+  squaredReturns = squaredReturns[order]
+
+  # Sum Squared Returns and Count Returns per Firm-Month
+  firmMonthStarts = np.flatnonzero(np.diff(key, prepend=-1))
+  firmMonths = key[firmMonthStarts]
+  firmMonthSum = np.add.reduceat(squaredReturns, firmMonthStarts) if len(key) else np.zeros(0)
+  firmMonthCount = np.diff(np.append(firmMonthStarts, len(key)))
+
+  # Rolling Window over the previous windowMonths Months (Cumulative Sums)
+  cumulativeSum = np.concatenate([[0.0], np.cumsum(firmMonthSum)])
+  cumulativeCount = np.concatenate([[0], np.cumsum(firmMonthCount)])
+  windowStart = np.searchsorted(firmMonths, firmMonths - (windowMonths - 1), side='left')
+  windowEnd = np.arange(1, len(firmMonths) + 1)
+  windowSum = cumulativeSum[windowEnd] - cumulativeSum[windowStart]
+  windowCount = cumulativeCount[windowEnd] - cumulativeCount[windowStart]
+
+  # Annualize
+  with np.errstate(divide='ignore', invalid='ignore'):
+    SIGMA = np.sqrt(252*windowSum/(windowCount - 1))
+  SIGMA[windowCount < max(minimumObservations, 2)] = np.nan
+
+  return pd.DataFrame({'PERMNO': firmMonths // FIRM_MONTH_KEY_STRIDE,
+                       'date_month': monthOrdinalToPeriod(firmMonths % FIRM_MONTH_KEY_STRIDE - FIRM_MONTH_KEY_OFFSET),
+                       'SIGMA': SIGMA
+                       })
+
 
 def prepareSP500Data(SP500_MONTHLY):
   """
@@ -106,15 +191,123 @@ def prepareSP500Data(SP500_MONTHLY):
 
   return SP500_MONTHLY_COPY
 
+def asofMergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED,
+                                                CRSP_MONTHLY,
+                                                CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
+                                                CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm'],
+                                                CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
+                                                monthsToLagAccountingVariables=2,
+                                                monthsAccountingVariablesValid=3
+                                                ):
+  """
+  Point-in-time (as-of) join of CRSP/COMPUSTAT Merged onto CRSP (Monthly).
+
+  Each firm-month takes the accounting variables of the most recent quarter
+  whose QuarterEnd_Month + monthsToLagAccountingVariables is at or before
+  date_month, as long as that is within monthsAccountingVariablesValid months.
+  Missing values fall back, feature by feature, to older quarters inside the
+  window, and firm-months matching several quarter records are repeated once
+  per record, as the chained Date_Lag merges do.
+  """
+  # Month each Quarter becomes available, keyed by LPERMNO
+  quarterEndMonth = monthPeriodToOrdinal(CRSP_COMPUSTAT_MERGED['QuarterEnd_Month'])
+  quarterIsValid = CRSP_COMPUSTAT_MERGED['LPERMNO'].notna().to_numpy() & (quarterEndMonth != np.iinfo(np.int64).min)
+  quarterRows = np.flatnonzero(quarterIsValid)
+  quarterPermno = CRSP_COMPUSTAT_MERGED['LPERMNO'].to_numpy()[quarterIsValid].astype(np.int64)
+  quarterAvailable = quarterEndMonth[quarterIsValid] + monthsToLagAccountingVariables
+  quarterKey = firmMonthKey(quarterPermno, quarterAvailable)
+
+  # Sort Quarters by Key (stable, so duplicate records keep their original order)
+  quarterOrder = np.argsort(quarterKey, kind='mergesort')
+  quarterKey = quarterKey[quarterOrder]
+  quarterRows = quarterRows[quarterOrder]
+
+  # Key each Firm-Month the same way
+  monthlyKey = firmMonthKey(CRSP_MONTHLY['PERMNO'].to_numpy().astype(np.int64), monthPeriodToOrdinal(CRSP_MONTHLY['date_month']))
+
+  # Locate the Quarter Records available exactly `staleness` months before each Firm-Month
+  matchStart = np.empty((monthsAccountingVariablesValid, len(monthlyKey)), dtype=np.int64)
+  matchCount = np.empty((monthsAccountingVariablesValid, len(monthlyKey)), dtype=np.int64)
+  for staleness in range(monthsAccountingVariablesValid):
+    matchStart[staleness] = np.searchsorted(quarterKey, monthlyKey - staleness, side='left')
+    matchCount[staleness] = np.searchsorted(quarterKey, monthlyKey - staleness, side='right') - matchStart[staleness]
+
+  # Repeat Firm-Months matching several Quarter Records (most recent staleness varies slowest)
+  fanOut = np.maximum(matchCount, 1)
+  rowsPerFirmMonth = fanOut.prod(axis=0)
+  outputRows = np.repeat(np.arange(len(monthlyKey)), rowsPerFirmMonth)
+  positionInFanOut = np.arange(len(outputRows)) - np.repeat(np.cumsum(rowsPerFirmMonth) - rowsPerFirmMonth, rowsPerFirmMonth)
+
+  quarterMatches = []
+  divisor = rowsPerFirmMonth[outputRows]
+  for staleness in range(monthsAccountingVariablesValid):
+    stalenessFanOut = fanOut[staleness][outputRows]
+    divisor = divisor // stalenessFanOut
+    matchPosition = matchStart[staleness][outputRows] + (positionInFanOut // divisor) % stalenessFanOut
+    hasMatch = matchCount[staleness][outputRows] > 0
+    quarterMatches.append(np.where(hasMatch, quarterRows[np.minimum(matchPosition, len(quarterRows) - 1)], -1))
+
+  # Gather CRSP Features
+  explanatoryDataFrame = CRSP_MONTHLY[CRSP_MONTHLY_features].take(outputRows).reset_index(drop=True)
+
+  # Gather Accounting and Identifying Features (Fill NAs with Staler Quarters)
+  CRSP_COMPUSTAT_features = CRSP_COMPUSTAT_Accounting_features.copy()
+  CRSP_COMPUSTAT_features.extend(CRSP_COMPUSTAT_Identifying_features.copy())
+  for feature in CRSP_COMPUSTAT_features:
+    featureColumn = CRSP_COMPUSTAT_MERGED[feature]
+    isCategorical = isinstance(featureColumn.dtype, pd.CategoricalDtype)
+    # Categorical Identifiers are gathered as their Codes (-1 Missing)
+    featureValues = featureColumn.cat.codes.to_numpy() if isCategorical else featureColumn.to_numpy()
+    mergedValues = None
+    for quarterMatch in quarterMatches:
+      stalenessValues = pd.api.extensions.take(featureValues, quarterMatch, allow_fill=True, fill_value=-1 if isCategorical else None)
+      if mergedValues is None:
+        mergedValues = stalenessValues
+      elif isCategorical:
+        mergedValues = np.where(mergedValues < 0, stalenessValues, mergedValues)
+      else:
+        mergedValues = np.where(pd.isna(mergedValues), stalenessValues, mergedValues)
+    if isCategorical:
+      mergedValues = pd.Categorical.from_codes(mergedValues, dtype=featureColumn.dtype)
+    explanatoryDataFrame[feature] = mergedValues
+
+  return explanatoryDataFrame
+
 def mergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED, 
                                             CRSP_MONTHLY,
                                             CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
                                             CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm'],
-                                            CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET']
+                                            CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
+                                            monthsToLagAccountingVariables=2,
+                                            monthsAccountingVariablesValid=3,
+                                            mergeMethod='asof'
                                             ):
   """
   Merge CRSP/COMPUSTAT Merged Dataframe with CRSP (Monthly)
+
+  mergeMethod='asof' performs a single point-in-time join (see
+  asofMergeCrspCompustatMergedWithCrspMonthly); mergeMethod='chained' merges
+  once per Date_Lag column. Both give the same output while the window holds
+  at most one quarter end (monthsAccountingVariablesValid <= 3, the
+  default). With a longer window a firm-month can match two quarters: the
+  as-of join takes the most recent one, while the chained merges fill each
+  later (staler) merge from the earlier ones, so the stalest quarter wins.
   """
+  if mergeMethod == 'asof':
+    with instrumentStage('asofMergeCrspCompustatMergedWithCrspMonthly', len(CRSP_MONTHLY)) as stage:
+      explanatoryDataFrame = asofMergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED,
+                                                                         CRSP_MONTHLY,
+                                                                         CRSP_COMPUSTAT_Accounting_features,
+                                                                         CRSP_COMPUSTAT_Identifying_features,
+                                                                         CRSP_MONTHLY_features,
+                                                                         monthsToLagAccountingVariables,
+                                                                         monthsAccountingVariablesValid
+                                                                         )
+      recordOutputRows(stage, explanatoryDataFrame)
+    return explanatoryDataFrame
+  elif mergeMethod != 'chained':
+    raise ValueError(f"mergeMethod must be 'asof' or 'chained', not {mergeMethod!r}")
+
   # Create Copy of Dataframe
   CRSP_COMPUSTAT_MERGED_COPY = CRSP_COMPUSTAT_MERGED.copy()
   CRSP_MONTHLY_COPY = CRSP_MONTHLY.copy()
@@ -138,38 +331,42 @@ def mergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED,
   featuresToKeep.extend(CRSP_COMPUSTAT_Identifying_features.copy())
 
   # Add Lagged Accounting Features
-  for lag in range(2,5):
-      CRSP_COMPUSTAT_merge_features = ['LPERMNO', f'Date_Lag{lag}']
-      CRSP_COMPUSTAT_merge_features.extend(CRSP_COMPUSTAT_Accounting_features.copy())
-      CRSP_COMPUSTAT_merge_features.extend(CRSP_COMPUSTAT_Identifying_features.copy())
-      if lag==2:
-          temp = pd.merge(CRSP_COMPUSTAT_MERGED_COPY[CRSP_COMPUSTAT_merge_features],
-                                  CRSP_MONTHLY_COPY[CRSP_MONTHLY_features],
-                                  how='right',
-                                  left_on=['LPERMNO', f'Date_Lag{lag}'],
-                                  right_on=['PERMNO', 'date_month']
-                                  )
-          # Keep only specified Features
-          temp = temp[featuresToKeep]
+  firstLag = monthsToLagAccountingVariables
+  for lag in range(firstLag, firstLag + monthsAccountingVariablesValid):
+      with instrumentStage(f'mergeCrspCompustatMergedWithCrspMonthly[Date_Lag{lag}]', len(CRSP_MONTHLY_COPY) if lag==firstLag else len(temp)) as stage:
+        CRSP_COMPUSTAT_merge_features = ['LPERMNO', f'Date_Lag{lag}']
+        CRSP_COMPUSTAT_merge_features.extend(CRSP_COMPUSTAT_Accounting_features.copy())
+        CRSP_COMPUSTAT_merge_features.extend(CRSP_COMPUSTAT_Identifying_features.copy())
+        if lag==firstLag:
+            temp = pd.merge(CRSP_COMPUSTAT_MERGED_COPY[CRSP_COMPUSTAT_merge_features],
+                                    CRSP_MONTHLY_COPY[CRSP_MONTHLY_features],
+                                    how='right',
+                                    left_on=['LPERMNO', f'Date_Lag{lag}'],
+                                    right_on=['PERMNO', 'date_month']
+                                    )
+            # Keep only specified Features
+            temp = temp[featuresToKeep]
           
-      else:
-          temp = pd.merge(CRSP_COMPUSTAT_MERGED_COPY[CRSP_COMPUSTAT_merge_features],
-                                  temp[featuresToKeep],
-                                  how='right',
-                                  left_on=['LPERMNO', f'Date_Lag{lag}'],
-                                  right_on=['PERMNO', 'date_month'],
-                          suffixes=('', '_y')
-                                  )
+        else:
+            temp = pd.merge(CRSP_COMPUSTAT_MERGED_COPY[CRSP_COMPUSTAT_merge_features],
+                                    temp[featuresToKeep],
+                                    how='right',
+                                    left_on=['LPERMNO', f'Date_Lag{lag}'],
+                                    right_on=['PERMNO', 'date_month'],
+                            suffixes=('', '_y')
+                                    )
                         
-          # Update Features (Fill NAs with Lagged Variable)
-          CRSP_COMPUSTAT_features = CRSP_COMPUSTAT_Accounting_features.copy()
-          CRSP_COMPUSTAT_features.extend(CRSP_COMPUSTAT_Identifying_features.copy())
+            # Update Features (Fill NAs with Lagged Variable)
+            CRSP_COMPUSTAT_features = CRSP_COMPUSTAT_Accounting_features.copy()
+            CRSP_COMPUSTAT_features.extend(CRSP_COMPUSTAT_Identifying_features.copy())
 
-          for feature in CRSP_COMPUSTAT_features:
-              temp[feature] = temp[feature].fillna(temp[f'{feature}_y'])
-              temp = temp.drop([f'{feature}_y'], 1)
+            for feature in CRSP_COMPUSTAT_features:
+                temp[feature] = temp[feature].fillna(temp[f'{feature}_y'])
+                temp = temp.drop([f'{feature}_y'], axis=1)
           
-          temp = temp[featuresToKeep]
+            temp = temp[featuresToKeep]
+
+        recordOutputRows(stage, temp)
 
   explanatoryDataFrame = temp.copy()
   return explanatoryDataFrame
@@ -178,12 +375,14 @@ def mergeExplanatoryDataframeWithCrspDaily(explanatoryDataFrame, CRSP_DAILY):
   """
   Merge Existing Explanatory Dataframe with CRSP (Daily) Dataframe
   """
-  explanatoryDataFrame = pd.merge(explanatoryDataFrame,
-                CRSP_DAILY[['PERMNO', 'date_month', 'SIGMA']],
-                how='left',
-                left_on=['PERMNO', 'date_month'],
-                right_on=['PERMNO', 'date_month']
-               )
+  with instrumentStage('mergeExplanatoryDataframeWithCrspDaily', len(explanatoryDataFrame)) as stage:
+    explanatoryDataFrame = pd.merge(explanatoryDataFrame,
+                  CRSP_DAILY[['PERMNO', 'date_month', 'SIGMA']],
+                  how='left',
+                  left_on=['PERMNO', 'date_month'],
+                  right_on=['PERMNO', 'date_month']
+                 )
+    recordOutputRows(stage, explanatoryDataFrame)
   
   return explanatoryDataFrame
 
@@ -191,12 +390,14 @@ def mergeExplanatoryDataframeWithSP500Monthly(explanatoryDataFrame, SP500_MONTHL
   """
   Merge Existing Explanatory Dataframe with SP500 (Monthly) Dataframe
   """
-  explanatoryDataFrame = pd.merge(explanatoryDataFrame,
-                SP500_MONTHLY,
-                how='left',
-                left_on=['date_month'],
-                right_on=['date_month']
-               )
+  with instrumentStage('mergeExplanatoryDataframeWithSP500Monthly', len(explanatoryDataFrame)) as stage:
+    explanatoryDataFrame = pd.merge(explanatoryDataFrame,
+                  SP500_MONTHLY,
+                  how='left',
+                  left_on=['date_month'],
+                  right_on=['date_month']
+                 )
+    recordOutputRows(stage, explanatoryDataFrame)
   
   return explanatoryDataFrame
 
@@ -259,16 +460,12 @@ def calculateTLMTA(PRC, SHROUT, LTQ):
 
   return TLMTA
 
-def calculateEXRET(PRC, CFACPR, VWRETDSP500):
+def calculateEXRET(PRC, CFACPR, VWRETDSP500, PERMNO, DATE_MONTH):
   """
-  Calculate EXRET
+  Calculate EXRET (log return of the adjusted price over the firm's
+  previous month less the log market return, see calculateFirmReturns)
   """
-  # Precomputations
-  ADJPRC = PRC * CFACPR
-  RET = ADJPRC.shift(1) / ADJPRC
-
-  # EXRET Calculation
-  EXRET = np.log(1+RET) - np.log(1+VWRETDSP500)
+  EXRET = calculateFirmReturns(PERMNO, DATE_MONTH, PRC, CFACPR, VWRETDSP500)['EXRET']
 
   return EXRET
 
@@ -296,6 +493,261 @@ def calculateCASHMTA(PRC, SHROUT, CHEQ, LTQ):
 
   return CASHMTA
   
+# Explanatory Variables, and the intermediates they share, declared as
+# expressions over columns of the explanatory Dataframe and other declared
+# names. Dependencies are resolved automatically, so adding a variable only
+# takes a new entry. Available functions: log, abs, shift(x) (previous row)
+# and lagByFirm(x) (previous row of the same PERMNO), decayedAverage(x) and
+# quarterlyDecayedAverage(x) (see decayedAverageByFirm); any '<name>AVG' not
+# declared is decayedAverage(<name>). ADJPRC, ADJRET, LOGRET and EXRET are
+# columns added per firm by addFirmReturns (firmReturnsWrapper).
+EXPLANATORY_VARIABLE_EXPRESSIONS = {
+  # Intermediates
+  'ME': 'PRC * SHROUT',
+  'BE': 'ceqq',
+  'totalAssetsAdj': 'atq + 0.1*(ME - BE)',
+  'MTA': 'ME + ltq',
+  'NWC': 'actq - (ltq - lltq)',
+  'EBIT': 'revtq - cogsq - xoprq',
+  'ROE': 'niq / (atq - ltq)',
+  'ROE_Lag1': 'niq_Lag1 / (atq_Lag1 - ltq_Lag1)',
+  'PB': 'ME / BE',
+  'PB_Lag1': 'lagByFirm(PB)',
+
+  # Campbell, Hilscher and Szilagyi Variables
+  'NITA': 'niq / totalAssetsAdj',
+  'NIMTA': 'niq / MTA',
+  'TLTA': 'ltq / totalAssetsAdj',
+  'TLMTA': 'ltq / MTA',
+  'RSIZE': 'ME / totvalSP500',
+  'CASHMTA': 'cheq / MTA',
+  'NIMTAAVG': 'quarterlyDecayedAverage(NIMTA)',
+  'EXRETAVG': 'decayedAverage(EXRET)',
+
+  # Extended Variables
+  'NWCTA': 'NWC / totalAssetsAdj',
+  'NWCMTA': 'NWC / MTA',
+  'EBITTA': 'EBIT / totalAssetsAdj',
+  'EBITMTA': 'EBIT / MTA',
+  'MVTL': 'ME / ltq',
+  'MVLTD': 'ME / dlttq',
+  'MVSTD': 'ME / dlcq',
+  'STA': 'saleq / totalAssetsAdj',
+  'SMTA': 'saleq / MTA',
+  'OM': 'EBIT / saleq',
+  'GA': '(atq - atq_Lag1) / atq_Lag1',
+  'GS': '(saleq - saleq_Lag1) / saleq_Lag1',
+  'CROE': '(ROE - ROE_Lag1) / ROE_Lag1',
+  'CPB': '(PB - PB_Lag1) / PB_Lag1'
+}
+
+def shiftValues(values):
+  """
+  Shift an array down by one row (first row missing)
+  """
+  shifted = np.empty_like(values)
+  shifted[:1] = np.nan
+  shifted[1:] = values[:-1]
+  return shifted
+
+def lagValuesByFirm(values, PERMNO):
+  """
+  Previous row's value of the same PERMNO (in row order), as
+  groupby('PERMNO').shift(1) without the groupby
+  """
+  order = np.argsort(PERMNO, kind='mergesort')
+  sortedPermno = PERMNO[order]
+  lagged = np.full(len(values), np.nan)
+  sameFirm = np.flatnonzero(sortedPermno[1:] == sortedPermno[:-1]) + 1
+  lagged[order[sameFirm]] = values[order[sameFirm - 1]]
+  return lagged
+
+def decayedWindowSums(groupIndex, monthOrdinal, values, decay, windowMonths):
+  """
+  Sum of decay**k * value k months back over the last windowMonths months
+  (k = 0 is the row's own month) within each group, for rows unique per
+  (group, month) and a (rows x columns) array of values. Missing values
+  count as 0; a window without any value, or holding an infinite value, has
+  a missing sum.
+
+  Computed by a recursion stepped over calendar months that decays each
+  group's running sum across month gaps, adds values as they enter the
+  window and takes them out as they leave it, so the cost is linear in the
+  number of rows whatever windowMonths is.
+  """
+  isInfinite = np.isinf(values)
+  isObserved = ~np.isnan(values)
+  values = np.where(isObserved & ~isInfinite, values, 0)
+
+  # Rows by Calendar Month
+  monthOrder = np.argsort(monthOrdinal, kind='mergesort')
+  months = monthOrdinal[monthOrder] - monthOrdinal.min() if len(monthOrdinal) else monthOrdinal
+  nMonths = int(months[-1]) + 1 if len(months) else 0
+  monthStart = np.searchsorted(months, np.arange(nMonths + 1), side='left')
+
+  # Running Sum of each Group as of its last Month, and the Values in its Window
+  nGroups = int(groupIndex.max()) + 1 if len(groupIndex) else 0
+  runningSum = np.zeros((nGroups, values.shape[1]))
+  runningMonth = np.zeros(nGroups, dtype=np.int64)
+  observedCount = np.zeros((nGroups, values.shape[1]), dtype=np.int64)
+  infiniteCount = np.zeros((nGroups, values.shape[1]), dtype=np.int64)
+
+  sums = np.empty(values.shape)
+  for month in range(nMonths):
+    # Values leaving the Window
+    if month >= windowMonths:
+      leaving = monthOrder[monthStart[month - windowMonths]:monthStart[month - windowMonths + 1]]
+      group = groupIndex[leaving]
+      runningSum[group] -= decay**(runningMonth[group] - (month - windowMonths))[:, None] * values[leaving]
+      observedCount[group] -= isObserved[leaving]
+      infiniteCount[group] -= isInfinite[leaving]
+      runningSum[group] = np.where(observedCount[group] > 0, runningSum[group], 0)
+
+    # Values entering the Window
+    entering = monthOrder[monthStart[month]:monthStart[month + 1]]
+    group = groupIndex[entering]
+    runningSum[group] = decay**(month - runningMonth[group])[:, None] * runningSum[group] + values[entering]
+    runningMonth[group] = month
+    observedCount[group] += isObserved[entering]
+    infiniteCount[group] += isInfinite[entering]
+    sums[entering] = np.where((observedCount[group] > 0) & (infiniteCount[group] == 0), runningSum[group], np.nan)
+
+  return sums
+
+def decayedAverageNormalization(decay, windowMonths):
+  """
+  Constant making decayed weights over windowMonths months sum to one,
+  (1 - decay) / (1 - decay**windowMonths)
+  """
+  if decay == 1:
+    return 1 / windowMonths
+  return (1 - decay) / (1 - decay**windowMonths)
+
+def firmMonthMeans(values, PERMNO, monthOrdinal):
+  """
+  Mean value of each distinct firm-month (rows repeated for several quarter
+  records are averaged). Returns the group index (firm) and month of each
+  firm-month, their means and each row's firm-month.
+  """
+  keys, rowFirmMonth = np.unique(firmMonthKey(PERMNO, monthOrdinal), return_inverse=True)
+  isObserved = ~np.isnan(values)
+  valueSums = np.bincount(rowFirmMonth, weights=np.where(isObserved, values, 0), minlength=len(keys))
+  valueCounts = np.bincount(rowFirmMonth, weights=isObserved, minlength=len(keys))
+  with np.errstate(invalid='ignore'):
+    means = np.where(valueCounts > 0, valueSums / np.maximum(valueCounts, 1), np.nan)
+
+  _, groupIndex = np.unique(keys // FIRM_MONTH_KEY_STRIDE, return_inverse=True)
+  return groupIndex, keys % FIRM_MONTH_KEY_STRIDE - FIRM_MONTH_KEY_OFFSET, means, rowFirmMonth
+
+def decayedAverageByFirm(values, PERMNO, monthOrdinal, decay=DECAYED_AVERAGE_PHI, windowMonths=DECAYED_AVERAGE_WINDOW_MONTHS):
+  """
+  Geometrically decayed average of each firm's last windowMonths months (the
+  current month included), as EXRETAVG:
+  (1 - phi)/(1 - phi**12) * (x_t + phi*x_t-1 + ... + phi**11*x_t-11).
+  Months the firm is missing count as 0, and a firm without any value in the
+  window has a missing average (see decayedWindowSums).
+  """
+  groupIndex, month, means, rowFirmMonth = firmMonthMeans(values, PERMNO, monthOrdinal)
+  sums = decayedWindowSums(groupIndex, month, means[:, None], decay, windowMonths)[:, 0]
+
+  return (decayedAverageNormalization(decay, windowMonths) * sums)[rowFirmMonth]
+
+def quarterlyDecayedAverageByFirm(values, PERMNO, monthOrdinal, decay=DECAYED_AVERAGE_PHI, windowMonths=DECAYED_AVERAGE_WINDOW_MONTHS):
+  """
+  Decayed average of each firm's quarterly values over its last windowMonths
+  months, as NIMTAAVG:
+  (1 - phi**3)/(1 - phi**12) * (x_t-0,t-2 + ... + phi**9*x_t-9,t-11),
+  where x_t-0,t-2 is the mean over the quarter ending in the current month.
+  Quarters without values count as 0.
+  """
+  groupIndex, month, means, rowFirmMonth = firmMonthMeans(values, PERMNO, monthOrdinal)
+
+  # Mean over the Quarter ending in each Month a Value falls in (its own and the two after)
+  quarterKey = firmMonthKey(np.repeat(groupIndex, 3), (month[:, None] + np.arange(3)).ravel())
+  quarterKeys, quarterOfValue = np.unique(quarterKey, return_inverse=True)
+  isObserved = np.repeat(~np.isnan(means), 3)
+  quarterSums = np.bincount(quarterOfValue, weights=np.where(isObserved, np.repeat(means, 3), 0), minlength=len(quarterKeys))
+  quarterCounts = np.bincount(quarterOfValue, weights=isObserved, minlength=len(quarterKeys))
+  with np.errstate(invalid='ignore'):
+    quarterMeans = np.where(quarterCounts > 0, quarterSums / np.maximum(quarterCounts, 1), np.nan)
+  quarterMeans[np.bincount(quarterOfValue, weights=np.isinf(np.repeat(means, 3)), minlength=len(quarterKeys)) > 0] = np.inf
+
+  # Decay Quarters apart (Months with the same Remainder mod 3, in Quarters)
+  quarterGroup = quarterKeys // FIRM_MONTH_KEY_STRIDE
+  quarterMonth = quarterKeys % FIRM_MONTH_KEY_STRIDE - FIRM_MONTH_KEY_OFFSET
+  quarterDecay = decay**3
+  windowQuarters = windowMonths // 3
+  sums = decayedWindowSums(3*quarterGroup + quarterMonth % 3, quarterMonth // 3, quarterMeans[:, None], quarterDecay, windowQuarters)[:, 0]
+
+  # Back to the Firm-Months
+  firmMonthQuarter = np.searchsorted(quarterKeys, firmMonthKey(groupIndex, month))
+  return (decayedAverageNormalization(quarterDecay, windowQuarters) * sums[firmMonthQuarter])[rowFirmMonth]
+
+def decayedAverageExpression(name):
+  """
+  Expression of an undeclared '<name>AVG' variable: the decayed average of
+  <name>; None for other names
+  """
+  if name.endswith('AVG') and len(name) > len('AVG'):
+    return f'decayedAverage({name[:-len("AVG")]})'
+  return None
+
+def calculateExplanatoryVariables(explanatoryDataFrame,
+                                  explanatoryVariablesToCalculate,
+                                  floatDtype=np.float64,
+                                  expressions=EXPLANATORY_VARIABLE_EXPRESSIONS
+                                  ):
+  """
+  Evaluate declared Explanatory Variables over an explanatory Dataframe.
+
+  Each requested variable's dependencies are resolved from expressions;
+  every intermediate (ME, totalAssetsAdj, ...) is computed once in float64
+  and shared, and results are written into one preallocated floatDtype
+  block. Returns a Dataframe of the requested variables on the same index.
+  """
+  functions = {'log': np.log,
+               'abs': np.abs,
+               'shift': shiftValues,
+               'lagByFirm': lambda values: lagValuesByFirm(values, explanatoryDataFrame['PERMNO'].to_numpy()),
+               'decayedAverage': lambda values: decayedAverageByFirm(values,
+                                                                     explanatoryDataFrame['PERMNO'].to_numpy(),
+                                                                     monthPeriodToOrdinal(explanatoryDataFrame['date_month'])
+                                                                     ),
+               'quarterlyDecayedAverage': lambda values: quarterlyDecayedAverageByFirm(values,
+                                                                                       explanatoryDataFrame['PERMNO'].to_numpy(),
+                                                                                       monthPeriodToOrdinal(explanatoryDataFrame['date_month'])
+                                                                                       )
+               }
+  values = {}
+
+  def evaluate(name):
+    """
+    Evaluate name after its dependencies (depth first), caching the result
+    """
+    if name in values:
+      return values[name]
+    expression = expressions.get(name)
+    if expression is None and name not in explanatoryDataFrame.columns:
+      expression = decayedAverageExpression(name)
+    if expression is None:
+      if name not in explanatoryDataFrame.columns:
+        raise KeyError(f'{name} is neither a column of the explanatory Dataframe nor a declared explanatory variable')
+      values[name] = explanatoryDataFrame[name].to_numpy(dtype=np.float64)
+      return values[name]
+
+    expression = compile(expression, name, 'eval')
+    namespace = {dependency: evaluate(dependency) for dependency in expression.co_names if dependency not in functions}
+    with np.errstate(divide='ignore', invalid='ignore'):
+      values[name] = eval(expression, {'__builtins__': {}, **functions}, namespace)
+    return values[name]
+
+  # Evaluate into a Preallocated Block
+  explanatoryVariables = np.empty((len(explanatoryDataFrame), len(explanatoryVariablesToCalculate)), dtype=floatDtype, order='F')
+  for i, name in enumerate(explanatoryVariablesToCalculate):
+    explanatoryVariables[:, i] = evaluate(name)
+
+  return pd.DataFrame(explanatoryVariables, index=explanatoryDataFrame.index, columns=explanatoryVariablesToCalculate)
+
 def createCustomExplanatoryVariables(explanatoryDataFrame, 
                                      explanatoryVariablesToCalculate=['NITA', 
                                                                       'NIMTA',
@@ -310,78 +762,35 @@ def createCustomExplanatoryVariables(explanatoryDataFrame,
                                                            'GVKEY',
                                                            'conm'
                                                            ],
-                                     keepAllFeatures=False
+                                     keepAllFeatures=False,
+                                     floatDtype=np.float64
                                      ):
   """
   Create Custom Explanatory Variables and add them to existing explanatory 
   Dataframe
+
+  Any variable declared in EXPLANATORY_VARIABLE_EXPRESSIONS can be
+  requested, as can the decayed average '<name>AVG' of any variable or
+  column (e.g. TLMTAAVG); other requested names (e.g. SIGMA, EXRET) must
+  already be columns. Requested variables are stored as floatDtype.
   """
-  if 'NITA' in (explanatoryVariablesToCalculate):
-    # Calculate NITA
-    explanatoryDataFrame['NITA'] = calculateNITA(PRC=explanatoryDataFrame['PRC'], 
-                                                SHROUT=explanatoryDataFrame['SHROUT'], 
-                                                CEQQ=explanatoryDataFrame['ceqq'], 
-                                                ATQ=explanatoryDataFrame['atq'], 
-                                                NIQ=explanatoryDataFrame['niq']
-                                                )
-  
-  if 'NIMTA' in (explanatoryVariablesToCalculate):
-    # Calculate NIMTA
-    explanatoryDataFrame['NIMTA'] = calculateNIMTA(PRC=explanatoryDataFrame['PRC'], 
-                                                SHROUT=explanatoryDataFrame['SHROUT'],
-                                                NIQ=explanatoryDataFrame['niq'],
-                                                LTQ=explanatoryDataFrame['ltq']
-                                                )
-    
-  if 'TLTA' in (explanatoryVariablesToCalculate):
-    # Calculate TLTA
-    explanatoryDataFrame['TLTA'] = calculateTLTA(PRC=explanatoryDataFrame['PRC'], 
-                                                 SHROUT=explanatoryDataFrame['SHROUT'],
-                                                 CEQQ=explanatoryDataFrame['ceqq'],
-                                                 ATQ=explanatoryDataFrame['atq'],
-                                                 LTQ=explanatoryDataFrame['ltq']
-                                                 )
-    
-  if 'TLMTA' in (explanatoryVariablesToCalculate):
-    # Calculate TLTA
-    explanatoryDataFrame['TLMTA'] = calculateTLMTA(PRC=explanatoryDataFrame['PRC'], 
-                                                 SHROUT=explanatoryDataFrame['SHROUT'],
-                                                 LTQ=explanatoryDataFrame['ltq']
-                                                 )
-    
-  if 'EXRET' in (explanatoryVariablesToCalculate):
-    # Calculate EXRET
-    explanatoryDataFrame['EXRET'] = calculateEXRET(PRC=explanatoryDataFrame['PRC'], 
-                                                   CFACPR=explanatoryDataFrame['CFACPR'],
-                                                   VWRETDSP500=explanatoryDataFrame['vwretdSP500']
-                                                 )
-    
-  if 'RSIZE' in (explanatoryVariablesToCalculate):
-    # Calculate RSIZE
-    explanatoryDataFrame['RSIZE'] = calculateRSIZE(PRC=explanatoryDataFrame['PRC'], 
-                                                 SHROUT=explanatoryDataFrame['SHROUT'],
-                                                 TOTVALSP500=explanatoryDataFrame['totvalSP500']
-                                                 )
-    
-  if 'CASHMTA' in (explanatoryVariablesToCalculate):
-    # Calculate CASHMTA
-    explanatoryDataFrame['CASHMTA'] = calculateCASHMTA(PRC=explanatoryDataFrame['PRC'], 
-                                                 SHROUT=explanatoryDataFrame['SHROUT'],
-                                                 CHEQ=explanatoryDataFrame['cheq'],
-                                                 LTQ=explanatoryDataFrame['ltq']
-                                                 )
-
-
-  if keepAllFeatures:
-  	print('In')
-  	explanatoryDataFrame = explanatoryDataFrame
-  else:
-  	print('out')
-  	# Keep only selected columns
-  	selectedColumns = identifyingColumns
-  	selectedColumns.extend(['date_month'])
-  	selectedColumns.extend(explanatoryVariablesToCalculate)
-  	explanatoryDataFrame = explanatoryDataFrame[selectedColumns]
+  # Calculate Declared Variables (Sharing Intermediates)
+  variablesToCalculate = [name for name in explanatoryVariablesToCalculate
+                          if name in EXPLANATORY_VARIABLE_EXPRESSIONS or (name not in explanatoryDataFrame.columns and decayedAverageExpression(name) is not None)
+                          ]
+  explanatoryVariables = calculateExplanatoryVariables(explanatoryDataFrame, variablesToCalculate, floatDtype)
+  for name in variablesToCalculate:
+    explanatoryDataFrame[name] = explanatoryVariables[name].to_numpy()
+  for name in explanatoryVariablesToCalculate:
+    if name not in variablesToCalculate and pd.api.types.is_float_dtype(explanatoryDataFrame[name].dtype):
+      explanatoryDataFrame[name] = explanatoryDataFrame[name].astype(floatDtype, copy=False)
+
+  if not keepAllFeatures:
+    # Keep only selected columns
+    selectedColumns = identifyingColumns.copy()
+    selectedColumns.extend(['date_month'])
+    selectedColumns.extend(explanatoryVariablesToCalculate)
+    explanatoryDataFrame = explanatoryDataFrame.loc[:, selectedColumns]
 
   return explanatoryDataFrame
 
@@ -400,35 +809,232 @@ def createXDataFrame(rawDataframes,
                      CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
                      CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm', 'cik'],
                      CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
-                     monthsToLagAccountingVariables=2
+                     monthsToLagAccountingVariables=2,
+                     monthsAccountingVariablesValid=3,
+                     mergeMethod='asof',
+                     calculateSigma=False,
+                     sigmaWindowMonths=3,
+                     sigmaMinimumObservations=5,
+                     cleaningColumns=None,
+                     winsorizeQuantiles=[0.05, 0.95],
+                     imputationMethods=['ffill'],
+                     compactLayout=False,
+                     floatDtype=np.float64,
+                     nWorkers=1,
+                     partitionSize=None,
+                     cacheDirectory=None,
+                     maxCacheBytes=10*2**30,
+                     rawFingerprints=None,
+                     instrumentation=None
                      ):
   """
   Create X-Dataframe
+
+  calculateSigma computes SIGMA from the daily returns in CRSP_DAILY (see
+  calculateSIGMA) instead of reading a precomputed SIGMA column.
+
+  Adjusted prices and returns, including EXRET, are calculated per firm
+  after the merges (see firmReturnsWrapper).
+
+  cleaningColumns (e.g. IMPUTATION_COLUMNS) adds a final stage that replaces
+  infinities, winsorizes those columns at the per-month winsorizeQuantiles
+  and imputes them by imputationMethods (see crossSectionalCleaningWrapper).
+
+  compactLayout keeps every stage in the compact layout (see
+  compactPanelWrapper): months as int32 ordinals, so merges join on machine
+  integers, and identifiers as categoricals. Explanatory variables are
+  stored as floatDtype (e.g. np.float32); they are always calculated in
+  float64.
+
+  nWorkers > 1 builds the X-Dataframe in PERMNO partitions across a process
+  pool (see partitionedXDataframeWrapper); partitionSize defaults to about
+  four partitions per worker.
+
+  With a cacheDirectory, the output of each stage (the four prepare stages,
+  the merges, the explanatory variables and the cleaning) is cached there and reused while
+  its inputs, parameters and code are unchanged (see stageCacheWrapper), so
+  changing a ratio, requested or declared, only reruns the last stage. Raw
+  inputs are identified by rawFingerprints (e.g. the fileFingerprint of each
+  raw file) or, by default, by hashing their contents. The cache is kept to
+  maxCacheBytes.
+
+  An instrumentation (see stageInstrumentationWrapper) records every stage
+  that runs: each prepare stage with the rows its filters drop, each merge,
+  the firm returns, the explanatory variables and the cleaning (stages
+  served from the cache record their loading; a partitioned build is one
+  stage).
   """
-  # Load Raw Dataframes
-  CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY = rawDataframes
-
-  # Prepare Data
-  CRSP_COMPUSTAT_MERGED = prepareCrspCompustatMergedData(CRSP_COMPUSTAT_MERGED, monthsToLagAccountingVariables)
-  CRSP_MONTHLY = prepareCrspMonthlyData(CRSP_MONTHLY)
-  CRSP_DAILY = prepareCrspDailyData(CRSP_DAILY)
-  SP500_MONTHLY = prepareSP500Data(SP500_MONTHLY)
-
-  # Merge Dataframes
-  explanatoryDataFrame = mergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED, 
-                                                                 CRSP_MONTHLY,
-                                                                 CRSP_COMPUSTAT_Accounting_features,
-                                                                 CRSP_COMPUSTAT_Identifying_features,
-                                                                 CRSP_MONTHLY_features
-                                                                 )
-  explanatoryDataFrame = mergeExplanatoryDataframeWithCrspDaily(explanatoryDataFrame, CRSP_DAILY)
-  explanatoryDataFrame = mergeExplanatoryDataframeWithSP500Monthly(explanatoryDataFrame, SP500_MONTHLY)
+  def runStage(stageName, computeStage):
+    """
+    Run a stage, through the cache if there is one
+    """
+    if cacheDirectory is None:
+      return computeStage()
+    return runCachedStage(cacheDirectory, stageName, stageKeys[stageName], computeStage, maxCacheBytes)
+
+  def compactStage(stageDataFrame):
+    """
+    Convert a Stage's Output to the Compact Layout if requested
+    """
+    return compactPanel(stageDataFrame) if compactLayout else stageDataFrame
+
+  if cacheDirectory is not None:
+    stageKeys = createXDataFrameStageKeys(rawDataframes,
+                                          rawFingerprints,
+                                          {'CRSP_COMPUSTAT_MERGED': [monthsToLagAccountingVariables, monthsAccountingVariablesValid, compactLayout],
+                                           'CRSP_MONTHLY': [compactLayout],
+                                           'CRSP_DAILY': [calculateSigma, sigmaWindowMonths, sigmaMinimumObservations, compactLayout],
+                                           'SP500_MONTHLY': [compactLayout],
+                                           'merged': [CRSP_COMPUSTAT_Accounting_features,
+                                                      CRSP_COMPUSTAT_Identifying_features,
+                                                      CRSP_MONTHLY_features,
+                                                      monthsToLagAccountingVariables,
+                                                      monthsAccountingVariablesValid,
+                                                      mergeMethod
+                                                      ],
+                                           'explanatoryVariables': [explanatoryVariablesToCalculate,
+                                                                    identifyingColumns,
+                                                                    keepAllFeatures,
+                                                                    floatDtype,
+                                                                    EXPLANATORY_VARIABLE_EXPRESSIONS
+                                                                    ],
+                                           'cleaned': [cleaningColumns, winsorizeQuantiles, imputationMethods]
+                                           },
+                                          {'CRSP_COMPUSTAT_MERGED': [prepareCrspCompustatMergedData, compactPanel],
+                                           'CRSP_MONTHLY': [prepareCrspMonthlyData, compactPanel],
+                                           'CRSP_DAILY': [prepareCrspDailyData, compactPanel],
+                                           'SP500_MONTHLY': [prepareSP500Data, compactPanel],
+                                           'merged': [mergeCrspCompustatMergedWithCrspMonthly,
+                                                      mergeExplanatoryDataframeWithCrspDaily,
+                                                      mergeExplanatoryDataframeWithSP500Monthly,
+                                                      addFirmReturns
+                                                      ],
+                                           'explanatoryVariables': [createCustomExplanatoryVariables],
+                                           'cleaned': [cleanExplanatoryVariables]
+                                           }
+                                          )
+
+  def cleaningStage(explanatoryVariablesStage):
+    """
+    Clean the Explanatory Variables (Cross-Sectionally, so after any
+    Partitions are combined)
+    """
+    explanatoryDataFrame = runStage('explanatoryVariables', explanatoryVariablesStage)
+    with instrumentStage('cleanExplanatoryVariables', len(explanatoryDataFrame)) as stage:
+      explanatoryDataFrame = cleanExplanatoryVariables(explanatoryDataFrame,
+                                                       cleaningColumns,
+                                                       winsorizeQuantiles,
+                                                       imputationMethods
+                                                       )
+      recordOutputRows(stage, explanatoryDataFrame)
+
+    return explanatoryDataFrame
+
+  def finalStage(explanatoryVariablesStage):
+    """
+    Run the Explanatory Variables Stage, then the Cleaning Stage if requested
+    """
+    if cleaningColumns is None:
+      return runStage('explanatoryVariables', explanatoryVariablesStage)
+    return runStage('cleaned', lambda: cleaningStage(explanatoryVariablesStage))
+
+  def mergeStage():
+    """
+    Prepare and Merge the Raw Dataframes
+    """
+    # Load Raw Dataframes
+    CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY = rawDataframes
+
+    # Prepare Data
+    with instrumentStage('prepareCrspCompustatMergedData', len(CRSP_COMPUSTAT_MERGED)) as stage:
+      CRSP_COMPUSTAT_MERGED = runStage('CRSP_COMPUSTAT_MERGED',
+                                       lambda: compactStage(prepareCrspCompustatMergedData(CRSP_COMPUSTAT_MERGED,
+                                                                                           monthsToLagAccountingVariables,
+                                                                                           monthsAccountingVariablesValid
+                                                                                           ))
+                                       )
+      recordOutputRows(stage, CRSP_COMPUSTAT_MERGED)
+    with instrumentStage('prepareCrspMonthlyData', len(CRSP_MONTHLY)) as stage:
+      CRSP_MONTHLY = runStage('CRSP_MONTHLY', lambda: compactStage(prepareCrspMonthlyData(CRSP_MONTHLY)))
+      recordOutputRows(stage, CRSP_MONTHLY)
+    with instrumentStage('prepareCrspDailyData', len(CRSP_DAILY)) as stage:
+      CRSP_DAILY = runStage('CRSP_DAILY', lambda: compactStage(prepareCrspDailyData(CRSP_DAILY, calculateSigma, sigmaWindowMonths, sigmaMinimumObservations)))
+      recordOutputRows(stage, CRSP_DAILY)
+    with instrumentStage('prepareSP500Data', len(SP500_MONTHLY)) as stage:
+      SP500_MONTHLY = runStage('SP500_MONTHLY', lambda: compactStage(prepareSP500Data(SP500_MONTHLY)))
+      recordOutputRows(stage, SP500_MONTHLY)
+
+    # Merge Dataframes
+    explanatoryDataFrame = mergeCrspCompustatMergedWithCrspMonthly(CRSP_COMPUSTAT_MERGED, 
+                                                                   CRSP_MONTHLY,
+                                                                   CRSP_COMPUSTAT_Accounting_features,
+                                                                   CRSP_COMPUSTAT_Identifying_features,
+                                                                   CRSP_MONTHLY_features,
+                                                                   monthsToLagAccountingVariables,
+                                                                   monthsAccountingVariablesValid,
+                                                                   mergeMethod
+                                                                   )
+    explanatoryDataFrame = mergeExplanatoryDataframeWithCrspDaily(explanatoryDataFrame, CRSP_DAILY)
+    explanatoryDataFrame = mergeExplanatoryDataframeWithSP500Monthly(explanatoryDataFrame, SP500_MONTHLY)
+
+    # Adjusted Prices and Returns per Firm
+    with instrumentStage('addFirmReturns', len(explanatoryDataFrame)) as stage:
+      explanatoryDataFrame = addFirmReturns(explanatoryDataFrame)
+      recordOutputRows(stage, explanatoryDataFrame)
+
+    return explanatoryDataFrame
+
+  def explanatoryVariablesStage():
+    """
+    Create the Explanatory Variables from the Merged Dataframe
+    """
+    explanatoryDataFrame = runStage('merged', mergeStage)
+    with instrumentStage('createCustomExplanatoryVariables', len(explanatoryDataFrame)) as stage:
+      explanatoryDataFrame = createCustomExplanatoryVariables(explanatoryDataFrame,
+                                                              explanatoryVariablesToCalculate,
+                                                              identifyingColumns,
+                                                              keepAllFeatures,
+                                                              floatDtype
+                                                              )
+      recordOutputRows(stage, explanatoryDataFrame)
+
+    return explanatoryDataFrame
+
+  def partitionStage():
+    """
+    Create the Explanatory Variables in PERMNO Partitions (see
+    partitionedXDataframeWrapper)
+    """
+    # Imported here, as the Partitions are built by createXDataFrame itself
+    from partitionedXDataframeWrapper import createXDataFrameByPartition
+    with instrumentStage('createXDataFrameByPartition', len(rawDataframes[1])) as stage:
+      explanatoryDataFrame = createXDataFrameByPartition(rawDataframes,
+                                                         partitionSize=partitionSize,
+                                                         nWorkers=nWorkers,
+                                                         explanatoryVariablesToCalculate=explanatoryVariablesToCalculate,
+                                                         identifyingColumns=identifyingColumns,
+                                                         keepAllFeatures=keepAllFeatures,
+                                                         CRSP_COMPUSTAT_Accounting_features=CRSP_COMPUSTAT_Accounting_features,
+                                                         CRSP_COMPUSTAT_Identifying_features=CRSP_COMPUSTAT_Identifying_features,
+                                                         CRSP_MONTHLY_features=CRSP_MONTHLY_features,
+                                                         monthsToLagAccountingVariables=monthsToLagAccountingVariables,
+                                                         monthsAccountingVariablesValid=monthsAccountingVariablesValid,
+                                                         mergeMethod=mergeMethod,
+                                                         calculateSigma=calculateSigma,
+                                                         sigmaWindowMonths=sigmaWindowMonths,
+                                                         sigmaMinimumObservations=sigmaMinimumObservations,
+                                                         compactLayout=compactLayout,
+                                                         floatDtype=floatDtype
+                                                         )
+      recordOutputRows(stage, explanatoryDataFrame)
+
+    return explanatoryDataFrame
 
   # Create Explanatory Variables
-  explanatoryDataFrame = createCustomExplanatoryVariables(explanatoryDataFrame, 
-                                                          explanatoryVariablesToCalculate,
-                                                          identifyingColumns,
-                                                          keepAllFeatures
-                                                          )
+  with activateInstrumentation(instrumentation):
+    if nWorkers > 1:
+      if partitionSize is None:
+        partitionSize = max(1, len(rawDataframes[1]) // (4*nWorkers))
+      return finalStage(partitionStage)
 
-  return explanatoryDataFrame
\ No newline at end of file
+    return finalStage(explanatoryVariablesStage)
\ No newline at end of file
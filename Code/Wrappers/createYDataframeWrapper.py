@@ -6,6 +6,16 @@ Wrapper that creates the Y-Dataframe from raw data
 import pandas as pd
 import numpy as np
 
+from panelKeysWrapper import monthPeriodToOrdinal
+from compactPanelWrapper import compactPanel
+from stageInstrumentationWrapper import activateInstrumentation, instrumentStage, recordOutputRows, recordFilter
+
+def bankruptcyIndicatorColumn(horizon):
+  """
+  Name of the Bankruptcy within N months indicator column of a horizon
+  """
+  return f'bankruptcyWithin{horizon}Months'
+
 def bankruptcyWithinNMonths(row, N, filler):
   """
   Check if a Bankruptcy has occured within N months of a given date (month)
@@ -19,48 +29,102 @@ def bankruptcyWithinNMonths(row, N, filler):
     bankruptcyOccurs=1
 
   return bankruptcyOccurs
+
+def calculateMonthsUntilBankruptcy(date_month, dldte_month, dlrsn):
+  """
+  Calculate the number of months from each date (month) to the firm's
+  bankruptcy (dlrsn==2) deletion month, as integer month ordinals. Months
+  are Month Periods or int32 month ordinals (the compact layout).
+
+  Returns the months until bankruptcy and a mask of rows that have one
+  (bankrupt firms with a known deletion month).
+  """
+  dateOrdinal = monthPeriodToOrdinal(date_month)
+  dldteOrdinal = monthPeriodToOrdinal(dldte_month)
+  hasBankruptcy = (dlrsn == 2).to_numpy() & (dldteOrdinal != np.iinfo(np.int64).min)
+  monthsUntilBankruptcy = np.where(hasBankruptcy, dldteOrdinal - dateOrdinal, 0)
+
+  return monthsUntilBankruptcy, hasBankruptcy
+
+def bankruptcyWithinNMonthsIndicators(monthsUntilBankruptcy, hasBankruptcy, monthsWithinBankruptcy, indicatorDtype=np.int64):
+  """
+  Build one Bankruptcy within N months indicator per horizon in a single
+  broadcast. Returns an (rows x horizons) indicatorDtype array.
+  """
+  horizons = np.asarray(monthsWithinBankruptcy, dtype=np.int64)
+  indicators = hasBankruptcy[:, None] & (monthsUntilBankruptcy[:, None] <= horizons[None, :])
+
+  return indicators.astype(indicatorDtype)
   
 def createYDataFrame(xDataFrame, 
                      monthsWithinBankruptcy = [3, 6, 12, 24, 60],
                      dropNA=True,
-                     featuresToKeep =['PERMNO', 'GVKEY', 'conm', 'date_month']
+                     featuresToKeep =['PERMNO', 'GVKEY', 'conm', 'date_month'],
+                     keepMonthsUntilBankruptcy=False,
+                     compactLayout=None,
+                     instrumentation=None
                      ):
   """
   Create Y DataFrame
+
+  keepMonthsUntilBankruptcy adds an integer 'monthsUntilBankruptcy' column
+  (missing for firms without a bankruptcy), from which any horizon can be
+  derived later.
+
+  compactLayout (by default, whether the X-Dataframe's date_month is in the
+  compact layout, see compactPanelWrapper) keeps months as int32 ordinals
+  and identifiers as categoricals and stores indicators as int8.
+
+  An instrumentation (see stageInstrumentationWrapper) records the labeling
+  as a 'createYDataFrame' stage, with the rows dropped for missing values.
+  """
+  with activateInstrumentation(instrumentation), instrumentStage('createYDataFrame', len(xDataFrame)) as stage:
+    yDataFrame = labelYDataFrame(xDataFrame, monthsWithinBankruptcy, dropNA, featuresToKeep, keepMonthsUntilBankruptcy, compactLayout)
+    recordOutputRows(stage, yDataFrame)
+
+  return yDataFrame
+
+def labelYDataFrame(xDataFrame, monthsWithinBankruptcy, dropNA, featuresToKeep, keepMonthsUntilBankruptcy, compactLayout):
+  """
+  Label the X-Dataframe's firm-months (see createYDataFrame)
   """
   # Create Y-Dataframe
   yDataFrame = xDataFrame.copy()
 
   if dropNA:
     # Drop NAs
+    rowsBefore = len(yDataFrame)
     yDataFrame = yDataFrame.dropna()
+    recordFilter('dropNA', rowsBefore, len(yDataFrame))
 
   # Format Deletion Date
   yDataFrame['dldte'] = pd.to_datetime(yDataFrame['dldte'])
 
-  # Convert Date to Month Period
+  # Convert Date to Month Period (or int32 Month Ordinal)
+  if compactLayout is None:
+    compactLayout = pd.api.types.is_integer_dtype(yDataFrame['date_month'].dtype)
   yDataFrame['dldte_month'] = yDataFrame['dldte'].dt.to_period('m')
+  if compactLayout:
+    yDataFrame = compactPanel(yDataFrame)
 
 
-  monthsWithinBankruptcy = monthsWithinBankruptcy
-  bankruptcyIndicators = []
-
-  for monthLag in monthsWithinBankruptcy:
-    # Determine new column name
-    colName = f'bankruptcyWithin{monthLag}Months'
-
-    # Append Bankruptcy Indicator to list
-    bankruptcyIndicators.append(colName)
-
-    # Initially Fill Columns to 0
-    yDataFrame[colName] = 0
+  # Months until Bankruptcy (Integer Month Ordinals)
+  monthsUntilBankruptcy, hasBankruptcy = calculateMonthsUntilBankruptcy(yDataFrame['date_month'],
+                                                                        yDataFrame['dldte_month'],
+                                                                        yDataFrame['dlrsn']
+                                                                        )
 
-    # Update indicator
-    #yDataFrame.update(yDataFrame[yDataFrame['dlrsn']==2].apply(bankruptcyWithinNMonths, axis=1, args=(monthLag, 0)))
-    yDataFrame.loc[yDataFrame['dlrsn']==2, colName] = yDataFrame[yDataFrame['dlrsn']==2].apply(bankruptcyWithinNMonths, axis=1, args=(monthLag, 0))
+  # Create Indicators for every horizon at once
+  bankruptcyIndicators = [bankruptcyIndicatorColumn(monthLag) for monthLag in monthsWithinBankruptcy]
+  indicators = bankruptcyWithinNMonthsIndicators(monthsUntilBankruptcy, hasBankruptcy, monthsWithinBankruptcy, np.int8 if compactLayout else np.int64)
+  for i, colName in enumerate(bankruptcyIndicators):
+    yDataFrame[colName] = indicators[:, i]
 
   # Keep only desired features
-  featuresToKeep = featuresToKeep
+  featuresToKeep = featuresToKeep.copy()
+  if keepMonthsUntilBankruptcy:
+    yDataFrame['monthsUntilBankruptcy'] = pd.Series(monthsUntilBankruptcy, index=yDataFrame.index, dtype='Int32' if compactLayout else 'Int64').where(hasBankruptcy)
+    featuresToKeep.append('monthsUntilBankruptcy')
   featuresToKeep.extend(bankruptcyIndicators)
   yDataFrame = yDataFrame[featuresToKeep]
   
@@ -0,0 +1,140 @@
+"""
+Wrapper that cleans explanatory variables cross-sectionally: infinities are
+replaced, values are winsorized at per-month quantiles and missing values
+are imputed, for all selected columns in one grouped pass
+10-18-2026
+"""
+
+import numpy as np
+
+from panelKeysWrapper import firmMonthKey, monthPeriodToOrdinal, firmBlockStarts, forwardFillByBlock
+
+
+# Columns imputed in Final_Dataframe_Creation_(NEW).ipynb
+IMPUTATION_COLUMNS = ['NITA', 'NIMTA', 'TLTA', 'TLMTA', 'RSIZE', 'CASHMTA', 'EXRET', 'SIGMA',
+                      'NWC', 'NWCTA', 'NWCMTA', 'EBIT', 'EBITTA', 'EBITMTA',
+                      'MVTL', 'MVLTD', 'MVSTD', 'STA', 'SMTA', 'OM', 'GA',
+                      'GS', 'ROE', 'CROE', 'PB', 'CPB'
+                      ]
+
+# Imputation Methods, applied in the order given:
+#   'ffill'  - the firm's latest earlier value (as the notebook)
+#   'median' - the month's cross-sectional median of the observed values
+IMPUTATION_METHODS = ['ffill', 'median']
+
+
+def groupedQuantiles(values, groupIndex, nGroups, quantiles):
+  """
+  Quantiles of every column of a (rows x columns) matrix within every group
+  (groupIndex in [0, nGroups)), ignoring missing values and interpolating
+  linearly as pandas' quantile.
+
+  Rows are ordered by group once (a linear radix sort of the small group
+  index) and each group's block of rows is sorted for all columns at once,
+  so no column is sorted over the whole panel. Returns a
+  (quantiles x groups x columns) array, missing for groups without
+  observed values.
+  """
+  quantiles = np.asarray(quantiles, dtype=np.float64)
+  groupIndex = groupIndex.astype(np.int16 if nGroups <= np.iinfo(np.int16).max else np.int32)
+  order = np.argsort(groupIndex, kind='stable')
+  groupEnds = np.cumsum(np.bincount(groupIndex, minlength=nGroups))
+  columns = np.arange(values.shape[1])
+
+  groupQuantiles = np.full((len(quantiles), nGroups, values.shape[1]), np.nan)
+  for group, (groupStart, groupEnd) in enumerate(zip(np.concatenate([[0], groupEnds[:-1]]), groupEnds)):
+    # Sort the Group's Rows, Missing Last
+    groupValues = np.sort(values[order[groupStart:groupEnd]], axis=0)
+    observedCount = len(groupValues) - np.isnan(groupValues).sum(axis=0)
+
+    # Interpolate between the Neighbouring Order Statistics
+    position = quantiles[:, None]*np.maximum(observedCount - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(observedCount - 1, 0))
+    lowerValues = groupValues[lower, columns]
+    upperValues = groupValues[upper, columns]
+    groupQuantiles[:, group, :] = np.where(observedCount > 0, lowerValues + (upperValues - lowerValues)*(position - lower), np.nan)
+
+  return groupQuantiles
+
+def cleanValues(values,
+                PERMNO,
+                monthOrdinal,
+                winsorizeQuantiles=[0.05, 0.95],
+                imputationMethods=['ffill']
+                ):
+  """
+  Clean a (rows x columns) float matrix of a PERMNO/month panel in place:
+
+    1. infinities become missing
+    2. values are clipped to the month's winsorizeQuantiles (lower, upper)
+       of the column (no clipping if None)
+    3. missing values are imputed by each of imputationMethods in turn (see
+       IMPUTATION_METHODS)
+
+  Per-month quantiles (and medians) of every column come from one grouped
+  pass (see groupedQuantiles). Returns values.
+  """
+  unknownMethods = set(imputationMethods) - set(IMPUTATION_METHODS)
+  if unknownMethods:
+    raise ValueError(f'Unknown imputation methods {sorted(unknownMethods)}, expected some of {IMPUTATION_METHODS}')
+
+  values[np.isinf(values)] = np.nan
+
+  # Per-Month Quantiles of every Column
+  months, groupIndex = np.unique(monthOrdinal, return_inverse=True)
+  quantiles = list(winsorizeQuantiles or []) + (['median'] if 'median' in imputationMethods else [])
+  groupQuantiles = groupedQuantiles(values, groupIndex, len(months), [0.5 if quantile == 'median' else quantile for quantile in quantiles])
+
+  # Winsorize
+  if winsorizeQuantiles:
+    with np.errstate(invalid='ignore'):
+      np.clip(values, groupQuantiles[0][groupIndex], groupQuantiles[1][groupIndex], out=values)
+
+  # Impute
+  for method in imputationMethods:
+    if method == 'ffill':
+      permno = np.asarray(PERMNO).astype(np.int64)
+      order = np.argsort(firmMonthKey(permno, monthOrdinal), kind='stable')
+      isBlockStart = firmBlockStarts(permno[order])
+      for column in range(values.shape[1]):
+        values[order, column] = forwardFillByBlock(values[order, column], isBlockStart)
+    elif method == 'median':
+      isMissing = np.isnan(values)
+      values[isMissing] = groupQuantiles[-1][groupIndex][isMissing]
+
+  return values
+
+def cleanExplanatoryVariables(explanatoryDataFrame,
+                              cleaningColumns=IMPUTATION_COLUMNS,
+                              winsorizeQuantiles=[0.05, 0.95],
+                              imputationMethods=['ffill']
+                              ):
+  """
+  Replace infinities, winsorize per month and impute the cleaningColumns of
+  an X-Dataframe (see cleanValues); columns missing from the Dataframe are
+  skipped.
+
+  The selected columns are gathered into one column-major float64 matrix,
+  cleaned together and written back in their own dtypes, so the Dataframe
+  is updated in place rather than copied once per column.
+  """
+  cleaningColumns = [column for column in cleaningColumns if column in explanatoryDataFrame.columns]
+  if not cleaningColumns or len(explanatoryDataFrame) == 0:
+    return explanatoryDataFrame
+
+  values = np.empty((len(explanatoryDataFrame), len(cleaningColumns)), dtype=np.float64, order='F')
+  for i, column in enumerate(cleaningColumns):
+    values[:, i] = explanatoryDataFrame[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+  cleanValues(values,
+              explanatoryDataFrame['PERMNO'],
+              monthPeriodToOrdinal(explanatoryDataFrame['date_month']),
+              winsorizeQuantiles,
+              imputationMethods
+              )
+
+  for i, column in enumerate(cleaningColumns):
+    explanatoryDataFrame[column] = values[:, i].astype(explanatoryDataFrame[column].dtype, copy=False)
+
+  return explanatoryDataFrame
@@ -0,0 +1,142 @@
+"""
+Wrapper that scores distress probabilities of every firm-month of the X panel
+with fitted logit coefficients, for every horizon at once
+10-18-2026
+"""
+
+import os
+import json
+
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# Coefficient Files hold one row per horizon (months, as the
+# monthsWithinBankruptcy of createYDataFrame): the horizon, the intercept and
+# one coefficient per feature, e.g. a CSV
+#   horizon,intercept,NIMTA,TLMTA,EXRET,SIGMA,RSIZE,CASHMTA
+#   12,-9.08,-29.67,3.36,-7.35,1.48,0.08,-2.40
+# or JSON {"12": {"intercept": -9.08, "NIMTA": -29.67, ...}, ...}
+LOGIT_HORIZON_COLUMN = 'horizon'
+LOGIT_INTERCEPT_COLUMN = 'intercept'
+
+
+def distressProbabilityColumn(horizon):
+  """
+  Name of the probability column of a horizon (as bankruptcyWithinNMonths)
+  """
+  return f'probabilityWithin{horizon}Months'
+
+def loadLogitCoefficients(coefficients):
+  """
+  Load fitted logit coefficients from a CSV or JSON file (see
+  LOGIT_HORIZON_COLUMN), a dict {horizon: {name: coefficient}} or a
+  Dataframe with a horizon column or index.
+
+  Returns the horizons, the features, the intercepts (one per horizon) and
+  the (features x horizons) coefficient matrix. Features without a
+  coefficient for a horizon get 0.
+  """
+  if isinstance(coefficients, (str, os.PathLike)):
+    if str(coefficients).endswith('.json'):
+      with open(coefficients) as coefficientFile:
+        coefficients = json.load(coefficientFile)
+    else:
+      coefficients = pd.read_csv(coefficients)
+  if isinstance(coefficients, dict):
+    coefficients = pd.DataFrame.from_dict(coefficients, orient='index')
+  if LOGIT_HORIZON_COLUMN in coefficients.columns:
+    coefficients = coefficients.set_index(LOGIT_HORIZON_COLUMN)
+
+  coefficients = coefficients.fillna(0)
+  horizons = [int(horizon) for horizon in coefficients.index]
+  features = [column for column in coefficients.columns if column != LOGIT_INTERCEPT_COLUMN]
+  intercepts = coefficients[LOGIT_INTERCEPT_COLUMN].to_numpy(dtype=np.float64) if LOGIT_INTERCEPT_COLUMN in coefficients.columns else np.zeros(len(horizons))
+  coefficientMatrix = np.ascontiguousarray(coefficients[features].to_numpy(dtype=np.float64).T)
+
+  return horizons, features, intercepts, coefficientMatrix
+
+def logisticProbabilities(logits):
+  """
+  1 / (1 + exp(-logits)), without overflow for large logits
+  """
+  with np.errstate(invalid='ignore'):
+    return np.exp(-np.logaddexp(0, -logits))
+
+def scoreFeatureMatrix(featureMatrix, intercepts, coefficientMatrix):
+  """
+  Probabilities of every row of a (rows x features) matrix for every
+  horizon, as one matrix product. Rows with a missing feature get missing
+  probabilities.
+  """
+  return logisticProbabilities(featureMatrix @ coefficientMatrix + intercepts)
+
+def iteratePanelChunks(panel, columns, chunkSize):
+  """
+  Yield the columns of a panel in Dataframes of at most chunkSize rows.
+  panel is a Dataframe or the path of a Parquet or Arrow IPC (Feather) file
+  or directory (e.g. the partitions written by createXDataFrameByPartition),
+  which is read one batch at a time.
+  """
+  if isinstance(panel, pd.DataFrame):
+    for start in range(0, len(panel), chunkSize):
+      # Slice Rows first, so each Chunk copies only its own Rows
+      yield panel.iloc[start:start + chunkSize][columns]
+    return
+
+  panelPath = str(panel)
+  isParquet = panelPath.endswith('.parquet') or (os.path.isdir(panelPath) and any(name.endswith('.parquet') for name in os.listdir(panelPath)))
+  dataset = ds.dataset(panelPath, format='parquet' if isParquet else 'ipc', exclude_invalid_files=True)
+  for batch in dataset.to_batches(columns=columns, batch_size=chunkSize):
+    yield batch.to_pandas()
+
+def scoreDistressProbabilities(panel, coefficients, chunkSize=1000000, outputPath=None, floatDtype=np.float64):
+  """
+  Score the distress probability of every firm-month of an X panel (a
+  Dataframe or a Parquet/Arrow path, see iteratePanelChunks) for every
+  horizon of the fitted logit coefficients (see loadLogitCoefficients).
+
+  The panel is streamed in chunks of chunkSize rows; each chunk's features
+  are gathered into one contiguous float64 matrix and scored for all
+  horizons with one matrix product, so memory is bounded by the chunk size.
+
+  Returns a Dataframe of PERMNO, date_month and one probability column per
+  horizon (see distressProbabilityColumn), stored as floatDtype, or, with an
+  outputPath, writes it there as Parquet chunk by chunk and returns the path.
+  """
+  horizons, features, intercepts, coefficientMatrix = loadLogitCoefficients(coefficients)
+  probabilityColumns = [distressProbabilityColumn(horizon) for horizon in horizons]
+
+  scoredChunks = []
+  writer = None
+  try:
+    for chunk in iteratePanelChunks(panel, ['PERMNO', 'date_month'] + features, chunkSize):
+      featureMatrix = np.empty((len(chunk), len(features)), dtype=np.float64)
+      for i, feature in enumerate(features):
+        featureMatrix[:, i] = chunk[feature].to_numpy(dtype=np.float64, na_value=np.nan)
+
+      probabilities = scoreFeatureMatrix(featureMatrix, intercepts, coefficientMatrix).astype(floatDtype, copy=False)
+      scoredChunk = pd.DataFrame(probabilities, columns=probabilityColumns)
+      scoredChunk.insert(0, 'date_month', chunk['date_month'].array)
+      scoredChunk.insert(0, 'PERMNO', chunk['PERMNO'].array)
+
+      if outputPath is None:
+        scoredChunks.append(scoredChunk)
+      else:
+        scoredTable = pa.Table.from_pandas(scoredChunk, preserve_index=False)
+        if writer is None:
+          writer = pq.ParquetWriter(outputPath, scoredTable.schema)
+        writer.write_table(scoredTable)
+  finally:
+    if writer is not None:
+      writer.close()
+
+  if outputPath is not None:
+    return outputPath
+  if not scoredChunks:
+    return pd.DataFrame(columns=['PERMNO', 'date_month'] + probabilityColumns)
+
+  return pd.concat(scoredChunks, ignore_index=True)
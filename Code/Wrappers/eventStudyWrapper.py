@@ -0,0 +1,232 @@
+"""
+Wrapper that aligns firms' returns in event time (months relative to
+bankruptcy or delisting) and summarizes them over windows and groups
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import monthPeriodToOrdinal, monthOrdinalToPeriod
+
+
+# Default Windows (first, last month relative to the event, inclusive): the
+# average return over the previous 1 to 4 months up to the event month
+EVENT_WINDOWS = {'prev1months': (0, 0),
+                 'prev2months': (-1, 0),
+                 'prev3months': (-2, 0),
+                 'prev4months': (-3, 0)
+                 }
+
+# Statistics calculated per event and window
+EVENT_STATISTICS = ['observations', 'averageReturn', 'cumulativeReturn', 'averageAbnormalReturn', 'cumulativeAbnormalReturn']
+
+
+def firmEvents(panelDataFrame, isEventRow=None, eventDateColumn=None, eventName='event', eventAttributes=[]):
+  """
+  One event per firm of a PERMNO/date_month panel.
+
+  Event firms are the firms with any row in isEventRow (a boolean mask over
+  the panel's rows, e.g. panel['dlrsn'] == 2; every firm by default). The
+  event month is the month of the firm's first eventDateColumn value (e.g.
+  'dldte') or, by default, the firm's last month in the panel (its
+  last_date_existance). eventAttributes are columns taken from the firm's
+  last row (e.g. 'SICCD', 'exchg') for grouping.
+
+  Returns a Dataframe of PERMNO, eventMonth, eventName, decade and the
+  eventAttributes.
+  """
+  permno = panelDataFrame['PERMNO'].to_numpy().astype(np.int64)
+  month = monthPeriodToOrdinal(panelDataFrame['date_month'])
+  if isEventRow is None:
+    isEventRow = np.ones(len(panelDataFrame), dtype=bool)
+  eventFirms = np.unique(permno[np.asarray(isEventRow, dtype=bool)])
+
+  # Rows of Event Firms in (PERMNO, Month) Order
+  isEventFirm = np.isin(permno, eventFirms)
+  rows = np.flatnonzero(isEventFirm)
+  rows = rows[np.lexsort((month[rows], permno[rows]))]
+  isLastRow = np.ones(len(rows), dtype=bool)
+  isLastRow[:-1] = permno[rows][1:] != permno[rows][:-1]
+  lastRows = rows[isLastRow]
+
+  events = pd.DataFrame({'PERMNO': permno[lastRows], 'eventMonth': month[lastRows]})
+  if eventDateColumn is not None:
+    eventDates = pd.to_datetime(panelDataFrame[eventDateColumn].iloc[rows], errors='coerce')
+    eventDateMonth = pd.Series(monthPeriodToOrdinal(eventDates.dt.to_period('m')), dtype=np.float64).where(eventDates.notna().to_numpy())
+    firstEventMonth = eventDateMonth.groupby(permno[rows]).first()
+    events['eventMonth'] = events['PERMNO'].map(firstEventMonth)
+    events = events.dropna(subset=['eventMonth'])
+    events['eventMonth'] = events['eventMonth'].astype(np.int64)
+    lastRows = lastRows[events.index.to_numpy()]
+    events = events.reset_index(drop=True)
+
+  for attribute in eventAttributes:
+    events[attribute] = panelDataFrame[attribute].to_numpy()[lastRows]
+  events['eventName'] = eventName
+  events['decade'] = (1970 + events['eventMonth'] // 12) // 10 * 10
+  events['eventMonth'] = monthOrdinalToPeriod(events['eventMonth'].to_numpy())
+
+  return events
+
+def eventTimeMatrix(PERMNO, DATE_MONTH, values, eventPermno, eventMonth, minOffset=-12, maxOffset=0):
+  """
+  Align panel values in event time: a dense (events x offsets) matrix whose
+  row i, column k is the value of event i's firm in the month
+  minOffset + k months from its event month (missing where the firm has no
+  row). A firm may have several events (e.g. under different definitions).
+  """
+  permno = np.asarray(PERMNO).astype(np.int64)
+  month = monthPeriodToOrdinal(DATE_MONTH)
+  values = np.asarray(values, dtype=np.float64)
+  eventPermno = np.asarray(eventPermno).astype(np.int64)
+  eventMonth = monthPeriodToOrdinal(eventMonth)
+
+  # Events of each Panel Row's Firm
+  eventOrder = np.argsort(eventPermno, kind='mergesort')
+  sortedEventPermno = eventPermno[eventOrder]
+  eventStart = np.searchsorted(sortedEventPermno, permno, side='left')
+  eventCount = np.searchsorted(sortedEventPermno, permno, side='right') - eventStart
+  rowIndex = np.repeat(np.arange(len(permno)), eventCount)
+  eventIndex = eventOrder[np.repeat(eventStart - (np.cumsum(eventCount) - eventCount), eventCount) + np.arange(eventCount.sum())]
+
+  # Scatter Rows within the Offsets into the Matrix
+  offset = month[rowIndex] - eventMonth[eventIndex]
+  isInWindow = (offset >= minOffset) & (offset <= maxOffset)
+  matrix = np.full((len(eventPermno), maxOffset - minOffset + 1), np.nan)
+  matrix[eventIndex[isInWindow], offset[isInWindow] - minOffset] = values[rowIndex[isInWindow]]
+
+  return matrix
+
+def windowSums(matrix, windowStart, windowEnd):
+  """
+  Sums and counts of the non-missing values of every matrix row over every
+  window of columns [windowStart, windowEnd], from cumulative sums (an
+  (rows x windows) array each)
+  """
+  isObserved = ~np.isnan(matrix)
+  cumulativeSum = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+  cumulativeSum[:, 1:] = np.cumsum(np.where(isObserved, matrix, 0), axis=1)
+  cumulativeCount = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.int64)
+  cumulativeCount[:, 1:] = np.cumsum(isObserved, axis=1)
+
+  sums = cumulativeSum[:, windowEnd + 1] - cumulativeSum[:, windowStart]
+  counts = cumulativeCount[:, windowEnd + 1] - cumulativeCount[:, windowStart]
+
+  return sums, counts
+
+def calculateEventStatistics(panelDataFrame,
+                             events,
+                             returnColumn='ADJRET',
+                             benchmarkColumn=None,
+                             windows=EVENT_WINDOWS,
+                             minObservations=None
+                             ):
+  """
+  Event study statistics of every event (see firmEvents) over every window
+  at once.
+
+  Returns (returnColumn) of the panel are aligned in event time (see
+  eventTimeMatrix) and reduced over each window: the number of observed
+  months, the average return, the cumulative return (compounded) and, with
+  a benchmarkColumn (e.g. 'vwretdSP500'), the average and cumulative
+  abnormal return (return less benchmark). A window needs minObservations
+  observed months (by default every month of the window).
+
+  Returns one row per event and window: the event columns, window and
+  EVENT_STATISTICS.
+  """
+  windowNames = list(windows)
+  windowStart = np.array([windows[name][0] for name in windowNames], dtype=np.int64)
+  windowEnd = np.array([windows[name][1] for name in windowNames], dtype=np.int64)
+  minOffset, maxOffset = int(windowStart.min()), int(windowEnd.max())
+  windowStart, windowEnd = windowStart - minOffset, windowEnd - minOffset
+
+  def alignEvents(column):
+    """
+    Event time matrix of a panel column
+    """
+    return eventTimeMatrix(panelDataFrame['PERMNO'],
+                           panelDataFrame['date_month'],
+                           panelDataFrame[column],
+                           events['PERMNO'],
+                           events['eventMonth'],
+                           minOffset,
+                           maxOffset
+                           )
+
+  # Window Reductions of Returns, Log Returns and Abnormal Returns
+  returns = alignEvents(returnColumn)
+  returnSums, observations = windowSums(returns, windowStart, windowEnd)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    logReturnSums, _ = windowSums(np.log1p(returns), windowStart, windowEnd)
+    statistics = {'observations': observations,
+                  'averageReturn': returnSums / observations,
+                  'cumulativeReturn': np.expm1(logReturnSums)
+                  }
+    if benchmarkColumn is not None:
+      abnormalReturnSums, abnormalObservations = windowSums(returns - alignEvents(benchmarkColumn), windowStart, windowEnd)
+      statistics['averageAbnormalReturn'] = abnormalReturnSums / abnormalObservations
+      statistics['cumulativeAbnormalReturn'] = np.where(abnormalObservations > 0, abnormalReturnSums, np.nan)
+    else:
+      statistics['averageAbnormalReturn'] = np.full(observations.shape, np.nan)
+      statistics['cumulativeAbnormalReturn'] = np.full(observations.shape, np.nan)
+
+  # Windows without enough Observed Months are Missing
+  windowLength = windowEnd - windowStart + 1
+  requiredObservations = windowLength[None, :] if minObservations is None else max(minObservations, 1)
+  isComplete = observations >= requiredObservations
+  for name in EVENT_STATISTICS[1:]:
+    statistics[name] = np.where(isComplete, statistics[name], np.nan)
+
+  # One Row per Event and Window
+  eventStatistics = events.iloc[np.repeat(np.arange(len(events)), len(windowNames))].reset_index(drop=True)
+  eventStatistics['window'] = pd.Categorical(np.tile(windowNames, len(events)), categories=windowNames)
+  for name in EVENT_STATISTICS:
+    eventStatistics[name] = statistics[name].ravel()
+
+  return eventStatistics
+
+def summarizeEventStatistics(eventStatistics, groupColumns=['eventName', 'decade'], statistics=['averageReturn']):
+  """
+  Summarize event statistics per window and group (e.g. eventName, decade,
+  an industry or exchange column): the number of events with a value, the
+  mean and the quartiles of each statistic, plus the box plot whisker
+  limits (1.5 interquartile ranges from the quartiles)
+  """
+  grouped = eventStatistics.groupby(list(groupColumns) + ['window'], observed=True, sort=True)[statistics]
+  q1, q3 = grouped.quantile(0.25), grouped.quantile(0.75)
+  summary = pd.concat({'count': grouped.count(),
+                       'mean': grouped.mean(),
+                       'minimum': q1 - 1.5*(q3 - q1),
+                       'q1': q1,
+                       'median': grouped.median(),
+                       'q3': q3,
+                       'maximum': q3 + 1.5*(q3 - q1)
+                       }, axis=1)
+
+  return summary.swaplevel(axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+
+def runEventStudy(panelDataFrame,
+                  eventDefinitions,
+                  returnColumn='ADJRET',
+                  benchmarkColumn=None,
+                  windows=EVENT_WINDOWS,
+                  groupColumns=['eventName', 'decade'],
+                  minObservations=None
+                  ):
+  """
+  Run an event study over several event definitions at once.
+  eventDefinitions maps each event name to the firmEvents arguments
+  (isEventRow, eventDateColumn, eventAttributes) defining it.
+
+  Returns the per event statistics (see calculateEventStatistics) and their
+  summary per group (see summarizeEventStatistics).
+  """
+  events = pd.concat([firmEvents(panelDataFrame, eventName=eventName, **definition) for eventName, definition in eventDefinitions.items()],
+                     ignore_index=True
+                     )
+  eventStatistics = calculateEventStatistics(panelDataFrame, events, returnColumn, benchmarkColumn, windows, minObservations)
+  summary = summarizeEventStatistics(eventStatistics, groupColumns, ['averageReturn', 'cumulativeReturn', 'averageAbnormalReturn', 'cumulativeAbnormalReturn'])
+
+  return eventStatistics, summary
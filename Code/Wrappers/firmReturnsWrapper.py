@@ -0,0 +1,96 @@
+"""
+Wrapper that calculates adjusted prices and returns per firm (PERMNO) in one
+segmented pass over contiguous firm blocks
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import firmMonthKey, monthPeriodToOrdinal, firmBlockStarts, forwardFillByBlock
+
+
+# Columns added by addFirmReturns
+FIRM_RETURN_COLUMNS = ['ADJPRC', 'ADJRET', 'LOGRET', 'EXRET']
+
+
+def calculateFirmReturns(PERMNO, DATE_MONTH, PRC, CFACPR, VWRETDSP500=None):
+  """
+  Calculate adjusted prices and returns per firm.
+
+  Rows are put in (PERMNO, month) order once (a no-op for panels already in
+  that order), then in one pass over the firm blocks:
+    - ADJPRC: |PRC| * CFACPR (CRSP gives the bid/ask average of months
+      without trades as a negative PRC), zero or missing prices missing,
+      forward filled within the firm
+    - ADJRET: simple return of ADJPRC over the firm's previous month
+    - LOGRET: log return of ADJPRC over the firm's previous month
+    - EXRET: LOGRET - log(1 + VWRETDSP500), if VWRETDSP500 is given
+  A firm's first month has no returns. Repeated firm-months (e.g. from
+  several quarter records) all return over the previous distinct month.
+
+  Returns a Dataframe of these columns in the input row order.
+  """
+  permno = np.asarray(PERMNO).astype(np.int64)
+  key = firmMonthKey(permno, monthPeriodToOrdinal(DATE_MONTH))
+  with np.errstate(invalid='ignore'):
+    adjustedPrice = np.abs(np.asarray(PRC, dtype=np.float64)) * np.asarray(CFACPR, dtype=np.float64)
+    adjustedPrice[~(adjustedPrice > 0)] = np.nan
+
+  # Sort into Firm Blocks (stable, skipped if already sorted)
+  order = None
+  if np.any(key[1:] < key[:-1]):
+    order = np.argsort(key, kind='mergesort')
+    key = key[order]
+    permno = permno[order]
+    adjustedPrice = adjustedPrice[order]
+
+  # Forward Fill Prices within each Firm
+  isBlockStart = firmBlockStarts(permno)
+  adjustedPrice = forwardFillByBlock(adjustedPrice, isBlockStart)
+
+  # Price of the Firm's Previous Month (Repeated Firm-Months share it)
+  isMonthStart = np.ones(len(key), dtype=bool)
+  isMonthStart[1:] = key[1:] != key[:-1]
+  monthStart = np.maximum.accumulate(np.where(isMonthStart, np.arange(len(key)), 0))
+  hasPrevious = ~isBlockStart[monthStart]
+  previousPrice = np.where(hasPrevious, adjustedPrice[np.maximum(monthStart - 1, 0)], np.nan)
+
+  # Returns
+  firmReturns = {'ADJPRC': adjustedPrice}
+  with np.errstate(divide='ignore', invalid='ignore'):
+    firmReturns['ADJRET'] = adjustedPrice / previousPrice - 1
+    firmReturns['LOGRET'] = np.log(adjustedPrice) - np.log(previousPrice)
+  if VWRETDSP500 is not None:
+    marketReturn = np.asarray(VWRETDSP500, dtype=np.float64)
+    if order is not None:
+      marketReturn = marketReturn[order]
+    with np.errstate(divide='ignore', invalid='ignore'):
+      firmReturns['EXRET'] = firmReturns['LOGRET'] - np.log1p(marketReturn)
+
+  # Back to Input Row Order
+  if order is not None:
+    for name, values in firmReturns.items():
+      unsorted = np.empty_like(values)
+      unsorted[order] = values
+      firmReturns[name] = unsorted
+
+  return pd.DataFrame(firmReturns, index=getattr(PERMNO, 'index', None))
+
+def addFirmReturns(explanatoryDataFrame, marketReturnColumn='vwretdSP500'):
+  """
+  Add ADJPRC, ADJRET, LOGRET and EXRET (see calculateFirmReturns) to an
+  explanatory Dataframe with PERMNO, date_month, PRC, CFACPR and the market
+  return column, without copying or merging it
+  """
+  marketReturn = explanatoryDataFrame[marketReturnColumn] if marketReturnColumn in explanatoryDataFrame.columns else None
+  firmReturns = calculateFirmReturns(explanatoryDataFrame['PERMNO'],
+                                     explanatoryDataFrame['date_month'],
+                                     explanatoryDataFrame['PRC'],
+                                     explanatoryDataFrame['CFACPR'],
+                                     marketReturn
+                                     )
+  for name in firmReturns.columns:
+    explanatoryDataFrame[name] = firmReturns[name].to_numpy()
+
+  return explanatoryDataFrame
@@ -0,0 +1,407 @@
+"""
+Wrapper that updates persisted X- and Y-Dataframes with monthly delta
+extracts, recomputing only the firm-months the delta affects
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from createXDataframeWrapper import createXDataFrame, decayedAverageExpression, DECAYED_AVERAGE_WINDOW_MONTHS
+from panelKeysWrapper import firmMonthKey, monthPeriodToOrdinal, FIRM_MONTH_KEY_STRIDE, FIRM_MONTH_KEY_OFFSET
+from createYDataframeWrapper import createYDataFrame
+from wrdsParquetWrapper import loadRawDataframes
+from compactPanelWrapper import concatPanels
+
+
+# Raw extracts in createXDataFrame order, with the PERMNO column of each and
+# the columns identifying a record (a delta record replaces the stored record
+# with the same key, e.g. a restated quarter)
+RAW_EXTRACT_NAMES = ['CRSP_COMPUSTAT_MERGED', 'CRSP_MONTHLY', 'CRSP_DAILY', 'SP500_MONTHLY']
+RAW_PERMNO_COLUMNS = {'CRSP_COMPUSTAT_MERGED': 'LPERMNO', 'CRSP_MONTHLY': 'PERMNO', 'CRSP_DAILY': 'PERMNO', 'SP500_MONTHLY': None}
+RAW_DATE_COLUMNS = {'CRSP_COMPUSTAT_MERGED': 'datacqtr', 'CRSP_MONTHLY': 'date', 'CRSP_DAILY': 'date', 'SP500_MONTHLY': 'caldt'}
+RAW_RECORD_KEYS = {'CRSP_COMPUSTAT_MERGED': ['LPERMNO', 'GVKEY', 'datacqtr'],
+                   'CRSP_MONTHLY': ['PERMNO', 'date'],
+                   'CRSP_DAILY': ['PERMNO', 'date'],
+                   'SP500_MONTHLY': ['caldt']
+                   }
+
+
+def rawMonthOrdinal(rawDataframe, extractName):
+  """
+  Month ordinal of every row of a raw extract: the quarter end month for
+  CRSP/COMPUSTAT Merged ('YYYYQn' datacqtr), the calendar month otherwise.
+  Missing dates map to the minimum int64 value.
+  """
+  dates = rawDataframe[RAW_DATE_COLUMNS[extractName]]
+  if extractName == 'CRSP_COMPUSTAT_MERGED':
+    datacqtr = dates.astype('string')
+    quarters = pd.PeriodIndex(datacqtr.str.slice(0,4) + '-' + datacqtr.str.slice(4), freq='Q')
+    return quarters.asfreq('M', 'end').asi8
+
+  return monthPeriodToOrdinal(pd.to_datetime(dates).dt.to_period('m'))
+
+def rawFirmMonths(rawDataframe, extractName):
+  """
+  (PERMNO, month ordinal) of every row of a firm-level raw extract that has
+  both
+  """
+  permno = pd.to_numeric(rawDataframe[RAW_PERMNO_COLUMNS[extractName]], errors='coerce').to_numpy(dtype=np.float64)
+  month = rawMonthOrdinal(rawDataframe, extractName)
+  isValid = ~np.isnan(permno) & (month != np.iinfo(np.int64).min)
+
+  return permno[isValid].astype(np.int64), month[isValid]
+
+def deletionChangedFirms(previousXDataFrame, deltaCompustatMerged):
+  """
+  PERMNOs whose deletion reason (dlrsn) or date (dldte) in the delta
+  CRSP/COMPUSTAT Merged extract differs from the one in the X-Dataframe.
+  Needs dlrsn and dldte in both; firms new to the X-Dataframe are not
+  counted.
+  """
+  deletionColumns = ['dlrsn', 'dldte']
+  if not (set(deletionColumns) <= set(previousXDataFrame.columns) and set(deletionColumns) <= set(deltaCompustatMerged.columns)):
+    return np.empty(0, dtype=np.int64)
+
+  # Latest Deletion Information per Firm
+  previousDeletion = previousXDataFrame[['PERMNO'] + deletionColumns].drop_duplicates('PERMNO', keep='last')
+  deltaDeletion = deltaCompustatMerged[['LPERMNO', 'datacqtr'] + deletionColumns].dropna(subset=['LPERMNO'])
+  deltaDeletion = deltaDeletion.sort_values('datacqtr', kind='mergesort').drop_duplicates('LPERMNO', keep='last')
+  deltaDeletion = deltaDeletion.assign(LPERMNO=pd.to_numeric(deltaDeletion['LPERMNO']))
+  deletion = deltaDeletion.merge(previousDeletion, left_on='LPERMNO', right_on='PERMNO', suffixes=('', 'Previous'))
+
+  # Compare (Missing equals Missing)
+  dlrsn = pd.to_numeric(deletion['dlrsn'], errors='coerce')
+  dlrsnPrevious = pd.to_numeric(deletion['dlrsnPrevious'], errors='coerce')
+  dldte = pd.to_datetime(deletion['dldte'])
+  dldtePrevious = pd.to_datetime(deletion['dldtePrevious'])
+  dlrsnChanged = ~((dlrsn == dlrsnPrevious) | (dlrsn.isna() & dlrsnPrevious.isna()))
+  dldteChanged = ~((dldte == dldtePrevious) | (dldte.isna() & dldtePrevious.isna()))
+
+  return np.unique(deletion.loc[dlrsnChanged | dldteChanged, 'LPERMNO'].to_numpy().astype(np.int64))
+
+def affectedFirmMonthKeys(previousXDataFrame,
+                          deltaRawDataframes,
+                          monthsToLagAccountingVariables=2,
+                          monthsAccountingVariablesValid=3,
+                          calculateSigma=False,
+                          sigmaWindowMonths=3,
+                          deletionChanged=None,
+                          returnLookbackMonths=12,
+                          averageWindowMonths=1
+                          ):
+  """
+  Sorted, unique firmMonthKey of every (PERMNO, month) whose X-Dataframe row
+  the delta extracts (in createXDataFrame order) can change:
+
+    - new or revised CRSP Monthly months, and the following
+      returnLookbackMonths months (returns, e.g. EXRET, are over the firm's
+      previous month in the panel, with prices forward filled)
+    - the months in which a new or restated quarter is valid, i.e. its
+      quarter end month plus monthsToLagAccountingVariables up to
+      monthsAccountingVariablesValid months on
+    - the months whose SIGMA includes new daily data (the following
+      sigmaWindowMonths months with calculateSigma)
+    - every firm in a month with new SP500 returns
+    - every month of the firms in deletionChanged
+  and, for variables averaged over averageWindowMonths months (e.g.
+  NIMTAAVG), the following averageWindowMonths - 1 months of each.
+  """
+  CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY = deltaRawDataframes
+  previousPermno = previousXDataFrame['PERMNO'].to_numpy().astype(np.int64)
+  previousMonth = monthPeriodToOrdinal(previousXDataFrame['date_month'])
+
+  affectedKeys = [np.empty(0, dtype=np.int64)]
+
+  # New and Revised Months (and the Months whose Returns can be over them)
+  permno, month = rawFirmMonths(CRSP_MONTHLY, 'CRSP_MONTHLY')
+  for i in range(returnLookbackMonths + 1):
+    affectedKeys.append(firmMonthKey(permno, month + i))
+
+  # Months in which New or Restated Quarters are Valid
+  permno, quarterEndMonth = rawFirmMonths(CRSP_COMPUSTAT_MERGED, 'CRSP_COMPUSTAT_MERGED')
+  for i in range(monthsAccountingVariablesValid):
+    affectedKeys.append(firmMonthKey(permno, quarterEndMonth + monthsToLagAccountingVariables + i))
+
+  # Months whose SIGMA includes New Daily Data
+  permno, month = rawFirmMonths(CRSP_DAILY, 'CRSP_DAILY')
+  month = np.unique(firmMonthKey(permno, month))
+  for i in range(sigmaWindowMonths if calculateSigma else 1):
+    affectedKeys.append(month + i)
+
+  # Every Firm in Months with New Market Returns
+  marketMonths = rawMonthOrdinal(SP500_MONTHLY, 'SP500_MONTHLY')
+  inMarketMonth = np.isin(previousMonth, marketMonths)
+  affectedKeys.append(firmMonthKey(previousPermno[inMarketMonth], previousMonth[inMarketMonth]))
+
+  # Every Month of Firms whose Deletion changed
+  if deletionChanged is not None:
+    isDeletionChanged = np.isin(previousPermno, deletionChanged)
+    affectedKeys.append(firmMonthKey(previousPermno[isDeletionChanged], previousMonth[isDeletionChanged]))
+
+  # Months whose Averages include an Affected Month
+  affectedKeys = np.unique(np.concatenate(affectedKeys))
+  affectedKeys = np.unique((affectedKeys[:, None] + np.arange(averageWindowMonths)).ravel())
+
+  return affectedKeys
+
+def selectRawRecords(rawDataframe, extractName, firms, firmStartMonth):
+  """
+  Rows of a firm-level raw extract belonging to firms (sorted PERMNOs), from
+  each firm's start month (ordinal) on
+  """
+  if len(firms) == 0:
+    return rawDataframe.iloc[:0]
+
+  permno = pd.to_numeric(rawDataframe[RAW_PERMNO_COLUMNS[extractName]], errors='coerce').to_numpy(dtype=np.float64)
+  position = np.minimum(np.searchsorted(firms, permno), len(firms) - 1)
+  isFirm = firms[position] == permno
+  rawRecords = rawDataframe[isFirm]
+
+  return rawRecords[rawMonthOrdinal(rawRecords, extractName) >= firmStartMonth[position[isFirm]]]
+
+def mergeDeltaRecords(rawRecords, deltaRecords, extractName):
+  """
+  Append delta records to stored records, a delta record replacing any
+  stored record with the same key (see RAW_RECORD_KEYS)
+  """
+  # Date Columns of the Delta as Stored (e.g. CSV strings against Parquet timestamps)
+  deltaRecords = deltaRecords.copy()
+  for column in deltaRecords.columns.intersection(rawRecords.columns):
+    if pd.api.types.is_datetime64_any_dtype(rawRecords[column]):
+      deltaRecords[column] = pd.to_datetime(deltaRecords[column])
+
+  records = pd.concat([rawRecords, deltaRecords], ignore_index=True)
+
+  # Normalize Keys (stored and delta extracts may type them differently)
+  keys = {}
+  for column in RAW_RECORD_KEYS[extractName]:
+    if column not in records.columns:
+      continue
+    if column == RAW_DATE_COLUMNS[extractName] and extractName != 'CRSP_COMPUSTAT_MERGED':
+      keys[column] = pd.to_datetime(records[column])
+    elif column == 'datacqtr':
+      keys[column] = records[column].astype('string')
+    else:
+      keys[column] = pd.to_numeric(records[column], errors='coerce')
+
+  return records[~pd.DataFrame(keys).duplicated(keep='last').to_numpy()].reset_index(drop=True)
+
+def loadHistoryRecords(rawDataframes,
+                       parquetRoot,
+                       firms,
+                       firmStartMonth,
+                       CRSP_COMPUSTAT_Accounting_features,
+                       CRSP_COMPUSTAT_Identifying_features,
+                       CRSP_MONTHLY_features,
+                       monthsToLagAccountingVariables,
+                       monthsAccountingVariablesValid,
+                       calculateSigma,
+                       sigmaWindowMonths,
+                       returnLookbackMonths=12,
+                       averageWindowMonths=1
+                       ):
+  """
+  Stored raw records needed to recompute firms from firmStartMonth on:
+  their CRSP Monthly rows from returnLookbackMonths months before (for the
+  returns of the first month, see calculateFirmReturns), their quarters
+  valid in any of those months, their daily data covering the SIGMA window,
+  and all of SP500 Monthly, each from averageWindowMonths - 1 months earlier
+  for averaged variables.
+
+  Records come from the in-memory rawDataframes or, loading only those
+  firms, from the Parquet datasets under parquetRoot.
+  """
+  lookbackMonths = {'CRSP_COMPUSTAT_MERGED': monthsToLagAccountingVariables + monthsAccountingVariablesValid - 1 + averageWindowMonths - 1,
+                    'CRSP_MONTHLY': returnLookbackMonths + averageWindowMonths - 1,
+                    'CRSP_DAILY': (sigmaWindowMonths - 1 if calculateSigma else 0) + averageWindowMonths - 1
+                    }
+
+  if rawDataframes is None:
+    # Load Firms Grouped by Start Month (one Partition-Pruned Read each)
+    loadedRawDataframes = [[] for extractName in RAW_EXTRACT_NAMES]
+    for startMonth in np.unique(firmStartMonth):
+      groupRawDataframes = loadRawDataframes(parquetRoot,
+                                             pd.Period(ordinal=int(startMonth) - returnLookbackMonths - (averageWindowMonths - 1), freq='M'),
+                                             None,
+                                             CRSP_COMPUSTAT_Accounting_features,
+                                             CRSP_COMPUSTAT_Identifying_features,
+                                             CRSP_MONTHLY_features,
+                                             monthsToLagAccountingVariables,
+                                             monthsAccountingVariablesValid,
+                                             None,
+                                             calculateSigma,
+                                             sigmaWindowMonths,
+                                             firms[firmStartMonth == startMonth]
+                                             )
+      for i, groupRawDataframe in enumerate(groupRawDataframes):
+        loadedRawDataframes[i].append(groupRawDataframe)
+    rawDataframes = [pd.concat(frames, ignore_index=True) for frames in loadedRawDataframes[:3]]
+    rawDataframes.append(loadedRawDataframes[3][0] if len(firms) else None)
+
+  historyRecords = []
+  for extractName, rawDataframe in zip(RAW_EXTRACT_NAMES[:3], rawDataframes[:3]):
+    historyRecords.append(selectRawRecords(rawDataframe, extractName, firms, firmStartMonth - lookbackMonths[extractName]))
+  historyRecords.append(rawDataframes[3])
+
+  return historyRecords
+
+def patchPanel(previousPanel, updatedRows, affectedKeys):
+  """
+  Replace every row of a PERMNO/date_month panel whose key is in
+  affectedKeys with updatedRows, and sort the result by (PERMNO, month)
+  keeping the order of rows within a firm-month. Categorical columns (the
+  compact layout) stay categorical.
+  """
+  previousKeys = firmMonthKey(previousPanel['PERMNO'].to_numpy().astype(np.int64), monthPeriodToOrdinal(previousPanel['date_month']))
+  panel = concatPanels([previousPanel[~np.isin(previousKeys, affectedKeys)], updatedRows])
+
+  panelKeys = firmMonthKey(panel['PERMNO'].to_numpy().astype(np.int64), monthPeriodToOrdinal(panel['date_month']))
+  return panel.take(np.argsort(panelKeys, kind='mergesort')).reset_index(drop=True)
+
+def updateXDataFrame(previousXDataFrame,
+                     deltaRawDataframes,
+                     rawDataframes=None,
+                     parquetRoot=None,
+                     explanatoryVariablesToCalculate=['NITA',
+                                                      'NIMTA',
+                                                      'TLTA',
+                                                      'TLMTA',
+                                                      'EXRET',
+                                                      'RSIZE',
+                                                      'CASHMTA',
+                                                      'SIGMA'
+                                                      ],
+                     identifyingColumns = ['PERMNO', 'GVKEY','conm', 'cik'],
+                     keepAllFeatures=False,
+                     CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
+                     CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm', 'cik'],
+                     CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
+                     monthsToLagAccountingVariables=2,
+                     monthsAccountingVariablesValid=3,
+                     mergeMethod='asof',
+                     calculateSigma=False,
+                     sigmaWindowMonths=3,
+                     sigmaMinimumObservations=5,
+                     returnLookbackMonths=12,
+                     compactLayout=False,
+                     floatDtype=np.float64
+                     ):
+  """
+  Update an X-Dataframe built by createXDataFrame (with the same arguments)
+  with delta extracts: new months, restated quarters, new daily data and
+  SP500 returns, given as raw dataframes in createXDataFrame order.
+
+  Only the affected firm-months (see affectedFirmMonthKeys) are recomputed,
+  from the stored raw records of the affected firms (in-memory rawDataframes
+  or the Parquet datasets under parquetRoot, before the delta) merged with
+  the delta. A firm whose dlrsn/dldte changed has the new values applied to
+  all its quarters and is recomputed in full. Returns are exact as long as
+  no firm goes more than returnLookbackMonths months without a price.
+
+  Cross-sectional cleaning (createXDataFrame's cleaningColumns) depends on
+  every firm of a month, so update the uncleaned X-Dataframe and clean the
+  result with cleanExplanatoryVariables.
+
+  Returns the updated X-Dataframe, the recomputed rows and the affected keys
+  (for updateYDataFrame).
+  """
+  deltaRawDataframes = list(deltaRawDataframes)
+  deletionChanged = deletionChangedFirms(previousXDataFrame, deltaRawDataframes[0])
+  averageWindowMonths = DECAYED_AVERAGE_WINDOW_MONTHS if any(decayedAverageExpression(name) is not None for name in explanatoryVariablesToCalculate) else 1
+  affectedKeys = affectedFirmMonthKeys(previousXDataFrame,
+                                       deltaRawDataframes,
+                                       monthsToLagAccountingVariables,
+                                       monthsAccountingVariablesValid,
+                                       calculateSigma,
+                                       sigmaWindowMonths,
+                                       deletionChanged,
+                                       returnLookbackMonths,
+                                       averageWindowMonths
+                                       )
+
+  # Affected Firms and their first Affected Month
+  affectedPermno = affectedKeys // FIRM_MONTH_KEY_STRIDE
+  firms, firstAffected = np.unique(affectedPermno, return_index=True)
+  firmStartMonth = affectedKeys[firstAffected] % FIRM_MONTH_KEY_STRIDE - FIRM_MONTH_KEY_OFFSET
+
+  # Stored Records of Affected Firms, Updated with the Delta
+  historyRecords = loadHistoryRecords(rawDataframes,
+                                      parquetRoot,
+                                      firms,
+                                      firmStartMonth,
+                                      CRSP_COMPUSTAT_Accounting_features,
+                                      CRSP_COMPUSTAT_Identifying_features,
+                                      CRSP_MONTHLY_features,
+                                      monthsToLagAccountingVariables,
+                                      monthsAccountingVariablesValid,
+                                      calculateSigma,
+                                      sigmaWindowMonths,
+                                      returnLookbackMonths,
+                                      averageWindowMonths
+                                      )
+  updatedRawDataframes = []
+  for extractName, history, delta in zip(RAW_EXTRACT_NAMES, historyRecords, deltaRawDataframes):
+    updatedRawDataframes.append(delta.copy() if history is None else mergeDeltaRecords(history, delta, extractName))
+
+  # Apply Changed Deletions to every Quarter of the Firm
+  if len(deletionChanged):
+    CRSP_COMPUSTAT_MERGED = updatedRawDataframes[0]
+    latestDeletion = (deltaRawDataframes[0].sort_values('datacqtr', kind='mergesort')
+                                           .assign(LPERMNO=lambda delta: pd.to_numeric(delta['LPERMNO']))
+                                           .drop_duplicates('LPERMNO', keep='last')
+                                           .set_index('LPERMNO'))
+    quarterPermno = pd.to_numeric(CRSP_COMPUSTAT_MERGED['LPERMNO'])
+    isDeletionChanged = quarterPermno.isin(deletionChanged).to_numpy()
+    for column in ['dlrsn', 'dldte']:
+      deletionValues = quarterPermno[isDeletionChanged].map(latestDeletion[column])
+      if pd.api.types.is_datetime64_any_dtype(CRSP_COMPUSTAT_MERGED[column]):
+        deletionValues = pd.to_datetime(deletionValues)
+      CRSP_COMPUSTAT_MERGED.loc[isDeletionChanged, column] = deletionValues.to_numpy()
+
+  # Recompute Affected Firm-Months
+  updatedXRows = createXDataFrame(updatedRawDataframes,
+                                  explanatoryVariablesToCalculate,
+                                  identifyingColumns,
+                                  keepAllFeatures,
+                                  CRSP_COMPUSTAT_Accounting_features,
+                                  CRSP_COMPUSTAT_Identifying_features,
+                                  CRSP_MONTHLY_features,
+                                  monthsToLagAccountingVariables,
+                                  monthsAccountingVariablesValid,
+                                  mergeMethod,
+                                  calculateSigma,
+                                  sigmaWindowMonths,
+                                  sigmaMinimumObservations,
+                                  compactLayout=compactLayout,
+                                  floatDtype=floatDtype
+                                  )
+  updatedKeys = firmMonthKey(updatedXRows['PERMNO'].to_numpy().astype(np.int64), monthPeriodToOrdinal(updatedXRows['date_month']))
+  updatedXRows = updatedXRows[np.isin(updatedKeys, affectedKeys)].reset_index(drop=True)
+
+  xDataFrame = patchPanel(previousXDataFrame, updatedXRows, affectedKeys)
+
+  return xDataFrame, updatedXRows, affectedKeys
+
+def updateYDataFrame(previousYDataFrame,
+                     updatedXRows,
+                     affectedKeys,
+                     monthsWithinBankruptcy = [3, 6, 12, 24, 60],
+                     dropNA=True,
+                     featuresToKeep =['PERMNO', 'GVKEY', 'conm', 'date_month'],
+                     keepMonthsUntilBankruptcy=False
+                     ):
+  """
+  Update a Y-Dataframe built by createYDataFrame (with the same arguments)
+  with the rows and affected keys returned by updateXDataFrame. Labels only
+  depend on their own X-Dataframe row, so only those rows are relabelled.
+  featuresToKeep must include PERMNO and date_month.
+  """
+  updatedYRows = createYDataFrame(updatedXRows,
+                                  monthsWithinBankruptcy,
+                                  dropNA,
+                                  featuresToKeep,
+                                  keepMonthsUntilBankruptcy
+                                  )
+
+  return patchPanel(previousYDataFrame, updatedYRows, affectedKeys)
@@ -0,0 +1,331 @@
+"""
+Wrapper that backtests the bankruptcy logit out of sample: yearly
+rolling-origin refits (expanding or rolling windows), warm-started from the
+previous year's coefficients, for every feature set and horizon in parallel
+10-18-2026
+"""
+
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import monthPeriodToOrdinal
+from createYDataframeWrapper import bankruptcyIndicatorColumn
+from crossSectionalCleaningWrapper import IMPUTATION_COLUMNS
+from distressScoringWrapper import logisticProbabilities, LOGIT_HORIZON_COLUMN, LOGIT_INTERCEPT_COLUMN
+
+
+# Feature Sets: the 8 base variables of createXDataFrame and the notebook's
+# extended ratio set (Final_Dataframe_Creation_(NEW).ipynb)
+FEATURE_SETS = {'base': ['NITA', 'NIMTA', 'TLTA', 'TLMTA', 'EXRET', 'RSIZE', 'CASHMTA', 'SIGMA'],
+                'extended': IMPUTATION_COLUMNS
+                }
+
+# Accounting Variables whose previous quarter the extended ratios use (GA,
+# GS, CROE), as <variable>_Lag1 columns of CRSP/COMPUSTAT Merged (see
+# addAccountingLags)
+ACCOUNTING_LAG_COLUMNS = ['atq', 'saleq', 'niq', 'ltq', 'ceqq']
+
+# createXDataFrame Arguments calculating the extended Feature Set (from raw
+# data with the accounting lags, see addAccountingLags)
+EXTENDED_X_DATAFRAME_ARGS = {'explanatoryVariablesToCalculate': IMPUTATION_COLUMNS,
+                             'CRSP_COMPUSTAT_Accounting_features': ['atq', 'ceqq', 'cheq', 'ltq', 'niq',
+                                                                    'actq', 'lltq', 'revtq', 'cogsq', 'xoprq', 'dlttq', 'dlcq', 'saleq'
+                                                                    ] + [f'{column}_Lag1' for column in ACCOUNTING_LAG_COLUMNS]
+                             }
+
+# Out-of-Sample Statistics of every test year: McFadden's pseudo-R2 against
+# the training event rate, the AUC and, per decile of predicted probability
+# within the test year (decile 10 the riskiest), the share of its events
+BACKTEST_DECILES = 10
+BACKTEST_STATISTICS = ['pseudoR2', 'auc'] + [f'hitRateDecile{decile}' for decile in range(1, BACKTEST_DECILES + 1)]
+
+
+def addAccountingLags(CRSP_COMPUSTAT_MERGED, columns=ACCOUNTING_LAG_COLUMNS):
+  """
+  Add the firm's previous quarter of each of columns (in datacqtr order) to
+  a CRSP/COMPUSTAT Merged extract as <column>_Lag1, as
+  Final_Dataframe_Creation_(NEW).ipynb does before merging
+  """
+  CRSP_COMPUSTAT_MERGED = CRSP_COMPUSTAT_MERGED.copy()
+  quarterOrder = CRSP_COMPUSTAT_MERGED.sort_values(['LPERMNO', 'datacqtr'], kind='mergesort')
+  for column in columns:
+    CRSP_COMPUSTAT_MERGED[f'{column}_Lag1'] = quarterOrder.groupby('LPERMNO')[column].shift(1)
+
+  return CRSP_COMPUSTAT_MERGED
+
+def logitLogLikelihood(design, labels, coefficients, penalty=0.0):
+  """
+  Log-likelihood of 0/1 labels under a logit, without overflow for large
+  logits, less a ridge penalty (per coefficient)
+  """
+  logits = design @ coefficients
+  return np.sum(labels*logits - np.logaddexp(0, logits)) - 0.5*np.sum(penalty*coefficients**2)
+
+def fitLogit(featureMatrix, labels, initialCoefficients=None, maxIterations=50, tolerance=1e-8, l2Penalty=0.0):
+  """
+  Fit a logit with an intercept by Newton-Raphson (iteratively reweighted
+  least squares), halving steps that lower the likelihood. l2Penalty adds a
+  ridge penalty on the feature coefficients (not the intercept), which keeps
+  the fit finite on separable samples.
+
+  A fit warm-started from initialCoefficients (e.g. the previous year's)
+  converges in a few iterations; it starts from the intercept of the event
+  rate instead when that fits better (e.g. no initialCoefficients).
+
+  Returns the coefficients (intercept first) and the iterations taken.
+  """
+  design = np.column_stack([np.ones(len(featureMatrix)), featureMatrix])
+  penalty = np.full(design.shape[1], float(l2Penalty))
+  penalty[0] = 0
+
+  # Start from the Event Rate, or from initialCoefficients if they fit better
+  eventRate = np.clip(labels.mean(), 1e-12, 1 - 1e-12)
+  coefficients = np.zeros(design.shape[1])
+  coefficients[0] = np.log(eventRate/(1 - eventRate))
+  objective = logitLogLikelihood(design, labels, coefficients, penalty)
+  if initialCoefficients is not None:
+    initialObjective = logitLogLikelihood(design, labels, np.asarray(initialCoefficients, dtype=np.float64), penalty)
+    if initialObjective > objective:
+      coefficients, objective = np.array(initialCoefficients, dtype=np.float64), initialObjective
+
+  iteration = 0
+  for iteration in range(1, maxIterations + 1):
+    probabilities = logisticProbabilities(design @ coefficients)
+    gradient = design.T @ (labels - probabilities) - penalty*coefficients
+    hessian = (design*(probabilities*(1 - probabilities))[:, None]).T @ design + np.diag(penalty)
+    step = np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+
+    # Halve the Step until the Likelihood does not decrease (stop if it always does)
+    stepSize = 1.0
+    candidateObjective = logitLogLikelihood(design, labels, coefficients + step, penalty)
+    while not candidateObjective >= objective and stepSize >= 1e-6:
+      stepSize /= 2
+      candidateObjective = logitLogLikelihood(design, labels, coefficients + stepSize*step, penalty)
+    if not candidateObjective >= objective:
+      break
+    coefficients, objective = coefficients + stepSize*step, candidateObjective
+
+    if np.max(np.abs(stepSize*step)) < tolerance:
+      break
+
+  return coefficients, iteration
+
+def averageRanks(values):
+  """
+  Ranks (1-based) of values, ties sharing their average rank
+  """
+  order = np.argsort(values, kind='mergesort')
+  sortedValues = values[order]
+  isTieStart = np.concatenate([[True], sortedValues[1:] != sortedValues[:-1]])
+  tieStarts = np.flatnonzero(isTieStart)
+  tieEnds = np.append(tieStarts[1:], len(values))
+  ranks = np.empty(len(values))
+  ranks[order] = np.repeat((tieStarts + tieEnds + 1)/2, tieEnds - tieStarts)
+
+  return ranks
+
+def outOfSampleStatistics(probabilities, labels, nullProbability):
+  """
+  BACKTEST_STATISTICS of predicted probabilities against 0/1 labels;
+  missing where undefined (e.g. no events)
+  """
+  statistics = dict.fromkeys(BACKTEST_STATISTICS, np.nan)
+  events = labels.sum()
+  if len(labels) == 0 or events == 0:
+    return statistics
+
+  # McFadden's Pseudo-R2 against the Training Event Rate
+  clippedProbabilities = np.clip(probabilities, 1e-15, 1 - 1e-15)
+  logLikelihood = np.sum(labels*np.log(clippedProbabilities) + (1 - labels)*np.log(1 - clippedProbabilities))
+  nullLogLikelihood = events*np.log(nullProbability) + (len(labels) - events)*np.log(1 - nullProbability)
+  statistics['pseudoR2'] = 1 - logLikelihood/nullLogLikelihood
+
+  # AUC (Mann-Whitney)
+  if events < len(labels):
+    ranks = averageRanks(probabilities)
+    statistics['auc'] = (ranks[labels == 1].sum() - events*(events + 1)/2)/(events*(len(labels) - events))
+
+  # Share of Events in each Decile of Predicted Probability
+  decile = np.empty(len(labels), dtype=np.int64)
+  decile[np.argsort(probabilities, kind='mergesort')] = np.arange(len(labels))*BACKTEST_DECILES//len(labels)
+  hitRates = np.bincount(decile, weights=labels, minlength=BACKTEST_DECILES)/events
+  for i, hitRate in enumerate(hitRates):
+    statistics[f'hitRateDecile{i + 1}'] = hitRate
+
+  return statistics
+
+def loadBacktestArrays(backtestArrays, columns):
+  """
+  Columns of the backtest panel: a dict of arrays, or the directory of .npy
+  files written by runBacktest for worker processes, memory mapped
+  """
+  if isinstance(backtestArrays, str):
+    return {column: np.load(os.path.join(backtestArrays, f'{column}.npy'), mmap_mode='r') for column in columns}
+  return {column: backtestArrays[column] for column in columns}
+
+def backtestChain(backtestArrays, featureSet, features, horizon, testYears, windowYears, fitArguments):
+  """
+  Backtest one feature set and horizon over testYears (in order). Each test
+  year is predicted by a logit fitted on the months whose labels are known
+  before it starts (month + horizon before the test year), all of them or
+  the last windowYears years, warm-started from the previous year's fit.
+
+  Returns a list of result rows and a list of coefficient rows.
+  """
+  labelColumn = bankruptcyIndicatorColumn(horizon)
+  arrays = loadBacktestArrays(backtestArrays, ['monthOrdinal', labelColumn] + features)
+
+  # Complete Rows in Month Order
+  featureMatrix = np.column_stack([np.asarray(arrays[feature], dtype=np.float64) for feature in features])
+  isComplete = np.isfinite(featureMatrix).all(axis=1) & np.isfinite(arrays[labelColumn]) & (np.asarray(arrays['monthOrdinal']) != np.iinfo(np.int64).min)
+  featureMatrix = featureMatrix[isComplete]
+  labels = np.asarray(arrays[labelColumn], dtype=np.float64)[isComplete]
+  monthOrdinal = np.asarray(arrays['monthOrdinal'])[isComplete]
+
+  results = []
+  coefficientRows = []
+  coefficients = None
+  for testYear in testYears:
+    testStart = (testYear - 1970)*12
+    trainEnd = testStart - horizon
+    trainStart = None if windowYears is None else trainEnd - 12*windowYears
+    trainRows = slice(0 if trainStart is None else np.searchsorted(monthOrdinal, trainStart), np.searchsorted(monthOrdinal, trainEnd))
+    testRows = slice(np.searchsorted(monthOrdinal, testStart), np.searchsorted(monthOrdinal, testStart + 12))
+
+    trainLabels = labels[trainRows]
+    testLabels = labels[testRows]
+    result = {'featureSet': featureSet,
+              'horizon': horizon,
+              'testYear': testYear,
+              'trainObservations': len(trainLabels),
+              'trainEvents': int(trainLabels.sum()),
+              'testObservations': len(testLabels),
+              'testEvents': int(testLabels.sum()),
+              'iterations': 0
+              }
+
+    # Refit (warm-started) and Predict the Test Year
+    if result['trainEvents'] > 0 and result['trainEvents'] < len(trainLabels):
+      coefficients, result['iterations'] = fitLogit(featureMatrix[trainRows], trainLabels, coefficients, **fitArguments)
+      probabilities = logisticProbabilities(coefficients[0] + featureMatrix[testRows] @ coefficients[1:])
+      result.update(outOfSampleStatistics(probabilities, testLabels, trainLabels.mean()))
+      coefficientRows.append({'featureSet': featureSet, 'testYear': testYear, LOGIT_HORIZON_COLUMN: horizon, LOGIT_INTERCEPT_COLUMN: coefficients[0], **dict(zip(features, coefficients[1:]))})
+    else:
+      result.update(dict.fromkeys(BACKTEST_STATISTICS, np.nan))
+    results.append(result)
+
+  return results, coefficientRows
+
+def featureSetsInDataFrame(featureSets, xDataFrame):
+  """
+  The feature sets whose features are all in the X-Dataframe, warning about
+  the others (an error if none is)
+  """
+  availableFeatureSets = {}
+  for name, featureSet in featureSets.items():
+    missingFeatures = [feature for feature in featureSet if feature not in xDataFrame.columns]
+    if missingFeatures:
+      warnings.warn(f"Feature set '{name}' is skipped: features {missingFeatures} are not in the X-Dataframe (see EXTENDED_X_DATAFRAME_ARGS)")
+    else:
+      availableFeatureSets[name] = featureSet
+  if not availableFeatureSets:
+    raise ValueError('No feature set has all its features in the X-Dataframe; calculate them or pass other featureSets')
+
+  return availableFeatureSets
+
+def runBacktest(xDataFrame,
+                yDataFrame=None,
+                featureSets=FEATURE_SETS,
+                horizons=None,
+                firstTestYear=None,
+                lastTestYear=None,
+                windowYears=None,
+                nWorkers=1,
+                maxIterations=50,
+                tolerance=1e-8,
+                l2Penalty=0.0
+                ):
+  """
+  Rolling-origin backtest of the bankruptcy logit for every feature set
+  (a dict {name: features}, see FEATURE_SETS) and horizon (by default every
+  bankruptcyWithin<N>Months column of the Y-Dataframe).
+
+  Labels come from yDataFrame, matched to the X-Dataframe's features by
+  index (createYDataFrame keeps the X-Dataframe's index), or from
+  xDataFrame itself. Every test year in [firstTestYear, lastTestYear] (by
+  default the sample's second to last year) is predicted from an expanding
+  window, or with windowYears a rolling one (see backtestChain); rows with a
+  missing feature are left out.
+
+  Refits of one feature set and horizon run in sequence, each warm-started
+  from the previous year's coefficients; with nWorkers > 1 the feature set
+  and horizon chains run in a process pool, reading the panel as
+  memory-mapped .npy files instead of pickled frames.
+
+  Returns a Dataframe of out-of-sample statistics (see BACKTEST_STATISTICS)
+  per feature set, horizon and test year, and a Dataframe of the fitted
+  coefficients per feature set, horizon and test year (the rows of one
+  feature set and test year are read by loadLogitCoefficients).
+
+  Feature sets with features missing from the X-Dataframe are skipped with
+  a warning (the default X-Dataframe has only the base set). Every feature
+  set, e.g.
+
+    CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY = rawDataframes
+    rawDataframes = [addAccountingLags(CRSP_COMPUSTAT_MERGED), CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY]
+    xDataFrame = createXDataFrame(rawDataframes,
+                                  identifyingColumns=['PERMNO', 'GVKEY', 'conm', 'dlrsn', 'dldte'],
+                                  CRSP_COMPUSTAT_Identifying_features=['GVKEY', 'conm', 'dlrsn', 'dldte'],
+                                  **EXTENDED_X_DATAFRAME_ARGS
+                                  )
+    results, coefficients = runBacktest(xDataFrame, createYDataFrame(xDataFrame, dropNA=False))
+  """
+  featureSets = featureSetsInDataFrame(featureSets, xDataFrame)
+  labelPanel = xDataFrame if yDataFrame is None else yDataFrame
+  if horizons is None:
+    horizons = [int(column[len('bankruptcyWithin'):-len('Months')]) for column in labelPanel.columns
+                if column.startswith('bankruptcyWithin') and column.endswith('Months')]
+  labelColumns = [bankruptcyIndicatorColumn(horizon) for horizon in horizons]
+  features = list(dict.fromkeys(feature for featureSet in featureSets.values() for feature in featureSet))
+
+  # Backtest Panel in Month Order
+  monthOrdinal = monthPeriodToOrdinal(labelPanel['date_month'])
+  order = np.argsort(monthOrdinal, kind='stable')
+  featurePanel = xDataFrame[features] if yDataFrame is None else xDataFrame[features].reindex(yDataFrame.index)
+  backtestArrays = {'monthOrdinal': monthOrdinal[order]}
+  for column in labelColumns:
+    backtestArrays[column] = labelPanel[column].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+  for feature in features:
+    backtestArrays[feature] = featurePanel[feature].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+  # Test Years
+  years = backtestArrays['monthOrdinal'][backtestArrays['monthOrdinal'] != np.iinfo(np.int64).min]//12 + 1970
+  firstTestYear = int(years.min()) + 1 if firstTestYear is None else firstTestYear
+  lastTestYear = int(years.max()) if lastTestYear is None else lastTestYear
+  testYears = list(range(firstTestYear, lastTestYear + 1))
+  fitArguments = {'maxIterations': maxIterations, 'tolerance': tolerance, 'l2Penalty': l2Penalty}
+
+  with tempfile.TemporaryDirectory() if nWorkers > 1 else nullcontext() as arrayDirectory:
+    if arrayDirectory is not None:
+      for column, values in backtestArrays.items():
+        np.save(os.path.join(arrayDirectory, f'{column}.npy'), values)
+      backtestArrays = arrayDirectory
+
+    with ProcessPoolExecutor(nWorkers) if nWorkers > 1 else nullcontext() as executor:
+      chains = []
+      for featureSet, featureSetFeatures in featureSets.items():
+        for horizon in horizons:
+          chainArguments = (backtestArrays, featureSet, list(featureSetFeatures), horizon, testYears, windowYears, fitArguments)
+          chains.append(backtestChain(*chainArguments) if executor is None else executor.submit(backtestChain, *chainArguments))
+      chains = [chain if executor is None else chain.result() for chain in chains]
+
+  results = pd.DataFrame([result for chainResults, _ in chains for result in chainResults])
+  coefficients = pd.DataFrame([row for _, chainCoefficients in chains for row in chainCoefficients])
+
+  return results, coefficients
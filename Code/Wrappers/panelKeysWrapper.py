@@ -0,0 +1,59 @@
+"""
+Wrapper of the keys shared by the PERMNO/month panel wrappers: month
+ordinals, combined (PERMNO, month) keys and contiguous firm blocks
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+
+# Combined (PERMNO, Month) Key Layout (see firmMonthKey)
+FIRM_MONTH_KEY_STRIDE = 2**20
+FIRM_MONTH_KEY_OFFSET = 2**19
+
+# Missing Month in int32 Month Ordinal Columns (see compactPanelWrapper)
+MISSING_MONTH_ORDINAL = np.iinfo(np.int32).min
+
+
+def monthPeriodToOrdinal(monthPeriods):
+  """
+  Convert a Series of Month Periods, or of int32 month ordinals (the compact
+  layout, see compactPanelWrapper), to int64 month ordinals (months since
+  1970-01). Missing months map to the minimum int64 value.
+  """
+  if pd.api.types.is_integer_dtype(getattr(monthPeriods, 'dtype', None)):
+    monthOrdinals = np.asarray(monthPeriods, dtype=np.int64)
+    return np.where(monthOrdinals == MISSING_MONTH_ORDINAL, np.iinfo(np.int64).min, monthOrdinals)
+  return pd.PeriodIndex(monthPeriods, freq='M').asi8
+
+def monthOrdinalToPeriod(monthOrdinals):
+  """
+  Convert integer month ordinals (months since 1970-01) to Month Periods
+  """
+  return pd.arrays.PeriodArray(np.asarray(monthOrdinals, dtype=np.int64), dtype=pd.PeriodDtype('M'))
+
+def firmMonthKey(permno, monthOrdinal):
+  """
+  Combine integer PERMNOs and month ordinals into one sortable int64
+  (PERMNO, month) key; months are offset so the key stays positive
+  """
+  return np.asarray(permno, dtype=np.int64)*FIRM_MONTH_KEY_STRIDE + (np.asarray(monthOrdinal, dtype=np.int64) + FIRM_MONTH_KEY_OFFSET)
+
+def firmBlockStarts(PERMNO):
+  """
+  Mask of the first row of each firm's block (rows sorted by PERMNO)
+  """
+  isBlockStart = np.ones(len(PERMNO), dtype=bool)
+  isBlockStart[1:] = PERMNO[1:] != PERMNO[:-1]
+  return isBlockStart
+
+def forwardFillByBlock(values, isBlockStart):
+  """
+  Forward fill missing values within blocks, as
+  groupby(...).transform(lambda x: x.ffill()) without the groupby (a block's
+  leading missing values stay missing)
+  """
+  isSource = ~np.isnan(values) | isBlockStart
+  source = np.maximum.accumulate(np.where(isSource, np.arange(len(values)), 0))
+  return values[source]
@@ -0,0 +1,185 @@
+"""
+Wrapper that persists X- and Y-Dataframes as a store of memory-mapped column
+files sorted by (PERMNO, month), with firm and month indexes for firm
+history, month cross-section and firm-month lookups
+10-18-2026
+"""
+
+import os
+import json
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import firmMonthKey, monthPeriodToOrdinal, monthOrdinalToPeriod
+from compactPanelWrapper import isMonthColumn, toCompactMonths
+
+
+# Store Layout: metadata.json (written last, so a store is complete once it
+# exists), one '<column>.npy' file per column under columns/ and the indexes
+# under index/:
+#   permnos      - the sorted distinct PERMNOs
+#   firmOffsets  - first row of each firm (and the row count), so a firm's
+#                  history is rows firmOffsets[i]:firmOffsets[i + 1]
+#   months       - the sorted distinct months (int32 ordinals)
+#   monthOffsets - first position of each month in monthRows
+#   monthRows    - rows ordered by month (PERMNO order within a month)
+PANEL_STORE_METADATA = 'metadata.json'
+PANEL_STORE_INDEXES = ['permnos', 'firmOffsets', 'months', 'monthOffsets', 'monthRows']
+
+
+def encodeStoreColumn(values, column):
+  """
+  Encode a panel column for the store: month columns as int32 ordinals,
+  categoricals and strings as int32 codes with their categories, nullable
+  integers as float64 (missing NaN), other columns as they are. Returns the
+  array and the column's metadata.
+  """
+  dtype = str(values.dtype)
+  if values.dtype == pd.PeriodDtype('M') or (isMonthColumn(column) and pd.api.types.is_integer_dtype(values.dtype)):
+    return toCompactMonths(values), {'kind': 'month', 'dtype': dtype}
+  if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+    categorical = values.astype('category')
+    return categorical.cat.codes.to_numpy().astype(np.int32), {'kind': 'categorical', 'dtype': dtype, 'categories': categorical.cat.categories.tolist()}
+  if isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+    return values.to_numpy(dtype=np.float64, na_value=np.nan), {'kind': 'nullable', 'dtype': dtype}
+  return values.to_numpy(), {'kind': 'numeric', 'dtype': dtype}
+
+def decodeStoreColumn(values, columnMetadata):
+  """
+  Decode a stored column (or a slice of it) back to its panel dtype
+  """
+  kind = columnMetadata['kind']
+  if kind == 'month':
+    return monthOrdinalToPeriod(monthPeriodToOrdinal(values)) if columnMetadata['dtype'] == 'period[M]' else np.asarray(values)
+  if kind == 'categorical':
+    categorical = pd.Categorical.from_codes(np.asarray(values), categories=columnMetadata['categories'])
+    return categorical if columnMetadata['dtype'] == 'category' else np.asarray(categorical, dtype=object)
+  if kind == 'nullable':
+    return pd.array(np.asarray(values), dtype=columnMetadata['dtype'])
+  return np.asarray(values)
+
+def writePanelStore(panel, storePath):
+  """
+  Write a PERMNO/date_month panel (e.g. the output of createXDataFrame or
+  createYDataFrame) to a store at storePath (see PANEL_STORE_INDEXES):
+  rows sorted by (PERMNO, month) (stably, a no-op for sorted panels), one
+  .npy file per column and the firm and month indexes. Returns storePath.
+  """
+  permno = panel['PERMNO'].to_numpy().astype(np.int64)
+  month = monthPeriodToOrdinal(panel['date_month'])
+  key = firmMonthKey(permno, month)
+  order = np.argsort(key, kind='mergesort') if np.any(key[1:] < key[:-1]) else None
+  if order is not None:
+    permno, month = permno[order], month[order]
+
+  os.makedirs(os.path.join(storePath, 'columns'), exist_ok=True)
+  os.makedirs(os.path.join(storePath, 'index'), exist_ok=True)
+
+  # Columns
+  columnsMetadata = {}
+  for column in panel.columns:
+    values, columnsMetadata[column] = encodeStoreColumn(panel[column], column)
+    np.save(os.path.join(storePath, 'columns', f'{column}.npy'), values if order is None else values[order])
+
+  # Firm Index
+  permnos, firmStarts = np.unique(permno, return_index=True)
+  firmOffsets = np.append(firmStarts, len(permno)).astype(np.int64)
+
+  # Month Index
+  compactMonth = toCompactMonths(month)
+  monthRows = np.argsort(compactMonth, kind='stable').astype(np.int64)
+  months, monthStarts = np.unique(compactMonth[monthRows], return_index=True)
+  monthOffsets = np.append(monthStarts, len(monthRows)).astype(np.int64)
+
+  for name, index in zip(PANEL_STORE_INDEXES, [permnos, firmOffsets, months, monthOffsets, monthRows]):
+    np.save(os.path.join(storePath, 'index', f'{name}.npy'), index)
+
+  with open(os.path.join(storePath, PANEL_STORE_METADATA), 'w') as metadataFile:
+    json.dump({'rows': len(permno), 'columns': columnsMetadata}, metadataFile)
+
+  return storePath
+
+def openPanelStore(storePath):
+  """
+  Open a store written by writePanelStore. Columns and indexes are memory
+  mapped, so opening only reads file headers, whatever the panel size.
+
+  Returns the store: a dict of its 'metadata', its 'columns' and
+  PANEL_STORE_INDEXES arrays.
+  """
+  with open(os.path.join(storePath, PANEL_STORE_METADATA)) as metadataFile:
+    metadata = json.load(metadataFile)
+
+  store = {'metadata': metadata,
+           'columns': {column: np.load(os.path.join(storePath, 'columns', f'{column}.npy'), mmap_mode='r') for column in metadata['columns']}
+           }
+  for name in PANEL_STORE_INDEXES:
+    store[name] = np.load(os.path.join(storePath, 'index', f'{name}.npy'), mmap_mode='r')
+
+  return store
+
+def storeMonthOrdinal(month):
+  """
+  Month ordinal of a month given as a Period, a 'YYYY-MM' string, a
+  timestamp or an ordinal
+  """
+  if isinstance(month, (int, np.integer)):
+    return int(month)
+  return pd.Period(month, freq='M').ordinal
+
+def storeColumns(store, columns, rows):
+  """
+  Stored columns (all by default) at rows: a slice gives zero-copy views of
+  the memory-mapped files, an index array a gathered copy
+  """
+  return {column: store['columns'][column][rows] for column in (store['columns'] if columns is None else columns)}
+
+def firmRows(store, PERMNO):
+  """
+  Slice of a firm's rows (empty if the firm is not stored)
+  """
+  position = np.searchsorted(store['permnos'], PERMNO)
+  if position == len(store['permnos']) or store['permnos'][position] != PERMNO:
+    return slice(0, 0)
+  return slice(int(store['firmOffsets'][position]), int(store['firmOffsets'][position + 1]))
+
+def firmHistory(store, PERMNO, columns=None):
+  """
+  A firm's rows, in month order, as zero-copy column views
+  """
+  return storeColumns(store, columns, firmRows(store, PERMNO))
+
+def firmMonth(store, PERMNO, month, columns=None):
+  """
+  A firm's rows in one month (several for repeated firm-months), as
+  zero-copy column views
+  """
+  rows = firmRows(store, PERMNO)
+  firmMonths = toCompactMonths(store['columns']['date_month'][rows])
+  monthOrdinal = storeMonthOrdinal(month)
+  start = rows.start + np.searchsorted(firmMonths, monthOrdinal, side='left')
+  end = rows.start + np.searchsorted(firmMonths, monthOrdinal, side='right')
+  return storeColumns(store, columns, slice(int(start), int(end)))
+
+def monthCrossSection(store, month, columns=None):
+  """
+  Every firm's rows in one month, in PERMNO order. Rows of a month are
+  spread over the firm-ordered files, so the columns are gathered through
+  the month index (reading only those rows) rather than viewed.
+  """
+  monthOrdinal = storeMonthOrdinal(month)
+  position = np.searchsorted(store['months'], monthOrdinal)
+  if position == len(store['months']) or store['months'][position] != monthOrdinal:
+    return storeColumns(store, columns, slice(0, 0))
+  return storeColumns(store, columns, np.asarray(store['monthRows'][store['monthOffsets'][position]:store['monthOffsets'][position + 1]]))
+
+def panelStoreFrame(store, columnValues=None):
+  """
+  Dataframe of stored column values (e.g. a firmHistory result; the whole
+  store by default) with the panel's original dtypes
+  """
+  if columnValues is None:
+    columnValues = storeColumns(store, None, slice(None))
+  columnsMetadata = store['metadata']['columns']
+  return pd.DataFrame({column: decodeStoreColumn(values, columnsMetadata[column]) for column, values in columnValues.items()})
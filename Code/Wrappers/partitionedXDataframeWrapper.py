@@ -0,0 +1,254 @@
+"""
+Wrapper that creates the X-Dataframe one PERMNO partition at a time, either
+sequentially in bounded memory or in parallel across a process pool
+10-18-2026
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+import pandas as pd
+import numpy as np
+import pyarrow.feather as feather
+
+from createXDataframeWrapper import createXDataFrame
+from compactPanelWrapper import concatPanels
+from wrdsParquetWrapper import loadWrdsExtract, loadRawDataframes
+
+
+def arrowCompatibleFrame(frame):
+  """
+  Frame Arrow can hold: object columns mixing types (as pd.read_csv gives
+  for columns like SICCD, "DtypeWarning: Columns (3) have mixed types")
+  have their values as strings, missing values kept (the prepare stages
+  convert such columns with pd.to_numeric anyway)
+  """
+  mixedColumns = [column for column in frame.columns
+                  if frame[column].dtype == object and pd.api.types.infer_dtype(frame[column], skipna=True) in ['mixed', 'mixed-integer']
+                  ]
+  if not mixedColumns:
+    return frame
+
+  frame = frame.copy()
+  for column in mixedColumns:
+    frame[column] = frame[column].where(frame[column].isna(), frame[column].astype(str))
+
+  return frame
+
+def permnoPartitions(PERMNO, partitionSize):
+  """
+  Split firms into contiguous PERMNO ranges holding roughly partitionSize
+  rows of PERMNO each (a firm is never split across partitions).
+
+  Returns a list of (lowPERMNO, highPERMNO) inclusive ranges.
+  """
+  permnos, counts = np.unique(PERMNO.dropna().to_numpy(), return_counts=True)
+  if len(permnos) == 0:
+    return []
+
+  # Assign each Firm to a Partition by the rows that come before it
+  partitionId = (np.cumsum(counts) - counts) // partitionSize
+  partitionStarts = np.flatnonzero(np.diff(partitionId, prepend=-1))
+  partitionEnds = np.append(partitionStarts[1:], len(permnos)) - 1
+
+  return [(int(low), int(high)) for low, high in zip(permnos[partitionStarts], permnos[partitionEnds])]
+
+def permnoPartitionIndex(frame, permnoColumn, partitions):
+  """
+  Positions of each partition's rows in frame (in original row order within
+  each PERMNO), computed with one stable sort instead of one scan per
+  partition
+  """
+  permnos = frame[permnoColumn].to_numpy(dtype=np.float64)
+  order = np.argsort(permnos, kind='mergesort')
+  sortedPermnos = permnos[order]
+
+  partitionIndex = []
+  for low, high in partitions:
+    start = np.searchsorted(sortedPermnos, low, side='left')
+    end = np.searchsorted(sortedPermnos, high, side='right')
+    partitionIndex.append(order[start:end])
+
+  return partitionIndex
+
+def createXDataFramePartition(partitionRawDataframes, outputFile, createXDataFrameArgs):
+  """
+  Create one partition of the X-Dataframe in a worker process.
+
+  partitionRawDataframes is either a list of Arrow IPC (Feather) file paths
+  for CRSP/COMPUSTAT Merged, CRSP Monthly and CRSP Daily followed by the SP500
+  Monthly dataframe, or a (parquetRoot, startMonth, endMonth, permnoRange,
+  SP500_MONTHLY) tuple to load the partition directly from the Parquet
+  datasets. The partition is written to outputFile (Parquet if the name ends
+  in '.parquet', Arrow IPC otherwise) so no large frame is pickled back.
+  """
+  if isinstance(partitionRawDataframes, tuple):
+    parquetRoot, startMonth, endMonth, permnoRange, SP500_MONTHLY = partitionRawDataframes
+    partitionRawDataframes = loadRawDataframes(parquetRoot,
+                                               startMonth,
+                                               endMonth,
+                                               createXDataFrameArgs['CRSP_COMPUSTAT_Accounting_features'],
+                                               createXDataFrameArgs['CRSP_COMPUSTAT_Identifying_features'],
+                                               createXDataFrameArgs['CRSP_MONTHLY_features'],
+                                               createXDataFrameArgs['monthsToLagAccountingVariables'],
+                                               createXDataFrameArgs['monthsAccountingVariablesValid'],
+                                               permnoRange,
+                                               createXDataFrameArgs['calculateSigma'],
+                                               createXDataFrameArgs['sigmaWindowMonths']
+                                               )
+    partitionRawDataframes[3] = SP500_MONTHLY
+  else:
+    partitionRawDataframes = [feather.read_feather(path, memory_map=True) for path in partitionRawDataframes[:3]] + [partitionRawDataframes[3]]
+
+  explanatoryDataFrame = createXDataFrame(partitionRawDataframes, **createXDataFrameArgs)
+
+  if outputFile.endswith('.parquet'):
+    explanatoryDataFrame.to_parquet(outputFile, index=False)
+  else:
+    feather.write_feather(explanatoryDataFrame, outputFile, compression='uncompressed')
+
+  return outputFile
+
+def createXDataFrameByPartition(rawDataframes=None,
+                                parquetRoot=None,
+                                partitionSize=2000000,
+                                outputPath=None,
+                                startMonth=None,
+                                endMonth=None,
+                                nWorkers=1,
+                                explanatoryVariablesToCalculate=['NITA',
+                                                                 'NIMTA',
+                                                                 'TLTA',
+                                                                 'TLMTA',
+                                                                 'EXRET',
+                                                                 'RSIZE',
+                                                                 'CASHMTA',
+                                                                 'SIGMA'
+                                                                 ],
+                                identifyingColumns = ['PERMNO', 'GVKEY','conm', 'cik'],
+                                keepAllFeatures=False,
+                                CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
+                                CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm', 'cik'],
+                                CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
+                                monthsToLagAccountingVariables=2,
+                                monthsAccountingVariablesValid=3,
+                                mergeMethod='asof',
+                                calculateSigma=False,
+                                sigmaWindowMonths=3,
+                                sigmaMinimumObservations=5,
+                                compactLayout=False,
+                                floatDtype=np.float64
+                                ):
+  """
+  Create X-Dataframe in PERMNO partitions.
+
+  Raw data comes either from in-memory rawDataframes (as for createXDataFrame)
+  or, for memory bounded by partitionSize, from the Parquet datasets under
+  parquetRoot (see wrdsParquetWrapper), restricted to [startMonth, endMonth].
+  Firms are grouped into PERMNO ranges of about partitionSize CRSP Monthly
+  rows, and each range runs the full prepare -> merge -> custom variable
+  pipeline; SP500 Monthly is shared by every partition.
+
+  With nWorkers > 1 partitions run in a process pool. In-memory partitions
+  are handed to workers as memory-mapped Arrow IPC files and results come
+  back the same way, instead of pickling large frames.
+
+  If outputPath is given, each partition is written there as it completes
+  ('part-00000.parquet', ...) and outputPath is returned; otherwise the
+  partitions are concatenated in PERMNO order and returned. The result does
+  not depend on nWorkers. With compactLayout (see createXDataFrame)
+  identifiers stay categorical over every partition's categories.
+  """
+  createXDataFrameArgs = {'explanatoryVariablesToCalculate': explanatoryVariablesToCalculate,
+                          'identifyingColumns': identifyingColumns,
+                          'keepAllFeatures': keepAllFeatures,
+                          'CRSP_COMPUSTAT_Accounting_features': CRSP_COMPUSTAT_Accounting_features,
+                          'CRSP_COMPUSTAT_Identifying_features': CRSP_COMPUSTAT_Identifying_features,
+                          'CRSP_MONTHLY_features': CRSP_MONTHLY_features,
+                          'monthsToLagAccountingVariables': monthsToLagAccountingVariables,
+                          'monthsAccountingVariablesValid': monthsAccountingVariablesValid,
+                          'mergeMethod': mergeMethod,
+                          'calculateSigma': calculateSigma,
+                          'sigmaWindowMonths': sigmaWindowMonths,
+                          'sigmaMinimumObservations': sigmaMinimumObservations,
+                          'compactLayout': compactLayout,
+                          'floatDtype': floatDtype
+                          }
+
+  # Determine PERMNO Partitions from CRSP Monthly
+  if rawDataframes is not None:
+    CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY = rawDataframes
+    partitions = permnoPartitions(CRSP_MONTHLY['PERMNO'], partitionSize)
+    partitionIndices = [permnoPartitionIndex(CRSP_COMPUSTAT_MERGED, 'LPERMNO', partitions),
+                        permnoPartitionIndex(CRSP_MONTHLY, 'PERMNO', partitions),
+                        permnoPartitionIndex(CRSP_DAILY, 'PERMNO', partitions)
+                        ]
+  else:
+    CRSP_MONTHLY_PERMNO = loadWrdsExtract(os.path.join(parquetRoot, 'CRSP_MONTHLY'), 'CRSP_MONTHLY', ['PERMNO'], startMonth, endMonth)['PERMNO']
+    partitions = permnoPartitions(CRSP_MONTHLY_PERMNO, partitionSize)
+    del CRSP_MONTHLY_PERMNO
+    SP500_MONTHLY = loadWrdsExtract(os.path.join(parquetRoot, 'SP500_MONTHLY'), 'SP500_MONTHLY', ['caldt', 'vwretd', 'totval'], startMonth, endMonth)
+
+  if outputPath is not None:
+    os.makedirs(outputPath, exist_ok=True)
+
+  with tempfile.TemporaryDirectory() as arrowDirectory:
+    with ProcessPoolExecutor(nWorkers) if nWorkers > 1 else nullcontext() as executor:
+      explanatoryDataFrames = []
+      for partitionNumber, permnoRange in enumerate(partitions):
+        if outputPath is not None:
+          outputFile = os.path.join(outputPath, f'part-{partitionNumber:05d}.parquet')
+        else:
+          outputFile = os.path.join(arrowDirectory, f'output-{partitionNumber:05d}.arrow')
+
+        # Select Partition
+        if rawDataframes is None:
+          partitionRawDataframes = (parquetRoot, startMonth, endMonth, permnoRange, SP500_MONTHLY)
+        elif executor is None:
+          partitionRawDataframes = [CRSP_COMPUSTAT_MERGED.take(partitionIndices[0][partitionNumber]),
+                                    CRSP_MONTHLY.take(partitionIndices[1][partitionNumber]),
+                                    CRSP_DAILY.take(partitionIndices[2][partitionNumber]),
+                                    SP500_MONTHLY
+                                    ]
+        else:
+          # Hand the Partition to the Worker as Arrow IPC Files
+          partitionRawDataframes = []
+          for rawDataframe, partitionIndex, name in zip(rawDataframes[:3], partitionIndices, ['CRSP_COMPUSTAT_MERGED', 'CRSP_MONTHLY', 'CRSP_DAILY']):
+            inputFile = os.path.join(arrowDirectory, f'{name}-{partitionNumber:05d}.arrow')
+            feather.write_feather(arrowCompatibleFrame(rawDataframe.take(partitionIndex[partitionNumber]).reset_index(drop=True)), inputFile, compression='uncompressed')
+            partitionRawDataframes.append(inputFile)
+          partitionRawDataframes.append(SP500_MONTHLY)
+
+        # Create Partition of X-Dataframe
+        if executor is not None:
+          explanatoryDataFrames.append(executor.submit(createXDataFramePartition, partitionRawDataframes, outputFile, createXDataFrameArgs))
+        elif isinstance(partitionRawDataframes, tuple):
+          explanatoryDataFrames.append(createXDataFramePartition(partitionRawDataframes, outputFile, createXDataFrameArgs))
+        else:
+          explanatoryDataFrame = createXDataFrame(partitionRawDataframes, **createXDataFrameArgs)
+          if outputPath is not None:
+            # Keep only the File, so Memory stays bounded by one Partition
+            explanatoryDataFrame.to_parquet(outputFile, index=False)
+            explanatoryDataFrames.append(outputFile)
+          else:
+            explanatoryDataFrames.append(explanatoryDataFrame)
+          del explanatoryDataFrame
+        del partitionRawDataframes
+
+      # Collect Partitions in PERMNO Order
+      for i, explanatoryDataFrame in enumerate(explanatoryDataFrames):
+        if executor is not None:
+          explanatoryDataFrame = explanatoryDataFrame.result()
+        if outputPath is not None:
+          explanatoryDataFrames[i] = None
+        elif isinstance(explanatoryDataFrame, str):
+          explanatoryDataFrames[i] = feather.read_feather(explanatoryDataFrame)
+        else:
+          explanatoryDataFrames[i] = explanatoryDataFrame
+
+    if outputPath is not None:
+      return outputPath
+
+    return concatPanels(explanatoryDataFrames)
@@ -0,0 +1,196 @@
+"""
+Wrapper that benchmarks the data pipeline on synthetic WRDS data: times and
+memory-profiles every stage at several scales and flags throughput
+regressions against stored baselines
+10-18-2026
+"""
+
+import os
+import gc
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+from createXDataframeWrapper import prepareCrspCompustatMergedData, prepareCrspMonthlyData, prepareCrspDailyData, prepareSP500Data, createXDataFrame
+from createYDataframeWrapper import createYDataFrame
+from bloombergDataFormatWrapper import formatBloombergBankruptcyData, BLOOMBERG_COLUMN_NAMES
+from syntheticWrdsWrapper import generateSyntheticWrdsData, generateSyntheticBloombergData
+
+
+# Scales (generateSyntheticWrdsData arguments) benchmarked by name
+BENCHMARK_SCALES = {'small': {'nFirms': 500, 'nYears': 10},
+                    'medium': {'nFirms': 2000, 'nYears': 20},
+                    'large': {'nFirms': 8000, 'nYears': 40}
+                    }
+
+# Stages in pipeline order; each is timed on the rows of its main input
+BENCHMARK_STAGES = ['prepareCrspCompustatMergedData',
+                    'prepareCrspMonthlyData',
+                    'prepareCrspDailyData',
+                    'prepareSP500Data',
+                    'createXDataFrame',
+                    'createYDataFrame',
+                    'formatBloombergBankruptcyData'
+                    ]
+
+# createXDataFrame Arguments keeping what createYDataFrame needs
+BENCHMARK_X_DATAFRAME_ARGS = {'identifyingColumns': ['PERMNO', 'GVKEY', 'conm', 'dlrsn', 'dldte'],
+                              'CRSP_COMPUSTAT_Identifying_features': ['GVKEY', 'conm', 'dlrsn', 'dldte']
+                              }
+
+# Throughput (rows per second) below baseline by more than this share is a
+# regression
+BENCHMARK_REGRESSION_TOLERANCE = 0.2
+
+# Stages (or their baselines) faster than this many seconds are not checked
+# for regressions: their timings are mostly noise
+BENCHMARK_MINIMUM_SECONDS = 0.05
+
+
+def measureStage(runStage, repeats=3):
+  """
+  Time a stage (the best of repeats runs) and measure its peak memory (the
+  peak of Python and numpy allocations traced by tracemalloc in one extra,
+  untimed run, so tracing does not slow the timed runs).
+
+  Returns the seconds, the peak memory in bytes and the stage's result.
+  """
+  seconds = np.inf
+  for _ in range(repeats):
+    gc.collect()
+    start = time.perf_counter()
+    result = runStage()
+    seconds = min(seconds, time.perf_counter() - start)
+    del result
+
+  gc.collect()
+  tracemalloc.start()
+  try:
+    result = runStage()
+    _, peakMemory = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+
+  return seconds, peakMemory, result
+
+def benchmarkPipeline(scale, repeats=3, seed=0, stages=BENCHMARK_STAGES):
+  """
+  Benchmark the stages of the pipeline on synthetic data of a scale (a name
+  of BENCHMARK_SCALES or a dict of generateSyntheticWrdsData arguments).
+  createYDataFrame runs on the benchmarked X-Dataframe.
+
+  Returns a Dataframe with one row per stage: its input rows, seconds,
+  rowsPerSecond and peakMemoryBytes.
+  """
+  scaleName = scale if isinstance(scale, str) else ','.join(f'{name}={value}' for name, value in scale.items())
+  scaleArgs = BENCHMARK_SCALES[scale] if isinstance(scale, str) else scale
+  rawDataframes = generateSyntheticWrdsData(seed=seed, **scaleArgs)
+  CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY = rawDataframes
+  bloombergBankruptcyData = generateSyntheticBloombergData(CRSP_COMPUSTAT_MERGED, seed=seed).rename(columns=BLOOMBERG_COLUMN_NAMES)
+
+  stageRuns = {'prepareCrspCompustatMergedData': (CRSP_COMPUSTAT_MERGED, lambda: prepareCrspCompustatMergedData(CRSP_COMPUSTAT_MERGED)),
+               'prepareCrspMonthlyData': (CRSP_MONTHLY, lambda: prepareCrspMonthlyData(CRSP_MONTHLY)),
+               'prepareCrspDailyData': (CRSP_DAILY, lambda: prepareCrspDailyData(CRSP_DAILY)),
+               'prepareSP500Data': (SP500_MONTHLY, lambda: prepareSP500Data(SP500_MONTHLY)),
+               'createXDataFrame': (CRSP_MONTHLY, lambda: createXDataFrame(rawDataframes, **BENCHMARK_X_DATAFRAME_ARGS)),
+               'formatBloombergBankruptcyData': (bloombergBankruptcyData, lambda: formatBloombergBankruptcyData(bloombergBankruptcyData))
+               }
+
+  results = []
+  explanatoryDataFrame = None
+  for stage in stages:
+    if stage == 'createYDataFrame':
+      if explanatoryDataFrame is None:
+        explanatoryDataFrame = createXDataFrame(rawDataframes, **BENCHMARK_X_DATAFRAME_ARGS)
+      stageInput, runStage = explanatoryDataFrame, lambda: createYDataFrame(explanatoryDataFrame)
+    else:
+      stageInput, runStage = stageRuns[stage]
+
+    seconds, peakMemory, result = measureStage(runStage, repeats)
+    if stage == 'createXDataFrame':
+      explanatoryDataFrame = result
+    del result
+
+    results.append({'scale': scaleName,
+                    'stage': stage,
+                    'rows': len(stageInput),
+                    'seconds': seconds,
+                    'rowsPerSecond': len(stageInput)/seconds if seconds > 0 else np.inf,
+                    'peakMemoryBytes': peakMemory
+                    })
+
+  return pd.DataFrame(results)
+
+def loadBenchmarkBaselines(baselinePath):
+  """
+  Load stored baselines, {scale: {stage: {'rowsPerSecond': ...,
+  'peakMemoryBytes': ...}}}; empty if the file does not exist
+  """
+  if baselinePath is None or not os.path.exists(baselinePath):
+    return {}
+  with open(baselinePath) as baselineFile:
+    return json.load(baselineFile)
+
+def saveBenchmarkBaselines(benchmarkResults, baselinePath):
+  """
+  Store benchmark results as baselines, replacing the stored baselines of
+  the benchmarked scales and stages and keeping the others
+  """
+  baselines = loadBenchmarkBaselines(baselinePath)
+  for result in benchmarkResults.to_dict('records'):
+    baselines.setdefault(result['scale'], {})[result['stage']] = {'rowsPerSecond': result['rowsPerSecond'], 'peakMemoryBytes': result['peakMemoryBytes']}
+
+  with open(baselinePath, 'w') as baselineFile:
+    json.dump(baselines, baselineFile, indent=2, sort_keys=True)
+
+  return baselinePath
+
+def compareWithBaselines(benchmarkResults, baselines, tolerance=BENCHMARK_REGRESSION_TOLERANCE, minimumSeconds=BENCHMARK_MINIMUM_SECONDS):
+  """
+  Add each stage's baseline throughput and peak memory, their ratios to the
+  baseline (throughputRatio, memoryRatio) and isRegression, whether its
+  throughput fell more than tolerance below the baseline. isRegression is
+  False without a baseline and for stages too short to time reliably (run
+  and baseline both under minimumSeconds, see isTimed).
+  """
+  comparedResults = benchmarkResults.copy()
+  baselineRows = [baselines.get(scale, {}).get(stage, {}) for scale, stage in zip(comparedResults['scale'], comparedResults['stage'])]
+  comparedResults['baselineRowsPerSecond'] = [baseline.get('rowsPerSecond', np.nan) for baseline in baselineRows]
+  comparedResults['baselinePeakMemoryBytes'] = [baseline.get('peakMemoryBytes', np.nan) for baseline in baselineRows]
+  comparedResults['throughputRatio'] = comparedResults['rowsPerSecond']/comparedResults['baselineRowsPerSecond']
+  comparedResults['memoryRatio'] = comparedResults['peakMemoryBytes']/comparedResults['baselinePeakMemoryBytes']
+  baselineSeconds = comparedResults['rows']/comparedResults['baselineRowsPerSecond']
+  comparedResults['isTimed'] = ((comparedResults['seconds'] >= minimumSeconds) | (baselineSeconds >= minimumSeconds)).to_numpy()
+  comparedResults['isRegression'] = (comparedResults['isTimed'] & (comparedResults['throughputRatio'] < 1 - tolerance)).to_numpy()
+
+  return comparedResults
+
+def runPipelineBenchmarks(scales=['small', 'medium'],
+                          repeats=3,
+                          seed=0,
+                          stages=BENCHMARK_STAGES,
+                          baselinePath=None,
+                          tolerance=BENCHMARK_REGRESSION_TOLERANCE,
+                          minimumSeconds=BENCHMARK_MINIMUM_SECONDS,
+                          updateBaselines=False
+                          ):
+  """
+  Benchmark the pipeline at each of scales (see benchmarkPipeline) and
+  compare the results with the baselines stored at baselinePath (see
+  compareWithBaselines, which skips stages under minimumSeconds). With
+  updateBaselines the results become the new
+  baselines.
+
+  Returns a Dataframe with one row per scale and stage; regressions are
+  flagged by isRegression.
+  """
+  benchmarkResults = pd.concat([benchmarkPipeline(scale, repeats, seed, stages) for scale in scales], ignore_index=True)
+  comparedResults = compareWithBaselines(benchmarkResults, loadBenchmarkBaselines(baselinePath), tolerance, minimumSeconds)
+
+  if updateBaselines and baselinePath is not None:
+    saveBenchmarkBaselines(benchmarkResults, baselinePath)
+
+  return comparedResults
@@ -0,0 +1,272 @@
+"""
+Wrapper that sorts firms into portfolios within each month by any panel
+columns (e.g. fitted distress probabilities, NIMTA, SIGMA) under several
+breakpoint schemes, and calculates the portfolios' equal- and value-weighted
+returns over the following month, delisting returns included
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import firmMonthKey, monthPeriodToOrdinal, monthOrdinalToPeriod
+
+
+# Breakpoint Schemes by name: a number of equal-count portfolios, or the
+# percentile cutoffs (increasing, between 0 and 1) between portfolios, as
+# the 0-5, 5-10, 10-20, 20-40, 40-60, 60-80, 80-90, 90-95, 95-99 and 99-100
+# percentile portfolios of "In Search of Distress Risk"
+PORTFOLIO_BREAKPOINT_SCHEMES = {'quintiles': 5,
+                                'deciles': 10,
+                                'distressPercentiles': [0.05, 0.1, 0.2, 0.4, 0.6, 0.8, 0.9, 0.95, 0.99]
+                                }
+
+# Statistics of each portfolio in each formation month (ME: PRC*SHROUT at
+# formation, the value weight)
+PORTFOLIO_STATISTICS = ['nFirms', 'equalWeightedReturn', 'valueWeightedReturn', 'ME']
+
+
+def breakpointCutoffs(scheme):
+  """
+  Percentile cutoffs of a breakpoint scheme (see
+  PORTFOLIO_BREAKPOINT_SCHEMES)
+  """
+  if isinstance(scheme, (int, np.integer)):
+    return np.arange(1, scheme)/scheme
+  cutoffs = np.asarray(scheme, dtype=np.float64)
+  if np.any(cutoffs <= 0) or np.any(cutoffs >= 1) or np.any(np.diff(cutoffs) <= 0):
+    raise ValueError(f'Breakpoint cutoffs must increase strictly between 0 and 1, not {scheme!r}')
+  return cutoffs
+
+def returnsWithDelisting(RET, DLRET):
+  """
+  Monthly returns including delisting returns: (1 + RET)(1 + DLRET) - 1,
+  RET alone without a delisting return and DLRET alone in delisting months
+  without a regular return
+  """
+  RET = np.asarray(RET, dtype=np.float64)
+  DLRET = np.asarray(DLRET, dtype=np.float64)
+  return np.where(np.isnan(DLRET), RET, np.where(np.isnan(RET), DLRET, (1 + RET)*(1 + DLRET) - 1))
+
+def prepareMonthlyReturns(CRSP_MONTHLY):
+  """
+  Monthly returns and market values of a raw CRSP Monthly extract (PERMNO,
+  date, PRC, SHROUT, RET and DLRET; CRSP's letter codes are missing),
+  without the filters of prepareCrspMonthlyData, so delisting months
+  without a regular return are kept. Returns a Dataframe of PERMNO,
+  date_month, PRC, SHROUT, RET and DLRET.
+  """
+  monthlyReturns = pd.DataFrame({'PERMNO': CRSP_MONTHLY['PERMNO'].to_numpy(),
+                                 'date_month': pd.to_datetime(CRSP_MONTHLY['date']).dt.to_period('m').to_numpy()
+                                 })
+  for column in ['PRC', 'SHROUT', 'RET', 'DLRET']:
+    monthlyReturns[column] = pd.to_numeric(CRSP_MONTHLY[column], errors='coerce').to_numpy() if column in CRSP_MONTHLY.columns else np.nan
+  return monthlyReturns.dropna(subset=['PERMNO', 'date_month']).reset_index(drop=True)
+
+def firstRowPerKey(key):
+  """
+  Rows in key order, keeping the first row of every repeated key (e.g. a
+  firm-month repeated for several quarter records)
+  """
+  order = np.argsort(key, kind='stable')
+  isFirst = np.ones(len(order), dtype=bool)
+  isFirst[1:] = key[order][1:] != key[order][:-1]
+  return order[isFirst]
+
+def laggedFirmMonthValues(PERMNO, monthOrdinal, sourcePermno, sourceMonthOrdinal, sourceValues, lagMonths=1):
+  """
+  Values (each of the sourceValues arrays) of each firm-month's firm
+  lagMonths months later, found by binary search among the sorted
+  (PERMNO, month) keys of the source (missing where the firm has no source
+  row in that month)
+  """
+  sourceKey = firmMonthKey(sourcePermno, sourceMonthOrdinal)
+  sourceRows = firstRowPerKey(sourceKey)
+  sourceKey = sourceKey[sourceRows]
+  if len(sourceKey) == 0:
+    return [np.full(len(PERMNO), np.nan) for _ in sourceValues]
+
+  key = firmMonthKey(PERMNO, monthOrdinal + lagMonths)
+  position = np.minimum(np.searchsorted(sourceKey, key), len(sourceKey) - 1)
+  isFound = sourceKey[position] == key
+
+  return [np.where(isFound, np.asarray(values, dtype=np.float64)[sourceRows][position], np.nan) for values in sourceValues]
+
+def sortWithinMonths(values, monthIndex, nMonths, isBreakpointRow):
+  """
+  Values of the breakpoint rows sorted within every month (a grouped
+  argsort: by value, then stably by the small month index, a linear radix
+  sort), with each month's first position and count
+  """
+  rows = np.flatnonzero(isBreakpointRow)
+  rows = rows[np.argsort(values[rows])]
+  rows = rows[np.argsort(monthIndex[rows].astype(np.int16 if nMonths <= np.iinfo(np.int16).max else np.int32), kind='stable')]
+  monthCounts = np.bincount(monthIndex[rows], minlength=nMonths)
+
+  return values[rows], np.cumsum(monthCounts) - monthCounts, monthCounts
+
+def monthlyBreakpoints(sortedValues, monthStarts, monthCounts, cutoffs):
+  """
+  Breakpoint values of every month (a (months x cutoffs) array) from the
+  values sorted within months (see sortWithinMonths): cutoff p's breakpoint
+  is the largest of the lowest p share of the month's values, so with
+  every row a breakpoint row, a value's portfolio is set by its rank within
+  the month (missing for months without breakpoint rows)
+  """
+  if len(sortedValues) == 0:
+    return np.full((len(monthCounts), len(cutoffs)), np.nan)
+  position = monthStarts[:, None] + np.maximum(np.ceil(cutoffs[None, :]*monthCounts[:, None]).astype(np.int64) - 1, 0)
+  breakpoints = sortedValues[np.minimum(position, len(sortedValues) - 1)]
+  breakpoints[monthCounts == 0] = np.nan
+
+  return breakpoints
+
+def assignPortfolios(values, monthIndex, breakpoints):
+  """
+  Portfolio of each row (1 for the lowest values, 0 where the value or its
+  month's breakpoints are missing): one plus the number of its month's
+  breakpoints below its value, so equal values share a portfolio
+  """
+  portfolio = np.ones(len(values), dtype=np.int16)
+  for cutoff in range(breakpoints.shape[1]):
+    portfolio += values > breakpoints[monthIndex, cutoff]
+  portfolio[np.isnan(values) | np.isnan(breakpoints[monthIndex, 0])] = 0
+
+  return portfolio
+
+def portfolioReturns(portfolio, nPortfolios, monthIndex, nMonths, holdingReturns, weights):
+  """
+  Statistics (see PORTFOLIO_STATISTICS) of every portfolio in every month
+  in one pass: sums over (month, portfolio) cells by bincount. Firms
+  without a holding return are left out; value weights are the firms'
+  positive weights. Returns a dict of (months x portfolios) arrays.
+  """
+  isHeld = (portfolio > 0) & ~np.isnan(holdingReturns)
+  isWeighted = isHeld & (weights > 0)
+  cell = monthIndex*nPortfolios + (portfolio.astype(np.int64) - 1)
+  nCells = nMonths*nPortfolios
+
+  def cellSums(isIncluded, cellWeights):
+    return np.bincount(cell[isIncluded], weights=None if cellWeights is None else cellWeights[isIncluded], minlength=nCells).reshape(nMonths, nPortfolios)
+
+  nFirms = cellSums(isHeld, None)
+  ME = cellSums(isWeighted, weights)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    equalWeightedReturn = np.where(nFirms > 0, cellSums(isHeld, holdingReturns)/nFirms, np.nan)
+    valueWeightedReturn = np.where(ME > 0, cellSums(isWeighted, weights*holdingReturns)/ME, np.nan)
+
+  return {'nFirms': nFirms.astype(np.int64), 'equalWeightedReturn': equalWeightedReturn, 'valueWeightedReturn': valueWeightedReturn, 'ME': ME}
+
+def sortPortfolios(panelDataFrame,
+                   sortColumns,
+                   breakpointSchemes=PORTFOLIO_BREAKPOINT_SCHEMES,
+                   returnsDataFrame=None,
+                   returnColumn='RET',
+                   delistingReturnColumn='DLRET',
+                   holdingLagMonths=1,
+                   breakpointRows=None
+                   ):
+  """
+  Sort a PERMNO/date_month panel's firms into portfolios every month by each
+  of sortColumns under each of breakpointSchemes (see
+  PORTFOLIO_BREAKPOINT_SCHEMES) and calculate every portfolio's returns
+  holdingLagMonths months after formation.
+
+  Returns come from returnsDataFrame (e.g. prepareMonthlyReturns of the raw
+  CRSP Monthly extract, which keeps the delisting months the X-Dataframe
+  drops; the panel itself by default): returnColumn combined with
+  delistingReturnColumn where it exists (see returnsWithDelisting).
+  Portfolios are value weighted by ME = |PRC|*SHROUT at formation, from the
+  panel, or from returnsDataFrame if the panel has no PRC and SHROUT (as
+  the default X-Dataframe).
+  breakpointRows (a boolean mask over the panel's rows, e.g. NYSE firms)
+  restricts the firms setting the breakpoints; all firms are sorted.
+
+  Each sort column is sorted by (month, value) once for all schemes, and
+  the holding returns and weights are found once for all sorts. A
+  firm-month repeated in the panel is sorted once (its first row).
+
+  Returns a Dataframe with one row per sort column, scheme, formation month
+  and portfolio (1 for the lowest values) and the PORTFOLIO_STATISTICS.
+  """
+  if isinstance(sortColumns, str):
+    sortColumns = [sortColumns]
+  if not isinstance(breakpointSchemes, dict):
+    breakpointSchemes = {str(breakpointSchemes): breakpointSchemes}
+
+  # Firm-Months (the first Row of each)
+  permno = panelDataFrame['PERMNO'].to_numpy().astype(np.int64)
+  month = monthPeriodToOrdinal(panelDataFrame['date_month'])
+  rows = firstRowPerKey(firmMonthKey(permno, month))
+  rows = rows[month[rows] != np.iinfo(np.int64).min]
+  permno, month = permno[rows], month[rows]
+  months, monthIndex = np.unique(month, return_inverse=True)
+
+  # Holding Returns and Formation Weights (shared by every Sort)
+  returnsDataFrame = panelDataFrame if returnsDataFrame is None else returnsDataFrame
+  returns = returnsDataFrame[returnColumn].to_numpy(dtype=np.float64)
+  if delistingReturnColumn in returnsDataFrame.columns:
+    returns = returnsWithDelisting(returns, returnsDataFrame[delistingReturnColumn].to_numpy(dtype=np.float64))
+  returnPermno = returnsDataFrame['PERMNO'].to_numpy().astype(np.int64)
+  returnMonth = monthPeriodToOrdinal(returnsDataFrame['date_month'])
+  holdingReturns, = laggedFirmMonthValues(permno, month, returnPermno, returnMonth, [returns], holdingLagMonths)
+  if 'PRC' in panelDataFrame.columns and 'SHROUT' in panelDataFrame.columns:
+    PRC, SHROUT = panelDataFrame['PRC'].to_numpy(dtype=np.float64)[rows], panelDataFrame['SHROUT'].to_numpy(dtype=np.float64)[rows]
+  else:
+    PRC, SHROUT = laggedFirmMonthValues(permno, month, returnPermno, returnMonth, [returnsDataFrame['PRC'], returnsDataFrame['SHROUT']], 0)
+  with np.errstate(invalid='ignore'):
+    weights = np.abs(PRC)*SHROUT
+  isBreakpointRow = np.ones(len(rows), dtype=bool) if breakpointRows is None else np.asarray(breakpointRows, dtype=bool)[rows]
+
+  sortResults = []
+  for sortColumn in sortColumns:
+    values = panelDataFrame[sortColumn].to_numpy(dtype=np.float64)[rows]
+    sortedValues, monthStarts, monthCounts = sortWithinMonths(values, monthIndex, len(months), isBreakpointRow & ~np.isnan(values))
+    for schemeName, scheme in breakpointSchemes.items():
+      cutoffs = breakpointCutoffs(scheme)
+      breakpoints = monthlyBreakpoints(sortedValues, monthStarts, monthCounts, cutoffs)
+      portfolio = assignPortfolios(values, monthIndex, breakpoints)
+      statistics = portfolioReturns(portfolio, len(cutoffs) + 1, monthIndex, len(months), holdingReturns, weights)
+
+      sortResult = pd.DataFrame({'sortColumn': sortColumn,
+                                 'breakpointScheme': schemeName,
+                                 'date_month': monthOrdinalToPeriod(np.repeat(months, len(cutoffs) + 1)),
+                                 'portfolio': np.tile(np.arange(1, len(cutoffs) + 2), len(months))
+                                 })
+      for statistic in PORTFOLIO_STATISTICS:
+        sortResult[statistic] = statistics[statistic].ravel()
+      sortResults.append(sortResult)
+
+  return pd.concat(sortResults, ignore_index=True)
+
+def longShortReturns(sortedPortfolios):
+  """
+  Monthly returns of the highest minus the lowest portfolio of every sort
+  column and scheme (see sortPortfolios), missing where either has no
+  return
+  """
+  groupColumns = ['sortColumn', 'breakpointScheme', 'date_month']
+  highest = sortedPortfolios.groupby(['sortColumn', 'breakpointScheme'], sort=False)['portfolio'].transform('max')
+  lowest = sortedPortfolios[sortedPortfolios['portfolio'] == 1].set_index(groupColumns)
+  high = sortedPortfolios[sortedPortfolios['portfolio'] == highest].set_index(groupColumns)
+  returnColumns = ['equalWeightedReturn', 'valueWeightedReturn']
+
+  return (high[returnColumns] - lowest[returnColumns]).reset_index()
+
+def summarizePortfolioReturns(sortedPortfolios):
+  """
+  Time-series mean, standard deviation and t-statistic of the monthly
+  returns of every portfolio (see sortPortfolios; or of every long-short
+  portfolio, see longShortReturns), with the average number of firms
+  where given
+  """
+  groupColumns = [column for column in ['sortColumn', 'breakpointScheme', 'portfolio'] if column in sortedPortfolios.columns]
+  summaries = []
+  for returnColumn in ['equalWeightedReturn', 'valueWeightedReturn']:
+    statistics = sortedPortfolios.groupby(groupColumns)[returnColumn].agg(['mean', 'std', 'count'])
+    statistics['tStatistic'] = statistics['mean']/(statistics['std']/np.sqrt(statistics['count']))
+    summaries.append(statistics.drop(columns='count').add_prefix(f'{returnColumn}_'))
+  if 'nFirms' in sortedPortfolios.columns:
+    summaries.append(sortedPortfolios.groupby(groupColumns)['nFirms'].mean().rename('averageFirms'))
+
+  return pd.concat(summaries, axis=1).reset_index()
@@ -0,0 +1,229 @@
+"""
+Wrapper that caches the output of each createXDataFrame stage on disk, keyed
+by a hash of the stage's inputs, parameters and code, with size-bounded LRU
+eviction
+10-18-2026
+"""
+
+import os
+import json
+import types
+import hashlib
+import inspect
+
+import numpy as np
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+# Cache Files are '<stage name>-<key>.arrow' (Arrow IPC)
+STAGE_CACHE_SUFFIX = '.arrow'
+
+# Rows of a raw dataframe hashed by its sample fingerprint (see
+# dataframeSampleFingerprint)
+FINGERPRINT_SAMPLE_ROWS = 4096
+
+# Directory of the Wrappers, whose functions a stage's code is followed into
+# (see stageCodeFingerprint)
+WRAPPER_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def dataframeFingerprint(dataframe):
+  """
+  Fingerprint of a dataframe's contents (columns, dtypes, index and values)
+  """
+  fingerprint = hashlib.sha256()
+  fingerprint.update(json.dumps([[str(column), str(dtype)] for column, dtype in dataframe.dtypes.items()]).encode())
+  fingerprint.update(pd.util.hash_pandas_object(dataframe, index=True).to_numpy().tobytes())
+
+  return fingerprint.hexdigest()
+
+def dataframeSampleFingerprint(dataframe, sampleRows=FINGERPRINT_SAMPLE_ROWS):
+  """
+  Cheap fingerprint of a dataframe: its columns, dtypes and length and the
+  contents of sampleRows evenly spaced rows (the first and last included),
+  so its cost does not grow with the rows. Edits to rows outside the sample
+  that keep the length (e.g. a restated extract) are not seen, so it is
+  only used when passed as rawFingerprints, for inputs known never to be
+  revised in place; fileFingerprint is cheap and exact for files.
+  """
+  positions = np.unique(np.linspace(0, len(dataframe) - 1, min(sampleRows, len(dataframe))).round().astype(np.int64))
+
+  fingerprint = hashlib.sha256()
+  fingerprint.update(json.dumps([len(dataframe), [[str(column), str(dtype)] for column, dtype in dataframe.dtypes.items()]]).encode())
+  fingerprint.update(pd.util.hash_pandas_object(dataframe.iloc[positions], index=True).to_numpy().tobytes())
+
+  return fingerprint.hexdigest()
+
+def fileFingerprint(path):
+  """
+  Fingerprint of a raw input file, or of every file under a directory (e.g.
+  a Parquet dataset), from paths, sizes and modification times, without
+  reading the contents
+  """
+  path = os.path.abspath(path)
+  if os.path.isdir(path):
+    filePaths = sorted(os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names)
+  else:
+    filePaths = [path]
+
+  fingerprint = hashlib.sha256()
+  for filePath in filePaths:
+    fileStat = os.stat(filePath)
+    fingerprint.update(f'{os.path.relpath(filePath, path)}:{fileStat.st_size}:{fileStat.st_mtime_ns};'.encode())
+
+  return fingerprint.hexdigest()
+
+def codeNames(code):
+  """
+  Global (and attribute) names used by a code object and the functions,
+  lambdas and comprehensions nested in it
+  """
+  names = set(code.co_names)
+  for constant in code.co_consts:
+    if isinstance(constant, types.CodeType):
+      names |= codeNames(constant)
+
+  return names
+
+def stageCodeFingerprint(functions, codeDirectory=WRAPPER_DIRECTORY):
+  """
+  Fingerprint of the code a stage runs: the source of functions (the ones
+  the stage calls) and, followed transitively, of every function of
+  codeDirectory they reference by name or as a default argument, with the
+  values of the module constants they read (e.g. the expressions of
+  EXPLANATORY_VARIABLE_EXPRESSIONS). Editing code only some stages reach
+  leaves the other stages' keys unchanged.
+  """
+  sources = {}
+  pendingFunctions = list(functions)
+  while pendingFunctions:
+    function = pendingFunctions.pop()
+    functionName = f'{function.__module__}.{function.__qualname__}'
+    if functionName in sources:
+      continue
+    try:
+      sources[functionName] = inspect.getsource(function)
+    except (OSError, TypeError):
+      sources[functionName] = function.__qualname__
+
+    references = {name: function.__globals__[name] for name in codeNames(function.__code__) if name in function.__globals__}
+    defaults = list(function.__defaults__ or []) + list((function.__kwdefaults__ or {}).values())
+    references.update({f'{function.__qualname__}.default{i}': default for i, default in enumerate(defaults)})
+    for name, value in references.items():
+      if isinstance(value, types.FunctionType):
+        if os.path.dirname(os.path.abspath(value.__code__.co_filename)) == codeDirectory:
+          pendingFunctions.append(value)
+      elif not isinstance(value, types.ModuleType) and not callable(value):
+        sources[f'{function.__module__}.{name}'] = repr(value)
+
+  fingerprint = hashlib.sha256()
+  fingerprint.update(json.dumps(sorted(sources.items())).encode())
+
+  return fingerprint.hexdigest()
+
+def stageKey(stageName, inputKeys, parameters, functions):
+  """
+  Key of a stage: a hash of its name, the keys (or fingerprints) of its
+  inputs, its parameters (anything JSON serializable, other values by str)
+  and the code of the functions it runs (see stageCodeFingerprint), so a
+  changed input, parameter or code invalidates it and every stage
+  downstream
+  """
+  key = hashlib.sha256()
+  key.update(json.dumps([stageName, list(inputKeys), parameters, stageCodeFingerprint(functions)], sort_keys=True, default=str).encode())
+
+  return key.hexdigest()
+
+def stageCachePath(cacheDirectory, stageName, key):
+  """
+  Path of a stage's cache file
+  """
+  return os.path.join(cacheDirectory, f'{stageName}-{key}{STAGE_CACHE_SUFFIX}')
+
+def evictStageCache(cacheDirectory, maxCacheBytes):
+  """
+  Delete least recently used cache files until the cache is at most
+  maxCacheBytes (the most recently used file is always kept)
+  """
+  cacheFiles = []
+  for name in os.listdir(cacheDirectory):
+    if name.endswith(STAGE_CACHE_SUFFIX):
+      fileStat = os.stat(os.path.join(cacheDirectory, name))
+      cacheFiles.append((fileStat.st_mtime_ns, fileStat.st_size, name))
+  cacheFiles.sort()
+
+  cacheBytes = sum(size for _, size, _ in cacheFiles)
+  for _, size, name in cacheFiles[:-1]:
+    if cacheBytes <= maxCacheBytes:
+      break
+    os.remove(os.path.join(cacheDirectory, name))
+    cacheBytes -= size
+
+def runCachedStage(cacheDirectory, stageName, key, computeStage, maxCacheBytes=10*2**30):
+  """
+  Return a stage's output from the cache if its key is stored there,
+  otherwise compute it with computeStage() and store it. A cache hit marks
+  the file as most recently used; a store evicts down to maxCacheBytes.
+  """
+  cachePath = stageCachePath(cacheDirectory, stageName, key)
+  if os.path.exists(cachePath):
+    os.utime(cachePath)
+    return feather.read_feather(cachePath, memory_map=True)
+
+  stageDataFrame = computeStage()
+
+  # Write then Rename, so an interrupted run never leaves a partial file
+  os.makedirs(cacheDirectory, exist_ok=True)
+  temporaryPath = f'{cachePath}.{os.getpid()}.tmp'
+  try:
+    feather.write_feather(stageDataFrame, temporaryPath, compression='uncompressed')
+  except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+    # Columns Arrow cannot store (e.g. mixed-type objects) leave the stage uncached
+    if os.path.exists(temporaryPath):
+      os.remove(temporaryPath)
+    return stageDataFrame
+  os.replace(temporaryPath, cachePath)
+  evictStageCache(cacheDirectory, maxCacheBytes)
+
+  return stageDataFrame
+
+def createXDataFrameStageKeys(rawDataframes, rawFingerprints, stageParameters, stageFunctions):
+  """
+  Keys of the createXDataFrame stages: one prepare stage per raw dataframe
+  (keyed by its fingerprint), 'merged' (keyed by the prepare stages),
+  'explanatoryVariables' (keyed by 'merged') and 'cleaned' (keyed by
+  'explanatoryVariables').
+
+  rawFingerprints gives one fingerprint per raw dataframe (e.g. the
+  fileFingerprint of the file it was read from); by default each
+  dataframe's contents are hashed. stageParameters and stageFunctions give
+  each stage's parameters and the functions it calls (see
+  stageCodeFingerprint) by stage name.
+  """
+  if rawFingerprints is None:
+    rawFingerprints = [dataframeFingerprint(rawDataframe) for rawDataframe in rawDataframes]
+
+  stageKeys = {}
+  for stageName, rawFingerprint in zip(['CRSP_COMPUSTAT_MERGED', 'CRSP_MONTHLY', 'CRSP_DAILY', 'SP500_MONTHLY'], rawFingerprints):
+    stageKeys[stageName] = stageKey(stageName, [rawFingerprint], stageParameters[stageName], stageFunctions[stageName])
+
+  stageKeys['merged'] = stageKey('merged',
+                                 [stageKeys[stageName] for stageName in ['CRSP_COMPUSTAT_MERGED', 'CRSP_MONTHLY', 'CRSP_DAILY', 'SP500_MONTHLY']],
+                                 stageParameters['merged'],
+                                 stageFunctions['merged']
+                                 )
+  stageKeys['explanatoryVariables'] = stageKey('explanatoryVariables',
+                                               [stageKeys['merged']],
+                                               stageParameters['explanatoryVariables'],
+                                               stageFunctions['explanatoryVariables']
+                                               )
+  stageKeys['cleaned'] = stageKey('cleaned',
+                                  [stageKeys['explanatoryVariables']],
+                                  stageParameters['cleaned'],
+                                  stageFunctions['cleaned']
+                                  )
+
+  return stageKeys
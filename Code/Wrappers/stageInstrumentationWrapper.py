@@ -0,0 +1,190 @@
+"""
+Wrapper that instruments the stages of the pipeline: wall and CPU time,
+memory, input/output rows and rows dropped by each filter, reported as
+JSON, a summary table or through a callback
+10-18-2026
+"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+import numpy as np
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+
+# Instrumentations recording the stages that run (innermost last). Stages
+# and filters outside an active instrumentation are not recorded and cost
+# only this check.
+ACTIVE_INSTRUMENTATION = []
+
+# Fields of a stage record (depth: the number of enclosing stages,
+# rssBytes: the process' resident memory at the end of the stage,
+# rssDeltaBytes: its change over the stage, peakAllocatedBytes: the stage's
+# peak traced allocations, see createInstrumentation); memory fields are
+# missing when not measured
+STAGE_RECORD_FIELDS = ['stage', 'depth', 'wallSeconds', 'cpuSeconds', 'inputRows', 'outputRows', 'droppedRows', 'rssBytes', 'rssDeltaBytes', 'peakAllocatedBytes', 'filters']
+
+
+def createInstrumentation(callback=None, traceAllocations=False):
+  """
+  Create an instrumentation to pass to createXDataFrame or createYDataFrame
+  (see activateInstrumentation). Every finished stage is appended to its
+  'stages' as a record (see STAGE_RECORD_FIELDS) and passed to callback.
+
+  traceAllocations measures each stage's peak allocations with tracemalloc,
+  which slows the stages down; the resident memory is always recorded
+  (where the platform reports it, see currentRssBytes).
+  """
+  return {'stages': [], 'callback': callback, 'traceAllocations': traceAllocations, 'openStages': []}
+
+@contextmanager
+def activateInstrumentation(instrumentation):
+  """
+  Record the stages run inside the block in instrumentation (nothing if
+  None)
+  """
+  if instrumentation is None:
+    yield None
+    return
+
+  startedTracing = instrumentation['traceAllocations'] and not tracemalloc.is_tracing()
+  if startedTracing:
+    tracemalloc.start()
+  ACTIVE_INSTRUMENTATION.append(instrumentation)
+  try:
+    yield instrumentation
+  finally:
+    ACTIVE_INSTRUMENTATION.pop()
+    if startedTracing:
+      tracemalloc.stop()
+
+def currentRssBytes():
+  """
+  Current resident memory of the process, in bytes, from /proc/self/statm
+  (None where there is no /proc, e.g. on macOS or Windows)
+  """
+  try:
+    with open('/proc/self/statm') as statmFile:
+      residentPages = int(statmFile.read().split()[1])
+  except (OSError, IndexError, ValueError):
+    return None
+  return residentPages*os.sysconf('SC_PAGE_SIZE')
+
+def peakRssBytes():
+  """
+  Peak resident memory of the process since it started, in bytes (None where
+  the resource module is unavailable). Only a process-wide figure: a stage's
+  own memory is its rssDeltaBytes or peakAllocatedBytes.
+  """
+  if resource is None:
+    return None
+  # ru_maxrss is in Bytes on macOS and in Kilobytes elsewhere
+  maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return maxRss if sys.platform == 'darwin' else maxRss*1024
+
+@contextmanager
+def instrumentStage(stageName, inputRows=None):
+  """
+  Record a stage in the active instrumentation. Yields the stage's record
+  (None when no instrumentation is active), whose 'outputRows' the stage
+  sets (see recordOutputRows) and to which filters inside it are added (see
+  recordFilter). Stages may nest; an outer stage's time and memory include
+  its inner stages'.
+  """
+  if not ACTIVE_INSTRUMENTATION:
+    yield None
+    return
+
+  instrumentation = ACTIVE_INSTRUMENTATION[-1]
+  openStages = instrumentation['openStages']
+  traceAllocations = instrumentation['traceAllocations'] and tracemalloc.is_tracing()
+  record = {'stage': stageName, 'depth': len(openStages), 'inputRows': inputRows, 'outputRows': None, 'filters': {}}
+
+  # Keep the Enclosing Stage's Peak before Resetting it
+  if traceAllocations:
+    if openStages:
+      openStages[-1]['peakAllocatedBytes'] = max(openStages[-1].get('peakAllocatedBytes') or 0, tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    record['peakAllocatedBytes'] = 0
+  openStages.append(record)
+
+  rssStart = currentRssBytes()
+  wallStart = time.perf_counter()
+  cpuStart = time.process_time()
+  try:
+    yield record
+  finally:
+    record['wallSeconds'] = time.perf_counter() - wallStart
+    record['cpuSeconds'] = time.process_time() - cpuStart
+    record['rssBytes'] = currentRssBytes()
+    record['rssDeltaBytes'] = None if rssStart is None or record['rssBytes'] is None else record['rssBytes'] - rssStart
+    openStages.pop()
+    if traceAllocations:
+      record['peakAllocatedBytes'] = max(record['peakAllocatedBytes'], tracemalloc.get_traced_memory()[1])
+      if openStages:
+        openStages[-1]['peakAllocatedBytes'] = max(openStages[-1].get('peakAllocatedBytes') or 0, record['peakAllocatedBytes'])
+    else:
+      record['peakAllocatedBytes'] = None
+    record['droppedRows'] = sum(record['filters'].values())
+    record = {field: record[field] for field in STAGE_RECORD_FIELDS}
+
+    instrumentation['stages'].append(record)
+    if instrumentation['callback'] is not None:
+      instrumentation['callback'](record)
+
+def recordOutputRows(stageRecord, outputDataFrame):
+  """
+  Set a stage's output rows (nothing if the stage is not recorded)
+  """
+  if stageRecord is not None:
+    stageRecord['outputRows'] = len(outputDataFrame)
+
+def recordFilter(filterName, rowsBefore, rowsAfter):
+  """
+  Record the rows a filter dropped in the innermost open stage (nothing if
+  no stage is recorded)
+  """
+  if ACTIVE_INSTRUMENTATION and ACTIVE_INSTRUMENTATION[-1]['openStages']:
+    filters = ACTIVE_INSTRUMENTATION[-1]['openStages'][-1]['filters']
+    filters[filterName] = filters.get(filterName, 0) + int(rowsBefore - rowsAfter)
+
+def instrumentationReport(instrumentation):
+  """
+  JSON-serializable report of an instrumentation: its stage records in the
+  order they finished, the time totals of the outermost stages and the
+  process' peak resident memory so far (see peakRssBytes)
+  """
+  stages = instrumentation['stages']
+  return {'stages': stages,
+          'totalWallSeconds': sum(stage['wallSeconds'] for stage in stages if stage['depth'] == 0),
+          'totalCpuSeconds': sum(stage['cpuSeconds'] for stage in stages if stage['depth'] == 0),
+          'peakRssBytes': peakRssBytes()
+          }
+
+def writeInstrumentationReport(instrumentation, reportPath):
+  """
+  Write the report of an instrumentation (see instrumentationReport) as JSON
+  """
+  with open(reportPath, 'w') as reportFile:
+    json.dump(instrumentationReport(instrumentation), reportFile, indent=2, default=lambda value: value.item() if isinstance(value, np.generic) else str(value))
+
+  return reportPath
+
+def instrumentationSummary(instrumentation):
+  """
+  Summary table of an instrumentation: one row per stage record, with its
+  filters as 'name=dropped' pairs
+  """
+  summary = pd.DataFrame(instrumentation['stages'], columns=STAGE_RECORD_FIELDS)
+  summary['filters'] = [', '.join(f'{name}={dropped}' for name, dropped in filters.items()) for filters in summary['filters']]
+
+  return summary
@@ -0,0 +1,305 @@
+"""
+Wrapper that generates synthetic WRDS-shaped raw data (CRSP Monthly, CRSP
+Daily, CRSP/COMPUSTAT Merged, SP500 Monthly) and Bloomberg Bankruptcy
+exports at any scale, for benchmarking and regression-testing the pipeline
+without the confidential data
+10-18-2026
+"""
+
+import pandas as pd
+import numpy as np
+
+from panelKeysWrapper import monthOrdinalToPeriod
+from wrdsParquetWrapper import WRDS_EXTRACT_SCHEMAS
+
+
+# Firm Exits: annual hazards of bankruptcy (Compustat dlrsn 2) and of other
+# deletions, whose reasons are drawn from OTHER_DELETION_REASONS
+# (1 acquisition or merger, 3 liquidation, 4 reverse acquisition,
+# 9 now private, 10 other)
+SYNTHETIC_BANKRUPTCY_RATE = 0.005
+SYNTHETIC_OTHER_DELETION_RATE = 0.04
+OTHER_DELETION_REASONS = [1, 3, 4, 9, 10]
+OTHER_DELETION_REASON_WEIGHTS = [0.6, 0.1, 0.05, 0.15, 0.1]
+
+# Months before a bankruptcy over which fundamentals and returns deteriorate
+SYNTHETIC_DISTRESS_MONTHS = 18
+
+# Words Company Names are built from (two words and a suffix)
+SYNTHETIC_NAME_WORDS = ['ATLAS', 'BEACON', 'CEDAR', 'DELTA', 'EAGLE', 'FRONTIER', 'GRANITE', 'HARBOR', 'IRON', 'JUPITER',
+                        'KEYSTONE', 'LIBERTY', 'MERIDIAN', 'NORTHERN', 'OMEGA', 'PACIFIC', 'QUANTUM', 'RIVER', 'SUMMIT', 'TITAN',
+                        'UNITED', 'VANGUARD', 'WESTERN', 'XENON', 'YORK', 'ZENITH', 'AMERICAN', 'GENERAL', 'NATIONAL', 'CONTINENTAL'
+                        ]
+SYNTHETIC_NAME_SUFFIXES = ['INC', 'CORP', 'CO', 'HOLDINGS INC', 'GROUP INC', 'LTD']
+
+
+def monthEndStrings(monthOrdinals):
+  """
+  'YYYY-MM-DD' month-end dates of month ordinals, formatted once per
+  distinct month
+  """
+  months, monthIndex = np.unique(monthOrdinals, return_inverse=True)
+  dates = pd.PeriodIndex(monthOrdinalToPeriod(months)).to_timestamp(how='end').strftime('%Y-%m-%d').to_numpy(dtype=object)
+  return dates[monthIndex]
+
+def segmentCumsum(values, isSegmentStart):
+  """
+  Cumulative sums restarting at every segment start (e.g. every firm)
+  """
+  cumulativeSum = np.cumsum(values)
+  segmentOffset = np.maximum.accumulate(np.where(isSegmentStart, np.arange(len(values)), 0))
+  return cumulativeSum - cumulativeSum[segmentOffset] + values[segmentOffset]
+
+def syntheticCompanyNames(rng, nFirms):
+  """
+  Distinct-looking upper-case company names, e.g. 'GRANITE HARBOR CORP'
+  """
+  words = np.array(SYNTHETIC_NAME_WORDS, dtype=object)
+  suffixes = np.array(SYNTHETIC_NAME_SUFFIXES, dtype=object)
+  firstWords = words[rng.integers(0, len(words), nFirms)]
+  secondWords = words[rng.integers(0, len(words), nFirms)]
+  return firstWords + ' ' + secondWords + ' ' + suffixes[rng.integers(0, len(suffixes), nFirms)]
+
+def syntheticTickers(nFirms):
+  """
+  Distinct 4-letter tickers ('AAAA', 'AAAB', ...)
+  """
+  letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'), dtype=object)
+  firm = np.arange(nFirms)
+  return letters[firm//26**3 % 26] + letters[firm//26**2 % 26] + letters[firm//26 % 26] + letters[firm % 26]
+
+def generateSyntheticWrdsData(nFirms=1000,
+                              nYears=20,
+                              startYear=1980,
+                              seed=0,
+                              bankruptcyRate=SYNTHETIC_BANKRUPTCY_RATE,
+                              otherDeletionRate=SYNTHETIC_OTHER_DELETION_RATE,
+                              missingRate=0.05,
+                              crspDailyFrequency='monthly'
+                              ):
+  """
+  Generate synthetic raw WRDS extracts for nFirms firms over nYears years
+  from startYear, with the columns of WRDS_EXTRACT_SCHEMAS in their raw
+  (CSV-like) form, so createXDataFrame and createYDataFrame run on them
+  unchanged.
+
+  Firms list at the sample start or later and exit by bankruptcy or another
+  deletion (annual hazards bankruptcyRate and otherDeletionRate, see
+  OTHER_DELETION_REASONS) or survive the sample. Before a bankruptcy
+  earnings, cash and returns fall and leverage and volatility rise over
+  SYNTHETIC_DISTRESS_MONTHS months, and the delisting return is large and
+  negative. Raw data carries WRDS' quirks: letter return codes ('C' in a
+  firm's first month, some 'B'), 'Z' SIC codes, negative (bid/ask average)
+  prices, splits in CFACPR, financial firms, non-common shares and foreign
+  exchanges to be filtered, missing and skipped quarters, missing
+  datacqtr and accounting values missing at missingRate.
+
+  CRSP Daily has one row per firm-month with a precomputed SIGMA by default
+  (as the reduced extract), or with crspDailyFrequency='daily' one row per
+  business day with RET and PRC (for calculateSigma=True).
+
+  Returns [CRSP_COMPUSTAT_MERGED, CRSP_MONTHLY, CRSP_DAILY, SP500_MONTHLY],
+  the rawDataframes of createXDataFrame.
+  """
+  if crspDailyFrequency not in ['monthly', 'daily']:
+    raise ValueError(f"Unknown crspDailyFrequency '{crspDailyFrequency}', expected 'monthly' or 'daily'")
+  rng = np.random.default_rng(seed)
+  nMonths = 12*nYears
+  firstMonth = pd.Period(f'{startYear}-01', freq='M').ordinal
+
+  # Firms: Listing, Exit and Exit Reason
+  listingMonth = np.where(rng.random(nFirms) < 0.4, 0, rng.integers(0, nMonths, nFirms))
+  monthlyExitHazard = (bankruptcyRate + otherDeletionRate)/12
+  exitMonth = listingMonth + rng.geometric(monthlyExitHazard, nFirms) + 5
+  hasExit = exitMonth < nMonths
+  isBankrupt = hasExit & (rng.random(nFirms) < bankruptcyRate/(bankruptcyRate + otherDeletionRate))
+  lastMonth = np.minimum(exitMonth, nMonths - 1)
+  deletionReason = np.where(isBankrupt, 2, rng.choice(OTHER_DELETION_REASONS, nFirms, p=OTHER_DELETION_REASON_WEIGHTS)).astype(float)
+  deletionReason[~hasExit] = np.nan
+
+  PERMNO = 10001 + np.arange(nFirms)
+  GVKEY = 1001 + np.arange(nFirms)
+  companyName = syntheticCompanyNames(rng, nFirms)
+  ticker = syntheticTickers(nFirms)
+  sic = rng.choice([1311, 2834, 3571, 3711, 4911, 5311, 6021, 6211, 7372, 8062], nFirms, p=[0.08, 0.12, 0.12, 0.08, 0.08, 0.1, 0.08, 0.06, 0.18, 0.1])
+  shareCode = rng.choice([10, 11, 12, 31, 73], nFirms, p=[0.3, 0.6, 0.04, 0.03, 0.03])
+  shareClass = rng.choice(np.array([np.nan, 'A', 'B'], dtype=object), nFirms, p=[0.9, 0.07, 0.03])
+  exchangeCode = rng.choice([1, 2, 3], nFirms, p=[0.35, 0.15, 0.5])
+  compustatExchange = rng.choice([11, 12, 14, 19, 0, 7], nFirms, p=[0.4, 0.1, 0.4, 0.04, 0.03, 0.03])
+  firmVolatility = rng.lognormal(np.log(0.35), 0.4, nFirms)
+  firmBeta = rng.normal(1, 0.3, nFirms)
+
+  # Firm-Months
+  firmMonths = lastMonth - listingMonth + 1
+  firm = np.repeat(np.arange(nFirms), firmMonths)
+  isFirmStart = np.concatenate([[True], firm[1:] != firm[:-1]])
+  month = listingMonth[firm] + segmentCumsum(np.ones(len(firm), dtype=np.int64), isFirmStart) - 1
+  monthsToExit = lastMonth[firm] - month
+  distress = np.where(isBankrupt[firm], np.exp(-monthsToExit/SYNTHETIC_DISTRESS_MONTHS), 0.0)
+
+  # Market
+  marketReturn = rng.normal(0.008, 0.045, nMonths)
+  marketValue = 5e9*np.exp(np.cumsum(np.log1p(marketReturn)))
+
+  # Returns, Prices, Splits and Shares
+  monthlyVolatility = firmVolatility[firm]*(1 + 1.5*distress)/np.sqrt(12)
+  returns = np.maximum(0.002 + firmBeta[firm]*(marketReturn[month] - 0.008) + monthlyVolatility*rng.standard_normal(len(firm)) - 0.08*distress, -0.95)
+  returns[isFirmStart] = 0
+  value = rng.lognormal(np.log(25), 0.8, nFirms)[firm]*np.exp(segmentCumsum(np.log1p(returns), isFirmStart))
+  splits = segmentCumsum((rng.random(len(firm)) < 0.003).astype(np.int64), isFirmStart)
+  CFACPR = 2.0**splits
+  price = value/CFACPR
+  SHROUT = np.round(rng.lognormal(np.log(20000), 1.2, nFirms)[firm]*CFACPR*(1 + 0.01*np.floor(month/12)))
+
+  RET = np.char.mod('%.6f', returns).astype(object)
+  RET[isFirmStart] = 'C'
+  RET[rng.random(len(firm)) < 0.002] = 'B'
+  isLastMonth = np.append(isFirmStart[1:], True)
+  DLRET = np.full(len(firm), np.nan)
+  isDelisting = isLastMonth & hasExit[firm]
+  DLRET[isDelisting] = np.where(isBankrupt[firm[isDelisting]], np.maximum(rng.normal(-0.5, 0.3, isDelisting.sum()), -1), rng.normal(0.15, 0.1, isDelisting.sum()))
+  SICCD = sic[firm].astype(str).astype(object)
+  SICCD[rng.random(len(firm)) < 0.005] = 'Z'
+  spread = price*rng.uniform(0.001, 0.02, len(firm))
+  isBidAskAverage = rng.random(len(firm)) < 0.03
+
+  CRSP_MONTHLY = pd.DataFrame({'PERMNO': PERMNO[firm],
+                               'date': monthEndStrings(firstMonth + month),
+                               'SHRCD': shareCode[firm],
+                               'EXCHCD': exchangeCode[firm],
+                               'SICCD': SICCD,
+                               'NCUSIP': np.char.mod('%08d', 10000000 + firm).astype(object),
+                               'TICKER': ticker[firm],
+                               'COMNAM': companyName[firm],
+                               'SHRCLS': shareClass[firm],
+                               'CUSIP': np.char.mod('%08d', 10000000 + firm).astype(object),
+                               'DLPDT': np.where(isDelisting, monthEndStrings(firstMonth + month), None),
+                               'DLRET': DLRET,
+                               'PRC': np.round(np.where(isBidAskAverage, -price, price), 4),
+                               'RET': RET,
+                               'BID': np.round(price - spread, 4),
+                               'ASK': np.round(price + spread, 4),
+                               'SHROUT': SHROUT,
+                               'CFACPR': CFACPR
+                               })
+
+  # CRSP Daily
+  sigma = firmVolatility[firm]*(1 + 1.5*distress)*rng.lognormal(0, 0.15, len(firm))
+  if crspDailyFrequency == 'monthly':
+    CRSP_DAILY = pd.DataFrame({'PERMNO': PERMNO[firm], 'date': CRSP_MONTHLY['date'].to_numpy(), 'SIGMA': sigma})
+  else:
+    businessDays = pd.bdate_range(f'{startYear}-01-01', f'{startYear + nYears - 1}-12-31')
+    dayMonth = (businessDays.year - startYear)*12 + businessDays.month - 1
+    dayCounts = np.bincount(dayMonth, minlength=nMonths)
+    monthFirstDay = np.concatenate([[0], np.cumsum(dayCounts)[:-1]])
+    dailyRow = np.repeat(np.arange(len(firm)), dayCounts[month])
+    isRowStart = np.concatenate([[True], dailyRow[1:] != dailyRow[:-1]])
+    day = monthFirstDay[month[dailyRow]] + segmentCumsum(np.ones(len(dailyRow), dtype=np.int64), isRowStart) - 1
+    dailyReturns = sigma[dailyRow]/np.sqrt(252)*rng.standard_normal(len(dailyRow))
+    dayStrings = businessDays.strftime('%Y-%m-%d').to_numpy(dtype=object)
+    CRSP_DAILY = pd.DataFrame({'PERMNO': PERMNO[firm[dailyRow]],
+                               'date': dayStrings[day],
+                               'RET': np.round(dailyReturns, 6),
+                               'PRC': np.round(price[dailyRow]*np.exp(segmentCumsum(dailyReturns, isRowStart)), 4)
+                               })
+
+  # CRSP/COMPUSTAT Merged: one Row per Firm-Quarter
+  isQuarterEnd = (firstMonth + month) % 3 == 2
+  quarterRow = np.flatnonzero(isQuarterEnd & (rng.random(len(firm)) >= 0.03))
+  quarterFirm = firm[quarterRow]
+  quarterDistress = distress[quarterRow]
+  quarterNoise = rng.standard_normal((len(quarterRow), 4))
+  atq = value[quarterRow]*SHROUT[quarterRow]/CFACPR[quarterRow]/1000*rng.lognormal(0, 0.3, nFirms)[quarterFirm]
+  ltq = atq*np.clip(0.45 + 0.35*quarterDistress + 0.05*quarterNoise[:, 0], 0.05, 1.5)
+  saleq = atq*np.clip(0.25 + 0.03*quarterNoise[:, 1], 0.01, None)
+  cogsq = saleq*0.6
+  xoprq = saleq*(0.22 + 0.1*quarterDistress)
+  accounting = {'atq': atq,
+                'ceqq': atq - ltq,
+                'cheq': atq*np.clip(0.1 - 0.07*quarterDistress + 0.02*quarterNoise[:, 2], 0.001, None),
+                'ltq': ltq,
+                'niq': atq*(0.01 - 0.06*quarterDistress + 0.015*quarterNoise[:, 3]),
+                'actq': atq*0.4,
+                'lltq': ltq*0.5,
+                'revtq': saleq,
+                'cogsq': cogsq,
+                'xoprq': xoprq,
+                'dlttq': ltq*0.4,
+                'dlcq': ltq*0.1,
+                'saleq': saleq
+                }
+  quarterOrdinal = (firstMonth + month[quarterRow]) // 3
+  datacqtr = (quarterOrdinal//4 + 1970).astype(str).astype(object) + 'Q' + (quarterOrdinal % 4 + 1).astype(str).astype(object)
+  datacqtr[rng.random(len(quarterRow)) < 0.01] = np.nan
+  deletionMonth = lastMonth + rng.integers(0, 4, nFirms)
+  deletionDate = np.where(hasExit, monthEndStrings(firstMonth + deletionMonth), None)
+  cik = np.char.mod('%010d', 800000 + np.arange(nFirms)).astype(object)
+  cik[rng.random(nFirms) < 0.1] = np.nan
+
+  CRSP_COMPUSTAT_MERGED = pd.DataFrame({'GVKEY': GVKEY[quarterFirm],
+                                        'LPERMNO': PERMNO[quarterFirm],
+                                        'datacqtr': datacqtr,
+                                        'tic': ticker[quarterFirm],
+                                        'conm': companyName[quarterFirm],
+                                        'cik': cik[quarterFirm],
+                                        'exchg': compustatExchange[quarterFirm],
+                                        'sic': sic[quarterFirm],
+                                        'dlrsn': deletionReason[quarterFirm],
+                                        'dldte': deletionDate[quarterFirm]
+                                        })
+  for column, values in accounting.items():
+    values = np.round(values, 3)
+    values[rng.random(len(values)) < missingRate] = np.nan
+    CRSP_COMPUSTAT_MERGED[column] = values
+
+  # SP500 Monthly (totval in $1000s)
+  SP500_MONTHLY = pd.DataFrame({'caldt': monthEndStrings(firstMonth + np.arange(nMonths)),
+                                'vwretd': np.round(marketReturn, 6),
+                                'totval': np.round(marketValue/1000, 1)
+                                })
+
+  # Keep the Columns of the Extract Schemas
+  rawDataframes = []
+  for extractName, rawDataframe in [('CRSP_COMPUSTAT_MERGED', CRSP_COMPUSTAT_MERGED), ('CRSP_MONTHLY', CRSP_MONTHLY), ('CRSP_DAILY', CRSP_DAILY), ('SP500_MONTHLY', SP500_MONTHLY)]:
+    rawDataframes.append(rawDataframe[[column for column in rawDataframe.columns if column in WRDS_EXTRACT_SCHEMAS[extractName]['columns']]])
+
+  return rawDataframes
+
+def generateSyntheticBloombergData(CRSP_COMPUSTAT_MERGED, privateFilingsPerPublicFiling=3, malformedRate=0.01, seed=0):
+  """
+  Generate a synthetic raw Bloomberg Bankruptcy export (the columns
+  iterateBloombergBankruptcyFile reads, see BLOOMBERG_COLUMN_NAMES) with
+  one filing per bankrupt firm (dlrsn 2) of a CRSP/COMPUSTAT Merged
+  extract, under a variant of its name, dated around its deletion date,
+  and privateFilingsPerPublicFiling filings of private companies per
+  public one. A malformedRate share of rows lose a field marker or have an
+  unreadable date.
+  """
+  rng = np.random.default_rng(seed)
+  bankruptFirms = CRSP_COMPUSTAT_MERGED.loc[CRSP_COMPUSTAT_MERGED['dlrsn'] == 2, ['tic', 'conm', 'dldte']].drop_duplicates('conm')
+  nPublic = len(bankruptFirms)
+  nPrivate = privateFilingsPerPublicFiling*nPublic
+
+  # Public Filings under Name Variants, Private Filings under new Names
+  nameVariants = np.array(['{}', '{}', '{} /DE', 'THE {}', '{}.'], dtype=object)
+  publicNames = [variant.format(name.title() if rng.random() < 0.5 else name) for variant, name in zip(nameVariants[rng.integers(0, len(nameVariants), nPublic)], bankruptFirms['conm'])]
+  companyNames = np.concatenate([np.array(publicNames, dtype=object), syntheticCompanyNames(rng, nPrivate)])
+  securityIDs = np.concatenate([bankruptFirms['tic'].to_numpy(dtype=object), np.char.mod('%07dZ', rng.integers(0, 10**7, nPrivate)).astype(object)])
+
+  effectiveDates = np.concatenate([pd.to_datetime(bankruptFirms['dldte']).to_numpy(),
+                                   pd.to_datetime(rng.choice(pd.to_datetime(bankruptFirms['dldte']).to_numpy(), nPrivate)) if nPublic else np.array([], dtype='datetime64[ns]')
+                                   ]) - rng.integers(0, 90, nPublic + nPrivate).astype('timedelta64[D]')
+  announceDates = effectiveDates - rng.integers(0, 30, nPublic + nPrivate).astype('timedelta64[D]')
+
+  bloombergBankruptcyData = pd.DataFrame({'Security ID': securityIDs + ' US Equity',
+                                          'Summary1': 'Name: ' + companyNames,
+                                          'Summary': 'Filing Type: ' + rng.choice(np.array(['Chapter 11', 'Chapter 7', 'Chapter 15'], dtype=object), nPublic + nPrivate, p=[0.8, 0.15, 0.05]),
+                                          'Announce/Declared Date': pd.DatetimeIndex(announceDates).strftime('%m/%d/%Y'),
+                                          'Effective Date': pd.DatetimeIndex(effectiveDates).strftime('%m/%d/%Y')
+                                          })
+
+  # Malformed Rows
+  for column, malformedValue in [('Summary1', 'Company Unknown'), ('Summary', 'Chapter 11'), ('Effective Date', 'N.A.')]:
+    bloombergBankruptcyData.loc[rng.random(len(bloombergBankruptcyData)) < malformedRate/3, column] = malformedValue
+
+  return bloombergBankruptcyData.sample(frac=1, random_state=seed).reset_index(drop=True)[list(bloombergBankruptcyData.columns)]
@@ -0,0 +1,260 @@
+"""
+Wrapper that converts raw WRDS extracts to typed Parquet datasets and loads
+only the columns and dates the X-Dataframe needs
+10-18-2026
+"""
+
+import os
+import shutil
+
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+# Column Types of each raw WRDS extract. Columns not listed are kept as
+# strings.
+#   'permno'   -> int32
+#   'code8'    -> int8 (nullable; non-numeric codes such as 'Z' become null)
+#   'code16'   -> int16 (nullable)
+#   'float'    -> float64 (non-numeric values such as 'C' or 'B' become null)
+#   'id'       -> string, loaded as categorical
+#   'date'     -> timestamp
+#   'quarter'  -> string ('YYYYQn'), dated by its quarter end month
+# Nullable codes are loaded back as pandas nullable integers.
+WRDS_COLUMN_TYPES = {'permno': pa.int32(),
+                     'code8': pa.int8(),
+                     'code16': pa.int16(),
+                     'float': pa.float64(),
+                     'id': pa.string(),
+                     'date': pa.timestamp('ns'),
+                     'quarter': pa.string()
+                     }
+
+WRDS_EXTRACT_SCHEMAS = {
+  'CRSP_MONTHLY': {'dateColumn': 'date',
+                   'permnoColumn': 'PERMNO',
+                   'columns': {'PERMNO': 'permno', 'date': 'date',
+                               'SICCD': 'code16', 'SHRCD': 'code8', 'EXCHCD': 'code8', 'SHRCLS': 'id',
+                               'COMNAM': 'id', 'TICKER': 'id', 'NCUSIP': 'id', 'CUSIP': 'id',
+                               'PRC': 'float', 'SHROUT': 'float', 'CFACPR': 'float', 'RET': 'float',
+                               'DLRET': 'float', 'BID': 'float', 'ASK': 'float', 'DLPDT': 'date'
+                               }
+                   },
+  'CRSP_DAILY': {'dateColumn': 'date',
+                 'permnoColumn': 'PERMNO',
+                 'columns': {'PERMNO': 'permno', 'date': 'date',
+                             'RET': 'float', 'PRC': 'float', 'SIGMA': 'float'
+                             }
+                 },
+  'CRSP_COMPUSTAT_MERGED': {'dateColumn': 'datacqtr',
+                            'permnoColumn': 'LPERMNO',
+                            'columns': {'LPERMNO': 'permno', 'datacqtr': 'quarter',
+                                        'GVKEY': 'permno', 'conm': 'id', 'cik': 'id', 'tic': 'id',
+                                        'sic': 'code16', 'exchg': 'code8', 'dlrsn': 'code8', 'dldte': 'date',
+                                        'atq': 'float', 'ceqq': 'float', 'cheq': 'float', 'ltq': 'float',
+                                        'niq': 'float', 'actq': 'float', 'lltq': 'float', 'revtq': 'float',
+                                        'cogsq': 'float', 'xoprq': 'float', 'dlttq': 'float', 'dlcq': 'float',
+                                        'saleq': 'float'
+                                        }
+                            },
+  'SP500_MONTHLY': {'dateColumn': 'caldt',
+                    'permnoColumn': None,
+                    'columns': {'caldt': 'date', 'vwretd': 'float', 'totval': 'float'}
+                    }
+}
+
+def formatWrdsExtractChunk(chunk, extractName):
+  """
+  Apply the typed schema of extractName to a chunk of a raw WRDS extract and
+  add its month ordinal ('date_month_ordinal') and 'year' partition columns
+  """
+  schema = WRDS_EXTRACT_SCHEMAS[extractName]
+  for column, columnType in schema['columns'].items():
+    if column not in chunk.columns:
+      continue
+    if columnType == 'permno':
+      chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('Int32')
+    elif columnType == 'code8':
+      chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('Int8')
+    elif columnType == 'code16':
+      chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('Int16')
+    elif columnType == 'float':
+      chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('float64')
+    elif columnType == 'date':
+      chunk[column] = pd.to_datetime(chunk[column], errors='coerce')
+
+  # Month of each record (quarter end month for quarterly extracts)
+  dateColumn = schema['dateColumn']
+  if schema['columns'][dateColumn] == 'quarter':
+    recordMonth = pd.PeriodIndex(chunk[dateColumn].str.slice(0,4) + '-' + chunk[dateColumn].str.slice(4), freq='Q').asfreq('M', how='end')
+  else:
+    recordMonth = pd.DatetimeIndex(chunk[dateColumn]).to_period('M')
+  chunk['date_month_ordinal'] = pd.Series(recordMonth.asi8, index=chunk.index).where(~recordMonth.isna()).astype('Int32')
+  chunk['year'] = pd.Series(recordMonth.year, index=chunk.index).where(~recordMonth.isna()).astype('Int16')
+
+  return chunk
+
+def wrdsExtractArrowSchema(columns, extractName):
+  """
+  Arrow schema of a formatted extract with the given columns, so that every
+  chunk is written with the same types
+  """
+  schema = WRDS_EXTRACT_SCHEMAS[extractName]
+  fields = []
+  for column in columns:
+    if column == 'date_month_ordinal':
+      fields.append(pa.field(column, pa.int32()))
+    elif column == 'year':
+      fields.append(pa.field(column, pa.int16()))
+    else:
+      fields.append(pa.field(column, WRDS_COLUMN_TYPES[schema['columns'].get(column, 'id')]))
+
+  return pa.schema(fields)
+
+def convertWrdsExtractToParquet(csvPath, parquetPath, extractName, chunksize=5000000):
+  """
+  Convert a raw WRDS CSV extract to a typed Parquet dataset partitioned by
+  year. The CSV is parsed once, chunk by chunk, so memory is bounded by
+  chunksize rather than by the size of the extract. A dataset already at
+  parquetPath (e.g. an earlier conversion) is replaced.
+  """
+  # Remove an earlier Conversion (its part files would be read alongside)
+  if os.path.exists(parquetPath):
+    shutil.rmtree(parquetPath)
+
+  # Read every column as a string; columns are typed per chunk
+  for chunkNumber, chunk in enumerate(pd.read_csv(csvPath, dtype=str, chunksize=chunksize)):
+    chunk = formatWrdsExtractChunk(chunk, extractName)
+    table = pa.Table.from_pandas(chunk, schema=wrdsExtractArrowSchema(chunk.columns, extractName), preserve_index=False)
+    table = table.replace_schema_metadata(None)
+    ds.write_dataset(table,
+                     parquetPath,
+                     format='parquet',
+                     partitioning=['year'],
+                     partitioning_flavor='hive',
+                     basename_template=f'part-{chunkNumber}-{{i}}.parquet',
+                     existing_data_behavior='overwrite_or_ignore'
+                     )
+
+def loadWrdsExtract(parquetPath, extractName, columns=None, startMonth=None, endMonth=None, permnoRange=None, permnos=None):
+  """
+  Load a WRDS extract converted by convertWrdsExtractToParquet.
+
+  Only the requested columns are read, and only rows whose month falls in
+  [startMonth, endMonth] (anything pd.Period accepts, e.g. '1990-01'); whole
+  year partitions outside the range are skipped. permnoRange=(low, high)
+  further restricts firm-level extracts to PERMNOs in [low, high], and
+  permnos to the listed PERMNOs.
+  Identifier columns are returned as categoricals.
+  """
+  schema = WRDS_EXTRACT_SCHEMAS[extractName]
+  dataset = ds.dataset(parquetPath, format='parquet', partitioning='hive')
+
+  # Filter Dates (Partition Pruning on year, Row Filtering on Month Ordinal)
+  rowFilter = None
+  if startMonth is not None:
+    startMonth = pd.Period(startMonth, freq='M')
+    rowFilter = (ds.field('year') >= startMonth.year) & (ds.field('date_month_ordinal') >= startMonth.ordinal)
+  if endMonth is not None:
+    endMonth = pd.Period(endMonth, freq='M')
+    endFilter = (ds.field('year') <= endMonth.year) & (ds.field('date_month_ordinal') <= endMonth.ordinal)
+    rowFilter = endFilter if rowFilter is None else rowFilter & endFilter
+
+  # Filter Firms
+  if permnoRange is not None and schema['permnoColumn'] is not None:
+    permnoFilter = (ds.field(schema['permnoColumn']) >= permnoRange[0]) & (ds.field(schema['permnoColumn']) <= permnoRange[1])
+    rowFilter = permnoFilter if rowFilter is None else rowFilter & permnoFilter
+  if permnos is not None and schema['permnoColumn'] is not None:
+    permnoFilter = ds.field(schema['permnoColumn']).isin(pa.array(np.asarray(permnos), type=WRDS_COLUMN_TYPES['permno']))
+    rowFilter = permnoFilter if rowFilter is None else rowFilter & permnoFilter
+
+  table = dataset.to_table(columns=columns, filter=rowFilter)
+
+  # Load Identifiers as Categoricals
+  for i, column in enumerate(table.column_names):
+    if schema['columns'].get(column) == 'id':
+      table = table.set_column(i, column, table.column(column).dictionary_encode())
+
+  # Nullable Codes as pandas Nullable Integers
+  return table.to_pandas(types_mapper={pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype()}.get)
+
+def createXDataFrameColumns(CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
+                            CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm', 'cik'],
+                            CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
+                            calculateSigma=False
+                            ):
+  """
+  Columns of each raw extract that createXDataFrame reads for the given
+  feature lists (daily returns instead of SIGMA with calculateSigma)
+  """
+  CRSP_COMPUSTAT_MERGED_columns = ['LPERMNO', 'datacqtr', 'sic', 'exchg']
+  CRSP_COMPUSTAT_MERGED_columns.extend(CRSP_COMPUSTAT_Accounting_features)
+  CRSP_COMPUSTAT_MERGED_columns.extend(CRSP_COMPUSTAT_Identifying_features)
+
+  CRSP_MONTHLY_columns = ['PERMNO', 'date', 'SICCD', 'SHRCD', 'SHRCLS', 'RET']
+  CRSP_MONTHLY_columns.extend(CRSP_MONTHLY_features)
+
+  columns = {'CRSP_COMPUSTAT_MERGED': CRSP_COMPUSTAT_MERGED_columns,
+             'CRSP_MONTHLY': CRSP_MONTHLY_columns,
+             'CRSP_DAILY': ['PERMNO', 'date', 'RET' if calculateSigma else 'SIGMA'],
+             'SP500_MONTHLY': ['caldt', 'vwretd', 'totval']
+             }
+
+  # Drop Derived Columns and Duplicates (keeping order)
+  for extractName in columns:
+    columns[extractName] = [column for column in dict.fromkeys(columns[extractName]) if column != 'date_month']
+
+  return columns
+
+def loadRawDataframes(parquetRoot,
+                      startMonth=None,
+                      endMonth=None,
+                      CRSP_COMPUSTAT_Accounting_features = ['atq', 'ceqq', 'cheq', 'ltq', 'niq'],
+                      CRSP_COMPUSTAT_Identifying_features = ['GVKEY', 'conm', 'cik'],
+                      CRSP_MONTHLY_features = ['PERMNO', 'date_month', 'PRC', 'SHROUT', 'CFACPR', 'RET'],
+                      monthsToLagAccountingVariables=2,
+                      monthsAccountingVariablesValid=3,
+                      permnoRange=None,
+                      calculateSigma=False,
+                      sigmaWindowMonths=3,
+                      permnos=None
+                      ):
+  """
+  Load the raw dataframes createXDataFrame expects (in its order) from the
+  Parquet datasets under parquetRoot, one sub-directory per extract name.
+  permnoRange=(low, high) loads a single PERMNO partition (SP500 Monthly is
+  always loaded whole), and permnos loads only the listed firms. calculateSigma loads daily returns from far enough
+  back to calculate SIGMA for the first month in range.
+
+  Quarterly data is loaded from far enough before startMonth for every
+  firm-month in range to receive its lagged accounting variables.
+  """
+  columns = createXDataFrameColumns(CRSP_COMPUSTAT_Accounting_features,
+                                    CRSP_COMPUSTAT_Identifying_features,
+                                    CRSP_MONTHLY_features,
+                                    calculateSigma
+                                    )
+
+  compustatStartMonth = None
+  if startMonth is not None:
+    compustatStartMonth = pd.Period(startMonth, freq='M') - (monthsToLagAccountingVariables + monthsAccountingVariablesValid)
+
+  rawDataframes = []
+  for extractName in ['CRSP_COMPUSTAT_MERGED', 'CRSP_MONTHLY', 'CRSP_DAILY', 'SP500_MONTHLY']:
+    extractStartMonth = startMonth
+    if extractName == 'CRSP_COMPUSTAT_MERGED':
+      extractStartMonth = compustatStartMonth
+    elif extractName == 'CRSP_DAILY' and calculateSigma and startMonth is not None:
+      extractStartMonth = pd.Period(startMonth, freq='M') - sigmaWindowMonths + 1
+    rawDataframes.append(loadWrdsExtract(os.path.join(parquetRoot, extractName),
+                                         extractName,
+                                         columns[extractName],
+                                         extractStartMonth,
+                                         endMonth,
+                                         permnoRange,
+                                         permnos
+                                         ))
+
+  return rawDataframes